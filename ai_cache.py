@@ -0,0 +1,98 @@
+"""
+Redis cache of AI answers, keyed by a hash of the request.
+
+The set-file summary, portfolio insight and reviewer prompts are rendered
+from their template and inputs (set file, summary CSV, risk table, images),
+so the chat payload itself identifies the question: the key is a SHA-256 of
+the normalized payload (model, options, messages) plus AI_CACHE_VERSION.
+Editing a prompt template changes the rendered prompt and therefore the key;
+bump AI_CACHE_VERSION to drop every cached answer at once. Normalization
+makes line endings and trailing whitespace irrelevant, so the same file
+uploaded from Windows or exported again hits the same entry.
+
+Keys (prefix AI_CACHE_PREFIX):
+  {prefix}:val:{hash}   answer text, expires after AI_CACHE_TTL_SECONDS
+  {prefix}:index        sorted set hash -> last use time, for eviction
+
+At most AI_CACHE_MAX_ENTRIES answers are kept; the least recently used are
+evicted on store. Only successful answers are cached. Like query_cache, the
+cache is best effort: Redis errors count as a miss.
+
+ai_queue.submit() answers cached requests at once; the AI worker checks the
+cache before calling OpenRouter and stores what it gets back.
+"""
+import json
+import time
+import hashlib
+import logging
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+import config
+
+
+def get_redis():
+    """Client that fails fast, so a missing Redis costs a miss rather than a wait."""
+    return redis.Redis(
+        host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True,
+        socket_connect_timeout=1, socket_timeout=2, retry=Retry(NoBackoff(), 0),
+    )
+
+
+def _key(*parts):
+    return ":".join((config.AI_CACHE_PREFIX,) + parts)
+
+
+def normalize(value):
+    """`value` with line endings unified and trailing whitespace removed from every string."""
+    if isinstance(value, str):
+        lines = value.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        return "\n".join(line.rstrip() for line in lines).strip()
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    return value
+
+
+def cache_key(payload):
+    """Hash of a chat payload (see openrouter.chat_payload)."""
+    canonical = json.dumps(
+        {"version": config.AI_CACHE_VERSION, "payload": normalize(payload)},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def lookup(key, r):
+    """Cached answer for `key`, or None."""
+    try:
+        content = r.get(_key("val", key))
+        if content is not None:
+            r.zadd(_key("index"), {key: time.time()})
+        return content
+    except redis.RedisError as e:
+        logging.warning(f"[ai_cache] Lookup failed: {e}")
+        return None
+
+
+def store(key, content, r):
+    """Cache `content` under `key` and evict the least recently used answers over the limit."""
+    now = time.time()
+    index = _key("index")
+    try:
+        pipe = r.pipeline()
+        pipe.set(_key("val", key), content, ex=config.AI_CACHE_TTL_SECONDS)
+        pipe.zadd(index, {key: now})
+        # Index entries whose answer has expired anyway.
+        pipe.zremrangebyscore(index, "-inf", now - config.AI_CACHE_TTL_SECONDS)
+        pipe.zcard(index)
+        size = pipe.execute()[-1]
+        excess = size - config.AI_CACHE_MAX_ENTRIES
+        if excess > 0:
+            evicted = [k for k, _ in r.zpopmin(index, excess)]
+            r.delete(*[_key("val", k) for k in evicted])
+    except redis.RedisError as e:
+        logging.warning(f"[ai_cache] Store failed: {e}")
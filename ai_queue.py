@@ -0,0 +1,112 @@
+"""
+Redis queue of AI requests, shared by the Streamlit pages and the AI worker.
+
+Pages submit() a request and keep only the job id; the AI worker
+(ai_worker/main.py) sends it to OpenRouter and stores the answer, and the page
+polls get_job() (e.g. from an st.fragment) until it is done. No page thread
+waits on OpenRouter.
+
+Keys:
+  AI_QUEUE                          list of job ids waiting for a worker
+  AI_PROCESSING_QUEUE:{worker_id}   job ids a worker has taken (requeued if it restarts)
+  {AI_JOB_PREFIX}{job_id}           hash: kind, status, payload, api_key, meta,
+                                    result, error, attempts, cached, created_at, updated_at
+
+Statuses: queued -> running -> done | failed. The api_key field is deleted when
+the job finishes, and finished jobs expire after AI_JOB_TTL_SECONDS.
+
+Requests already answered before (ai_cache.py) are not sent again: submit()
+creates the job as done with the cached answer (cached=1), except for the
+kinds in STORED_KINDS, whose answer the worker also writes to the database;
+those go through the worker, which finds the answer in the cache.
+
+Kinds:
+  set_file_summary   meta {"metric_id"}; the answer is also stored as the
+                     strategy's set_file_summary artifact
+  portfolio_insight  portfolio risk advice
+  portfolio_review   portfolio reviewer apps (JSON answer)
+"""
+import os
+import json
+import time
+import uuid
+
+import redis
+
+import config
+import ai_cache
+from openrouter import chat_payload
+
+KIND_SET_FILE_SUMMARY = "set_file_summary"
+KIND_PORTFOLIO_INSIGHT = "portfolio_insight"
+KIND_PORTFOLIO_REVIEW = "portfolio_review"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+FINISHED = (STATUS_DONE, STATUS_FAILED)
+
+# Kinds with a side effect in the worker (see ai_worker.main.RESULT_HANDLERS).
+STORED_KINDS = (KIND_SET_FILE_SUMMARY,)
+
+
+def get_redis():
+    return redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+
+
+def job_key(job_id):
+    return f"{config.AI_JOB_PREFIX}{job_id}"
+
+
+def processing_queue(worker_id):
+    return f"{config.AI_PROCESSING_QUEUE}:{worker_id}"
+
+
+def submit(kind, payload, api_key, meta=None, r=None):
+    """Queue one chat-completion payload (see openrouter.chat_payload); returns the job id."""
+    r = r or get_redis()
+    job_id = uuid.uuid4().hex
+    now = f"{time.time():.3f}"
+    job = {
+        "kind": kind,
+        "status": STATUS_QUEUED,
+        "meta": json.dumps(meta or {}),
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    cached = None if kind in STORED_KINDS else ai_cache.lookup(ai_cache.cache_key(payload), r)
+    pipe = r.pipeline()
+    if cached is not None:
+        pipe.hset(job_key(job_id), mapping={**job, "status": STATUS_DONE, "result": cached, "cached": 1})
+        pipe.expire(job_key(job_id), config.AI_JOB_TTL_SECONDS)
+    else:
+        pipe.hset(job_key(job_id), mapping={**job, "payload": json.dumps(payload), "api_key": api_key})
+        # Unfinished jobs still expire eventually (e.g. if no worker is running).
+        pipe.expire(job_key(job_id), config.AI_JOB_TTL_SECONDS * 4)
+        pipe.lpush(config.AI_QUEUE, job_id)
+    pipe.execute()
+    return job_id
+
+
+def set_file_summary_payload(set_file_blob, summary_metrics_blob):
+    """Chat payload asking for a set-file summary (streamlit/explain_set.md filled with the two artifacts)."""
+    with open(os.path.join(config.PROJECT_ROOT, "streamlit", "explain_set.md"), "r") as f:
+        prompt_template = f.read()
+    set_file_str = set_file_blob.decode() if isinstance(set_file_blob, bytes) else set_file_blob
+    summary_csv_str = summary_metrics_blob.decode() if isinstance(summary_metrics_blob, bytes) else summary_metrics_blob
+    prompt = prompt_template.replace("Here is the .set file:", f"Here is the .set file:\n\n{set_file_str}\n\n")
+    prompt = prompt.replace("And here is the backtest summary (.csv):", f"And here is the backtest summary (.csv):\n\n{summary_csv_str}\n\n")
+    return chat_payload(prompt)
+
+
+def get_job(job_id, r=None):
+    """{status, result, error, meta, ...} of a job (without the API key), or None if unknown/expired."""
+    data = (r or get_redis()).hgetall(job_key(job_id))
+    if not data:
+        return None
+    data.pop("api_key", None)
+    data.pop("payload", None)
+    data["meta"] = json.loads(data.get("meta") or "{}")
+    return data
@@ -0,0 +1,185 @@
+"""
+Batch generation of AI set-file summaries for the top-ranked strategies.
+
+Finds the top-N strategies per symbol (the dashboard ranking, see
+db/strategy_query.py) that have an output_set and a summary_metrics_csv
+artifact but no set_file_summary yet, and asks OpenRouter for all of them
+concurrently. Requests use the AI worker's client (AIWorker.cached_call): at
+most --concurrency in flight on the API key, retries with backoff on 429 and
+5xx, and answers cached by request hash, so a summary already generated
+interactively for the same inputs costs nothing. Summaries are written in
+bulk, --batch per transaction; strategies that got a summary in the meantime
+are skipped, and so are strategies whose input artifacts are gone by the time
+they are loaded (counted, not fatal).
+
+    python -m ai_worker.batch_summaries --top 3 --user philip
+    python -m ai_worker.batch_summaries --top 1 --dry-run
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+
+from sqlalchemy import insert, select, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import openrouter
+from ai_queue import set_file_summary_payload
+from ai_worker.main import AIWorker
+from db.connection import get_engine, get_read_engine
+from db.db_models import ControllerArtifact
+from db.strategy_query import RANKED_SQL
+from query_cache import invalidate, TAG_ARTIFACTS
+
+SUMMARY_TYPE = "set_file_summary"
+INPUT_TYPES = ("output_set", "summary_metrics_csv")
+_BATCH = 20
+_SKIPPED = object()  # summarize(): inputs missing
+
+logger = logging.getLogger("batch_summaries")
+
+
+def find_missing_summaries(conn, top_n):
+    """[(metric_id, symbol, set_file_name)] of top-`top_n` strategies per symbol that need a summary."""
+    sql = text(f"""
+        SELECT metric_id, symbol, set_file_name FROM ({RANKED_SQL}) AS rank_metrics
+        WHERE rn <= :top_n
+          AND NOT EXISTS (
+            SELECT 1 FROM controller_artifacts a
+            WHERE a.link_type = 'test_metrics' AND a.link_id = rank_metrics.metric_id
+              AND a.artifact_type = :summary_type)
+          AND (SELECT COUNT(DISTINCT a.artifact_type) FROM controller_artifacts a
+               WHERE a.link_type = 'test_metrics' AND a.link_id = rank_metrics.metric_id
+                 AND a.artifact_type IN ('output_set', 'summary_metrics_csv')) = 2
+        ORDER BY symbol, rn
+    """)
+    return [tuple(row) for row in conn.execute(sql, {"top_n": int(top_n), "summary_type": SUMMARY_TYPE})]
+
+
+def load_inputs(conn, metric_ids):
+    """{metric_id: {artifact_type: blob}} of the summary inputs, in one query (latest artifact wins)."""
+    rows = conn.execute(
+        select(ControllerArtifact.link_id, ControllerArtifact.artifact_type, ControllerArtifact.file_blob)
+        .where(ControllerArtifact.link_type == "test_metrics", ControllerArtifact.link_id.in_(metric_ids))
+        .where(ControllerArtifact.artifact_type.in_(INPUT_TYPES))
+        .order_by(ControllerArtifact.id)
+    ).all()
+    inputs = {}
+    for link_id, artifact_type, blob in rows:
+        inputs.setdefault(int(link_id), {})[artifact_type] = blob
+    return inputs
+
+
+def store_summaries(conn, summaries):
+    """Insert {metric_id: markdown} as set_file_summary artifacts; skips ids that already have one."""
+    if not summaries:
+        return 0
+    existing = set(conn.execute(
+        select(ControllerArtifact.link_id)
+        .where(ControllerArtifact.link_type == "test_metrics", ControllerArtifact.artifact_type == SUMMARY_TYPE)
+        .where(ControllerArtifact.link_id.in_(list(summaries)))
+    ).scalars())
+    rows = [
+        {
+            "artifact_type": SUMMARY_TYPE,
+            "file_name": f"set_file_summary_{metric_id}.md",
+            "file_blob": summary_md.encode("utf-8"),
+            "link_type": "test_metrics",
+            "link_id": metric_id,
+        }
+        for metric_id, summary_md in summaries.items() if metric_id not in existing
+    ]
+    if rows:
+        conn.execute(insert(ControllerArtifact.__table__), rows)
+    return len(rows)
+
+
+async def summarize(metric_ids, inputs, api_key, worker, engine, batch=_BATCH):
+    """Generate and store the summaries; returns (stored, failed, skipped for missing inputs)."""
+    async def one(metric_id):
+        blobs = inputs.get(metric_id, {})
+        missing = [t for t in INPUT_TYPES if blobs.get(t) is None]
+        if missing:
+            logger.warning(f"Strategy {metric_id} has no {', '.join(missing)} artifact; skipped")
+            return metric_id, _SKIPPED
+        payload = set_file_summary_payload(blobs["output_set"], blobs["summary_metrics_csv"])
+        try:
+            return metric_id, await worker.cached_call(payload, api_key)
+        except openrouter.OpenRouterError as e:
+            logger.error(f"Summary for strategy {metric_id} failed: {e}")
+            return metric_id, None
+
+    stored, failed, skipped, pending = 0, 0, 0, {}
+
+    def flush():
+        nonlocal stored
+        with engine.begin() as conn:
+            stored += store_summaries(conn, pending)
+        pending.clear()
+
+    for next_done in asyncio.as_completed([one(m) for m in metric_ids]):
+        metric_id, content = await next_done
+        if content is _SKIPPED:
+            skipped += 1
+            continue
+        if content is None:
+            failed += 1
+            continue
+        pending[metric_id] = content
+        if len(pending) >= batch:
+            await asyncio.to_thread(flush)
+    if pending:
+        await asyncio.to_thread(flush)
+    if stored:
+        invalidate(TAG_ARTIFACTS)
+    return stored, failed, skipped
+
+
+def _api_key(args):
+    if args.api_key:
+        return args.api_key
+    if args.user:
+        from db_utils import session_scope, get_open_router_api_key
+        with session_scope(read_only=True) as session:
+            return get_open_router_api_key(session, args.user)
+    return os.getenv("OPENROUTER_API_KEY")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate missing AI set-file summaries for top-ranked strategies")
+    parser.add_argument('--top', type=int, default=3, help='Strategies per symbol, by dashboard rank')
+    parser.add_argument('--concurrency', type=int, default=config.AI_PER_KEY_CONCURRENCY,
+                        help='OpenRouter requests in flight')
+    parser.add_argument('--batch', type=int, default=_BATCH, help='Summaries per transaction')
+    parser.add_argument('--user', help='Use this user\'s OpenRouter API key')
+    parser.add_argument('--api-key', help='OpenRouter API key (default: --user\'s key, then OPENROUTER_API_KEY)')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the strategies that need a summary')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with get_read_engine().connect() as conn:
+        missing = find_missing_summaries(conn, args.top)
+    print(f"{len(missing)} strategies need a set-file summary.")
+    if args.dry_run:
+        for metric_id, symbol, set_file_name in missing:
+            print(f"  {symbol:<10} {metric_id:>8}  {set_file_name}")
+        return
+    if not missing:
+        return
+    api_key = _api_key(args)
+    if not api_key:
+        parser.error("No OpenRouter API key: pass --api-key or --user, or set OPENROUTER_API_KEY")
+
+    metric_ids = [m[0] for m in missing]
+    with get_read_engine().connect() as conn:
+        inputs = load_inputs(conn, metric_ids)
+    worker = AIWorker(r=None, worker_id="batch", http=openrouter.http_session(args.concurrency),
+                      per_key=args.concurrency)
+    stored, failed, skipped = asyncio.run(summarize(metric_ids, inputs, api_key, worker, get_engine(), args.batch))
+    print(f"Stored {stored} summaries, {failed} failed, {skipped} skipped for missing inputs.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+AI worker: sends the requests queued by ai_queue.submit() to OpenRouter.
+
+One asyncio process handles up to AI_WORKER_CONCURRENCY requests at once and
+at most AI_PER_KEY_CONCURRENCY per user API key, so one user's burst cannot
+take every slot or run into their own rate limit. HTTP calls share one
+keep-alive connection pool (openrouter.http_session) and run in the worker's
+own thread pool, one thread per slot (the event loop's default executor is
+capped at min(32, cpu_count + 4)); cache and database calls have a small pool
+of their own so they never wait behind HTTP.
+retryable failures (timeouts, 429, 5xx) are retried up to AI_MAX_RETRIES
+times with exponential backoff and jitter, honouring Retry-After.
+
+Answers are cached by request hash (ai_cache.py): a request answered before
+is not sent again, and every new answer is stored.
+
+Jobs are taken with BLMOVE into this worker's processing list and removed
+from it once finished; on start the worker requeues whatever its previous run
+left there, resetting jobs it had marked running back to queued. If Redis
+drops, the worker backs off and keeps taking jobs once it is back.
+
+    python -m ai_worker.main
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+import redis.asyncio as aioredis
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import ai_queue
+import ai_cache
+import openrouter
+from ai_queue import job_key, KIND_SET_FILE_SUMMARY, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("ai_worker")
+
+_IO_THREADS = 4                       # ai_cache lookups/stores and result handlers
+_QUEUE_RETRY_SECONDS = 1.0            # first wait after a Redis error taking a job, doubled up to
+_QUEUE_RETRY_MAX_SECONDS = 30.0
+
+
+def _store_set_file_summary(meta, content):
+    from db_utils import session_scope, store_set_file_summary
+    with session_scope() as session:
+        store_set_file_summary(session, int(meta["metric_id"]), content)
+
+
+# kind -> fn(meta, content), run in a thread after a successful answer
+RESULT_HANDLERS = {
+    KIND_SET_FILE_SUMMARY: _store_set_file_summary,
+}
+
+
+class AIWorker:
+    def __init__(self, r, worker_id=None, http=None, concurrency=None, per_key=None, cache_r=None):
+        self.r = r
+        self.cache_r = cache_r or ai_cache.get_redis()  # sync client, used from threads
+        self.worker_id = worker_id or config.AI_WORKER_ID
+        self.processing = ai_queue.processing_queue(self.worker_id)
+        self.http = http or openrouter.http_session()
+        concurrency = concurrency or config.AI_WORKER_CONCURRENCY
+        per_key = per_key or config.AI_PER_KEY_CONCURRENCY
+        self.slots = asyncio.Semaphore(concurrency)
+        self.key_slots = defaultdict(lambda: asyncio.Semaphore(per_key))
+        self.http_pool = ThreadPoolExecutor(max(concurrency, per_key), thread_name_prefix="ai-http")
+        self.io_pool = ThreadPoolExecutor(_IO_THREADS, thread_name_prefix="ai-io")
+        self.running = set()
+        self.stopping = asyncio.Event()
+
+    async def _in_pool(self, pool, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+    def close(self):
+        self.http_pool.shutdown(wait=False)
+        self.io_pool.shutdown(wait=False)
+
+    async def call(self, payload, api_key, on_retry=None):
+        """Content of one completion, with the per-key limit and retries; raises OpenRouterError."""
+        async with self.key_slots[api_key]:
+            for attempt in range(config.AI_MAX_RETRIES + 1):
+                try:
+                    return await self._in_pool(self.http_pool, openrouter.complete, payload, api_key, self.http)
+                except openrouter.OpenRouterError as e:
+                    if not e.retryable or attempt == config.AI_MAX_RETRIES:
+                        raise
+                    delay = openrouter.backoff_seconds(attempt, e)
+                    logger.warning(f"Retrying in {delay:.1f}s after: {e}")
+                    if on_retry:
+                        await on_retry(attempt + 1)
+                    await asyncio.sleep(delay)
+
+    async def cached_call(self, payload, api_key, on_retry=None):
+        """Like call(), but answered from ai_cache when the same request was answered before."""
+        key = ai_cache.cache_key(payload)
+        content = await self._in_pool(self.io_pool, ai_cache.lookup, key, self.cache_r)
+        if content is None:
+            content = await self.call(payload, api_key, on_retry)
+            await self._in_pool(self.io_pool, ai_cache.store, key, content, self.cache_r)
+        return content
+
+    async def _update(self, job_id, **fields):
+        await self.r.hset(job_key(job_id), mapping={**fields, "updated_at": f"{time.time():.3f}"})
+
+    async def process(self, job_id):
+        key = job_key(job_id)
+        try:
+            job = await self.r.hgetall(key)
+            if not job or job.get("status") != ai_queue.STATUS_QUEUED:
+                return  # expired, or already handled before a restart
+            await self._update(job_id, status=STATUS_RUNNING, attempts=1)
+            meta = json.loads(job.get("meta") or "{}")
+            try:
+                payload = json.loads(job["payload"])
+                content = await self.cached_call(
+                    payload, job["api_key"],
+                    on_retry=lambda n: self._update(job_id, attempts=n + 1),
+                )
+                handler = RESULT_HANDLERS.get(job.get("kind"))
+                if handler:
+                    await self._in_pool(self.io_pool, handler, meta, content)
+                await self._update(job_id, status=STATUS_DONE, result=content)
+            except Exception as e:
+                logger.error(f"AI job {job_id} ({job.get('kind')}) failed: {e}")
+                await self._update(job_id, status=STATUS_FAILED, error=str(e))
+            await self.r.hdel(key, "api_key")
+            await self.r.expire(key, config.AI_JOB_TTL_SECONDS)
+        finally:
+            await self.r.lrem(self.processing, 1, job_id)
+
+    async def requeue_unfinished(self):
+        """Put back the jobs a previous run of this worker took but did not finish."""
+        moved = 0
+        while (job_id := await self.r.lindex(self.processing, -1)) is not None:
+            # The previous run marked it running; process() only takes queued jobs.
+            if await self.r.hget(job_key(job_id), "status") == STATUS_RUNNING:
+                await self._update(job_id, status=ai_queue.STATUS_QUEUED)
+            await self.r.lmove(self.processing, config.AI_QUEUE, "RIGHT", "RIGHT")
+            moved += 1
+        if moved:
+            logger.info(f"Requeued {moved} unfinished AI jobs")
+
+    async def run(self):
+        await self.requeue_unfinished()
+        logger.info(f"AI worker {self.worker_id} started (concurrency {self.slots._value})")
+        retry_in = _QUEUE_RETRY_SECONDS
+        while not self.stopping.is_set():
+            await self.slots.acquire()
+            try:
+                job_id = await self.r.blmove(config.AI_QUEUE, self.processing, 5, "RIGHT", "LEFT")
+            except redis.RedisError as e:
+                self.slots.release()
+                logger.error(f"Taking a job from {config.AI_QUEUE} failed: {e}; retrying in {retry_in:.0f}s")
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), retry_in)
+                except asyncio.TimeoutError:
+                    pass
+                retry_in = min(retry_in * 2, _QUEUE_RETRY_MAX_SECONDS)
+                continue
+            retry_in = _QUEUE_RETRY_SECONDS
+            if job_id is None:
+                self.slots.release()
+                continue
+            task = asyncio.create_task(self.process(job_id))
+            self.running.add(task)
+            task.add_done_callback(self._finished)
+        if self.running:
+            await asyncio.gather(*self.running, return_exceptions=True)
+
+    def _finished(self, task):
+        self.running.discard(task)
+        self.slots.release()
+        if not task.cancelled() and task.exception():
+            logger.error(f"AI job task crashed: {task.exception()}")
+
+
+async def main():
+    r = aioredis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+    worker = AIWorker(r)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stopping.set)
+        except NotImplementedError:  # Windows: Ctrl+C raises KeyboardInterrupt instead
+            pass
+    try:
+        await worker.run()
+    finally:
+        worker.close()
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Local stand-in for the OpenRouter chat-completions endpoint, for testing the
+AI worker without an API key or network access.
+
+    python -m ai_worker.mock_openrouter --port 8099 --delay 2 --fail-every 5
+    set OPENROUTER_URL=http://127.0.0.1:8099/api/v1/chat/completions
+
+Every request is answered after --delay seconds with a short markdown echo of
+the prompt; with --fail-every N, every Nth request gets a 429 instead (with
+Retry-After: 1) to exercise the worker's retries.
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockOpenRouter(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, fail_every=0):
+        super().__init__(address, _Handler)
+        self.delay = delay
+        self.fail_every = fail_every
+        self.requests = 0
+        self.in_flight = {}        # api key -> requests being answered now
+        self.max_in_flight = {}    # api key -> highest value seen
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        key = self.headers.get("Authorization", "")
+        with server.lock:
+            server.requests += 1
+            n = server.requests
+            server.in_flight[key] = server.in_flight.get(key, 0) + 1
+            server.max_in_flight[key] = max(server.max_in_flight.get(key, 0), server.in_flight[key])
+        try:
+            time.sleep(server.delay)
+            if server.fail_every and n % server.fail_every == 0:
+                self._send(429, {"error": {"message": "Rate limit exceeded (mock)"}}, {"Retry-After": "1"})
+                return
+            content = payload.get("messages", [{}])[-1].get("content", "")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+            answer = f"### Mock answer {n}\n\n{content[:200]}"
+            self._send(200, {
+                "id": f"mock-{n}",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            })
+        finally:
+            with server.lock:
+                server.in_flight[key] -= 1
+
+
+def serve(port=0, delay=0.0, fail_every=0, host="127.0.0.1"):
+    """Start the mock in a background thread; returns the server (port 0 picks a free port)."""
+    server = MockOpenRouter((host, port), delay=delay, fail_every=fail_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenRouter chat-completions endpoint")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--delay', type=float, default=1.0, help='Seconds before each answer')
+    parser.add_argument('--fail-every', type=int, default=0, help='Answer every Nth request with 429')
+    args = parser.parse_args()
+    server = MockOpenRouter(("127.0.0.1", args.port), delay=args.delay, fail_every=args.fail_every)
+    print(f"Mock OpenRouter listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
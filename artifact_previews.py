@@ -0,0 +1,184 @@
+"""
+Thumbnails of the equity-curve GIF artifacts, generated at sync time.
+
+For every output_gif / optimization_report_gif / input_gif artifact, one
+preview per width in ARTIFACT_THUMBNAIL_WIDTHS is stored as its own
+controller_artifacts row:
+
+    artifact_type  {source type}_thumb_{width}   e.g. output_gif_thumb_960
+    file_name      {source stem}_{width}.webp
+    task_id, link_type, link_id   copied from the source
+    meta_json      {"source_artifact_id", "width", "height", "format"}
+
+Dashboards show the thumbnail (tens of KB) and load the full GIF only on
+request. The worker calls schedule_previews(task_id) after committing a sync:
+the rendering runs in a background thread pool (Pillow releases the GIL while
+resizing and encoding), so the worker does not wait for it. Sources that
+already have their thumbnails are skipped, so re-running is harmless;
+`python artifact_previews.py` backfills artifacts synced before this existed.
+"""
+import io
+import os
+import sys
+import json
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+from sqlalchemy import insert, select
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import config
+from db.connection import get_engine
+from db.db_models import ControllerArtifact
+from query_cache import invalidate, TAG_ARTIFACTS
+
+SOURCE_TYPES = ("output_gif", "optimization_report_gif", "input_gif")
+_BATCH = 50
+
+_pool = None
+
+
+def thumbnail_type(source_type, width):
+    return f"{source_type}_thumb_{width}"
+
+
+def _format():
+    fmt = config.ARTIFACT_THUMBNAIL_FORMAT
+    if fmt == "WEBP" and not features.check("webp"):
+        return "PNG"
+    return fmt
+
+
+def make_thumbnail(blob, width, fmt=None, quality=None):
+    """(bytes, (width, height), format) of the first frame of `blob`, no wider than `width`."""
+    fmt = fmt or _format()
+    quality = quality or config.ARTIFACT_THUMBNAIL_QUALITY
+    with Image.open(io.BytesIO(blob)) as img:
+        img.seek(0)
+        frame = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    if frame.width > width:
+        frame = frame.resize((width, max(1, round(frame.height * width / frame.width))), Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        frame.save(out, "WEBP", quality=quality, method=6)
+    else:
+        frame.save(out, "PNG", optimize=True)
+    return out.getvalue(), frame.size, fmt
+
+
+def _thumbnail_name(file_name, width, fmt):
+    stem = os.path.splitext(file_name or "preview")[0]
+    return f"{stem}_{width}.{fmt.lower()}"
+
+
+def _existing(conn, task_ids):
+    """{(source artifact id, width)} of the thumbnails already stored for these tasks."""
+    thumb_types = [thumbnail_type(t, w) for t in SOURCE_TYPES for w in config.ARTIFACT_THUMBNAIL_WIDTHS]
+    rows = conn.execute(
+        select(ControllerArtifact.meta_json)
+        .where(ControllerArtifact.task_id.in_(task_ids), ControllerArtifact.artifact_type.in_(thumb_types))
+    ).scalars().all()
+    done = set()
+    for meta in rows:
+        try:
+            meta = json.loads(meta or "{}")
+            done.add((int(meta["source_artifact_id"]), int(meta["width"])))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+def generate_previews(conn, task_ids=None, after_id=0, limit=_BATCH):
+    """
+    Store the missing thumbnails of up to `limit` source artifacts (of
+    `task_ids`, or of all tasks with source id > after_id). Does not commit.
+    Returns (thumbnails added, last source id seen).
+    """
+    stmt = (
+        select(
+            ControllerArtifact.id, ControllerArtifact.task_id, ControllerArtifact.artifact_type,
+            ControllerArtifact.file_name, ControllerArtifact.link_type, ControllerArtifact.link_id,
+        )
+        .where(ControllerArtifact.artifact_type.in_(SOURCE_TYPES), ControllerArtifact.file_blob.isnot(None))
+        .where(ControllerArtifact.id > after_id)
+        .order_by(ControllerArtifact.id).limit(limit)
+    )
+    if task_ids is not None:
+        stmt = stmt.where(ControllerArtifact.task_id.in_(list(task_ids)))
+    sources = conn.execute(stmt).all()
+    if not sources:
+        return 0, None
+    done = _existing(conn, {s.task_id for s in sources})
+    added = 0
+    for src in sources:
+        widths = [w for w in config.ARTIFACT_THUMBNAIL_WIDTHS if (src.id, w) not in done]
+        if not widths:
+            continue
+        # Blobs are read one at a time, only for sources that still need work.
+        blob = conn.execute(select(ControllerArtifact.file_blob).where(ControllerArtifact.id == src.id)).scalar()
+        for width in widths:
+            try:
+                data, (w, h), fmt = make_thumbnail(blob, width)
+            except (OSError, ValueError) as e:  # not an image Pillow can read
+                logging.warning(f"[previews] Artifact {src.id} ({src.file_name}): {e}")
+                break
+            conn.execute(insert(ControllerArtifact.__table__).values(
+                task_id=src.task_id,
+                artifact_type=thumbnail_type(src.artifact_type, width),
+                file_name=_thumbnail_name(src.file_name, width, fmt),
+                file_blob=data,
+                link_type=src.link_type,
+                link_id=src.link_id,
+                meta_json=json.dumps({"source_artifact_id": src.id, "width": w, "height": h, "format": fmt.lower()}),
+            ))
+            added += 1
+    return added, sources[-1].id
+
+
+def _generate_for_task(task_id):
+    try:
+        added, after_id = 0, 0
+        while after_id is not None:
+            with get_engine().begin() as conn:
+                n, after_id = generate_previews(conn, task_ids=[task_id], after_id=after_id)
+            added += n
+        if added:
+            invalidate(TAG_ARTIFACTS)
+            logging.info(f"[previews] Stored {added} thumbnails for task {task_id}")
+    except Exception as e:
+        logging.error(f"[previews] Thumbnails for task {task_id} failed: {e}")
+
+
+def schedule_previews(task_id):
+    """Generate the task's thumbnails in the background thread pool."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=config.ARTIFACT_PREVIEW_WORKERS, thread_name_prefix="previews")
+    return _pool.submit(_generate_for_task, task_id)
+
+
+def backfill(batch=_BATCH):
+    """Thumbnails for every source artifact synced so far, one committed batch at a time."""
+    engine = get_engine()
+    after_id, total = 0, 0
+    while after_id is not None:
+        with engine.begin() as conn:
+            added, after_id = generate_previews(conn, after_id=after_id, limit=batch)
+        total += added
+    if total:
+        invalidate(TAG_ARTIFACTS)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate missing equity-curve thumbnails")
+    parser.add_argument('--batch', type=int, default=_BATCH, help='Source artifacts per transaction')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(f"Stored {backfill(args.batch)} thumbnails.")
+
+
+if __name__ == "__main__":
+    main()
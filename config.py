@@ -1,5 +1,6 @@
 import os
 import sys
+import socket
 from dotenv import load_dotenv
 import sqlalchemy
 
@@ -61,6 +62,17 @@ MYSQL_DATABASE = os.getenv('MYSQL_DATABASE')
 
 AGENT_DB_PATH = os.getenv('AGENT_DB_PATH')
 
+# Shared connection pool (see db/connection.py)
+SQLALCHEMY_REPLICA_URL = os.getenv('SQLALCHEMY_REPLICA_URL')  # optional read replica for read-only sessions
+SESSION_LEAK_THRESHOLD_SECONDS = int(os.getenv('SESSION_LEAK_THRESHOLD_SECONDS', 300))
+REPLICA_MAX_STALENESS_SECONDS = float(os.getenv('REPLICA_MAX_STALENESS_SECONDS', 60))  # default lag tolerated by read-only sessions
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 10))  # seconds between replica lag checks
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds, below MySQL wait_timeout
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
 # Redis
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
@@ -129,6 +141,20 @@ JOB_STUCK_THRESHOLD_MINUTES = int(os.getenv('JOB_STUCK_THRESHOLD_MINUTES', 60))
 WORKER_INACTIVE_THRESHOLD_MINUTES = int(os.getenv('WORKER_INACTIVE_THRESHOLD_MINUTES', 5))
 SUPERVISOR_POLL_INTERVAL = int(os.getenv('SUPERVISOR_POLL_INTERVAL', 60))
 
+# Controller monitoring rollups (db/rollups.py)
+STARVED_TASK_MINUTES = int(os.getenv('STARVED_TASK_MINUTES', 60))  # new/retrying tasks waiting longer count as starved
+ROLLUP_MINUTE_RETENTION_HOURS = int(os.getenv('ROLLUP_MINUTE_RETENTION_HOURS', 48))  # per-minute rollups and queue samples kept this long
+STATUS_COUNT_RECONCILE_MINUTES = int(os.getenv('STATUS_COUNT_RECONCILE_MINUTES', 60))  # status counts recounted from controller_tasks this often
+ROLLUP_AGGREGATE_BATCH = int(os.getenv('ROLLUP_AGGREGATE_BATCH', 5000))  # transition events folded into the rollups per statement batch
+
+# Idle auto re-optimization planner (supervisor)
+REOPTIMIZE_MAX_PER_TICK = int(os.getenv('REOPTIMIZE_MAX_PER_TICK', 10))  # upper bound on jobs re-optimized per supervisor tick
+REOPTIMIZE_MAX_PER_SYMBOL = int(os.getenv('REOPTIMIZE_MAX_PER_SYMBOL', 1))  # fairness budget per symbol per tick
+REOPTIMIZE_WORKER_WINDOW_MINUTES = int(os.getenv('REOPTIMIZE_WORKER_WINDOW_MINUTES', 60))  # workers with a heartbeat this recent count as capacity
+REOPTIMIZE_WORKER_COUNT = int(os.getenv('REOPTIMIZE_WORKER_COUNT', 0))  # fixed worker count; 0 = estimate from heartbeats
+REOPTIMIZE_COUNT_CACHE_SECONDS = int(os.getenv('REOPTIMIZE_COUNT_CACHE_SECONDS', 600))  # refresh interval of per-symbol reoptimize counts
+REOPTIMIZE_CANDIDATE_LIMIT = int(os.getenv('REOPTIMIZE_CANDIDATE_LIMIT', 500))
+
 # Email notification
 SMTP_SERVER = os.getenv('SMTP_SERVER')
 SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
@@ -150,15 +176,51 @@ LOCK_RETRY_SLEEP = float(os.getenv('LOCK_RETRY_SLEEP', 1))
 SESSION_PREFIX = os.getenv('SESSION_PREFIX', 'session:')
 SESSION_TTL = int(os.getenv('SESSION_TTL', 3600))  # Default: 1 hour
 
+# --- Redis query cache shared by the dashboards (query_cache.py) ---
+QUERY_CACHE_PREFIX = os.getenv('QUERY_CACHE_PREFIX', 'qcache')
+QUERY_CACHE_TTL_SECONDS = int(os.getenv('QUERY_CACHE_TTL_SECONDS', 60))
+QUERY_CACHE_LOCK_SECONDS = float(os.getenv('QUERY_CACHE_LOCK_SECONDS', 30))  # max recompute time before another caller takes over
+QUERY_CACHE_WAIT_SECONDS = float(os.getenv('QUERY_CACHE_WAIT_SECONDS', 10))  # max wait for another caller's recompute
+
+# --- Live controller telemetry stream (telemetry.py) ---
+TELEMETRY_STREAM = os.getenv('TELEMETRY_STREAM', 'pfai_telemetry')
+TELEMETRY_STREAM_MAXLEN = int(os.getenv('TELEMETRY_STREAM_MAXLEN', 10000))  # approximate cap on stream entries
+TELEMETRY_REFRESH_SECONDS = float(os.getenv('TELEMETRY_REFRESH_SECONDS', 2))  # dashboard live-panel poll interval
+
+# --- AI requests: OpenRouter client, Redis job queue and AI worker (openrouter.py, ai_queue.py, ai_worker/) ---
+OPENROUTER_URL = os.getenv('OPENROUTER_URL', 'https://openrouter.ai/api/v1/chat/completions')
+OPENROUTER_REFERER = os.getenv('OPENROUTER_REFERER', 'http://localhost')
+AI_QUEUE = os.getenv('AI_QUEUE', 'pfai_ai_requests')
+AI_PROCESSING_QUEUE = os.getenv('AI_PROCESSING_QUEUE', 'pfai_ai_processing')
+AI_JOB_PREFIX = os.getenv('AI_JOB_PREFIX', 'ai_job:')
+AI_JOB_TTL_SECONDS = int(os.getenv('AI_JOB_TTL_SECONDS', 3600))  # finished jobs (and their answers) kept this long
+AI_WORKER_ID = os.getenv('AI_WORKER_ID', socket.gethostname())
+AI_WORKER_CONCURRENCY = int(os.getenv('AI_WORKER_CONCURRENCY', 16))  # requests in flight per AI worker
+AI_PER_KEY_CONCURRENCY = int(os.getenv('AI_PER_KEY_CONCURRENCY', 2))  # requests in flight per user API key
+AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv('AI_REQUEST_TIMEOUT_SECONDS', 120))
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 4))
+AI_RETRY_BASE_SECONDS = float(os.getenv('AI_RETRY_BASE_SECONDS', 1))
+AI_RETRY_MAX_SECONDS = float(os.getenv('AI_RETRY_MAX_SECONDS', 30))
+AI_POLL_SECONDS = float(os.getenv('AI_POLL_SECONDS', 2))  # page refresh interval while a job is pending
+# Cache of AI answers keyed by a hash of the request (ai_cache.py)
+AI_CACHE_PREFIX = os.getenv('AI_CACHE_PREFIX', 'ai_cache')
+AI_CACHE_VERSION = os.getenv('AI_CACHE_VERSION', '1')  # bump to invalidate every cached answer
+AI_CACHE_TTL_SECONDS = int(os.getenv('AI_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 5000))  # least recently used answers evicted beyond this
+
 # Core configuration variables for pip value calculation for risk assessment
 TICKDATA_DIR = os.getenv('TICKDATA_DIR', 'C:/Users/Philip/Documents/GitHub/mt4_optimizer/TickData')
 ACCOUNT_CCY = os.getenv('ACCOUNT_CCY', 'USD')
+# Grid precomputed by portfolio_analysis/populate_pip_values.py
+PIP_VALUE_LOT_SIZES = [float(x) for x in os.getenv('PIP_VALUE_LOT_SIZES', '0.01,0.02,0.05,0.1,0.2,0.5,1.0').split(',') if x.strip()]
+PIP_VALUE_ACCOUNT_CCYS = [x.strip().upper() for x in os.getenv('PIP_VALUE_ACCOUNT_CCYS', ACCOUNT_CCY).split(',') if x.strip()]
 
-# Two-way lock files for batch-worker coordination
-LOCK_DIR = os.getenv('LOCK_DIR', os.path.join(PROJECT_ROOT, 'worker'))
-TICKDATA_LOCK_FILE = os.path.join(LOCK_DIR, os.getenv('TICKDATA_LOCK_FILE', 'tickdata.lock'))
-WORKER_PAUSED_LOCK_FILE = os.path.join(LOCK_DIR, os.getenv('WORKER_PAUSED_LOCK_FILE', 'worker_paused.lock'))
-LOCK_WAIT_TIMEOUT_SECONDS = int(os.getenv('LOCK_WAIT_TIMEOUT_SECONDS', 8 * 60 * 60))
+# Batch-worker pause/drain protocol (worker_pause.py, Redis leases)
+WORKER_PAUSE_PREFIX = os.getenv('WORKER_PAUSE_PREFIX', 'worker_pause')
+PAUSE_LEASE_TTL_SECONDS = int(os.getenv('PAUSE_LEASE_TTL_SECONDS', 600))  # lease expires if the batch dies
+WORKER_ALIVE_TTL_SECONDS = int(os.getenv('WORKER_ALIVE_TTL_SECONDS', 60))  # workers silent longer are not waited for
+PAUSE_POLL_INTERVAL = float(os.getenv('PAUSE_POLL_INTERVAL', 1.0))
+LOCK_WAIT_TIMEOUT_SECONDS = int(os.getenv('LOCK_WAIT_TIMEOUT_SECONDS', 8 * 60 * 60))  # max wait for workers to drain
 
 # CCY_PAIRS as a parsed Python list
 CCY_PAIRS = [x.strip() for x in os.getenv("CCY_PAIRS", "").split(',') if x.strip()]
@@ -172,4 +234,32 @@ EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", r'C:\Users\Philip\Documents\GitHub\Po
 # Export directory (string, from .env or fallback default)
 EXPORT_DIR = os.getenv("EXPORT_DIR", r'C:\Users\Philip\Documents\GitHub\PocketFlowProject\portfolio_analysis\exported_bars')
 
-CORRELATION_LOOKBACK_DAYS = int(os.getenv('CORRELATION_LOOKBACK_DAYS', 365))
\ No newline at end of file
+# Per-pair Tick Data Manager update/export (portfolio_analysis/batch_update_and_export.py)
+EXPORT_MAX_PARALLEL = int(os.getenv('EXPORT_MAX_PARALLEL', 4))  # concurrent Tick Data Manager processes
+EXPORT_PAIR_TIMEOUT_SECONDS = int(os.getenv('EXPORT_PAIR_TIMEOUT_SECONDS', 1800))
+
+# Columnar bar store built once from the exports (portfolio_analysis/bar_store.py)
+BAR_STORE_DIR = os.getenv("BAR_STORE_DIR", os.path.join(PROJECT_ROOT, 'portfolio_analysis', 'bar_store'))
+
+CORRELATION_LOOKBACK_DAYS = int(os.getenv('CORRELATION_LOOKBACK_DAYS', 365))
+
+# Rolling correlation engine (portfolio_analysis/rolling_correlation.py)
+CORRELATION_WINDOWS = [int(x) for x in os.getenv('CORRELATION_WINDOWS', f"30,90,{CORRELATION_LOOKBACK_DAYS}").split(',') if x.strip()]
+CORRELATION_TIMEFRAMES = [x.strip() for x in os.getenv('CORRELATION_TIMEFRAMES', 'H1').split(',') if x.strip()]
+CORRELATION_STATE_DIR = os.getenv('CORRELATION_STATE_DIR', os.path.join(BAR_STORE_DIR, 'correlation_state'))
+CORRELATION_REBUILD_EVERY = int(os.getenv('CORRELATION_REBUILD_EVERY', 200))  # updates between exact re-summations
+# Per-strategy trade arrays cached by db/trade_records.py (immutable after sync)
+TRADE_CACHE_MAX_STRATEGIES = int(os.getenv('TRADE_CACHE_MAX_STRATEGIES', 500))
+# Equity/drawdown series from trade records (db/equity_curves.py)
+EQUITY_CURVE_POINTS = int(os.getenv('EQUITY_CURVE_POINTS', 500))  # LTTB point budget per strategy
+EQUITY_CURVE_CACHE_MAX = int(os.getenv('EQUITY_CURVE_CACHE_MAX', 2000))  # downsampled curves kept per process
+
+# Strategy listing (db/strategy_query.py)
+STRATEGY_SEARCH_MODE = os.getenv('STRATEGY_SEARCH_MODE', 'contains')  # contains | prefix (indexed) | fulltext
+STRATEGY_RANKING_REFRESH_SECONDS = int(os.getenv('STRATEGY_RANKING_REFRESH_SECONDS', 300))  # supervisor checks for new test metrics and rebuilds strategy_rankings
+
+# Equity-curve GIF previews generated at sync time (artifact_previews.py)
+ARTIFACT_THUMBNAIL_WIDTHS = [int(x) for x in os.getenv('ARTIFACT_THUMBNAIL_WIDTHS', '480,960').split(',') if x.strip()]
+ARTIFACT_THUMBNAIL_FORMAT = os.getenv('ARTIFACT_THUMBNAIL_FORMAT', 'WEBP').upper()  # WEBP | PNG (PNG if Pillow lacks WebP)
+ARTIFACT_THUMBNAIL_QUALITY = int(os.getenv('ARTIFACT_THUMBNAIL_QUALITY', 80))
+ARTIFACT_PREVIEW_WORKERS = int(os.getenv('ARTIFACT_PREVIEW_WORKERS', 2))
@@ -14,6 +14,11 @@ from dotenv import load_dotenv
 from sqlalchemy import or_, and_
 from db_utils import get_db, update_job_status, job_has_success
 from db.db_models import ControllerTask
+from db.task_state import transition_task
+from db.connection import get_engine
+from db.rollups import ensure_rollup_tables
+from db.job_summary import ensure_job_summaries
+from db.strategy_query import ensure_strategy_rankings
 from db.status_constants import (
     STATUS_NEW, STATUS_QUEUED, STATUS_WORKER_COMPLETED, STATUS_WORKER_FAILED,
     STATUS_RETRYING, STATUS_FINE_TUNING, STATUS_COMPLETED_SUCCESS,
@@ -27,6 +32,7 @@ load_dotenv(os.path.join(PROJECT_ROOT, '.env'), override=False)
 load_dotenv(os.path.join(WORKER_DIR, '.env.controller'), override=True)
 
 from notify import send_email, send_telegram
+from telemetry import publish_queue_depth
 from controller.controller_utils import (
     get_task_metric_scores,
     spawn_fine_tune_task,
@@ -87,6 +93,9 @@ stop_flag = False
 #          |                                 |
 #          |                    (same path as new task: queued, worker, etc.)
 #          +-----------------------------+---+-----------------------------------+
+#
+# The legal edges of this diagram are TASK_TRANSITIONS in db/status_constants.py;
+# every status change goes through db.task_state.transition_task().
 
 # --- Signal Handling for Graceful Shutdown ---
 def handle_stop_signal(sig, frame):
@@ -142,44 +151,52 @@ def mark_task_failed(session, task, reason=None):
     """
     Mark a task as failed with optional reason and update job status.
     """
-    task.status = STATUS_FAILED
-    task.last_error = reason
+    if not transition_task(session, task.id, STATUS_FAILED, expected_status=task.status, last_error=reason):
+        session.commit()
+        logging.warning(f"Task {task.id} changed status concurrently; not marking as {STATUS_FAILED}.")
+        return False
     session.commit()
     update_job_status(session, task.job_id)
     subject = f"Task Failed: {task.file_path or task.id}"
     body = f"Task {task.id} marked as failed.\nReason: {reason or 'Unknown'}."
     send_email(subject, body)
     send_telegram(body)
+    return True
 
-def mark_task_success(session, task):
+def _mark_task(session, task, status):
     """
-    Mark a task as completed successfully and update job status.
+    Conditionally move `task` from the status it was loaded with to `status`
+    and update job status. Returns False if another process changed it first.
     """
-    task.status = STATUS_COMPLETED_SUCCESS
+    if not transition_task(session, task.id, status, expected_status=task.status):
+        session.commit()
+        logging.warning(f"Task {task.id} changed status concurrently; not marking as {status}.")
+        return False
     session.commit()
     update_job_status(session, task.job_id)
-    logging.info(f"Task {task.id} marked as {STATUS_COMPLETED_SUCCESS}.")
+    logging.info(f"Task {task.id} marked as {status}.")
+    return True
+
+def mark_task_success(session, task):
+    """
+    Mark a task as completed successfully and update job status.
+    """
+    return _mark_task(session, task, STATUS_COMPLETED_SUCCESS)
 
 def mark_task_partial(session, task):
     """
     Mark a task as completed partial (some metrics pass) and update job status.
     Fine-tune spawning is controller-managed and handled separately.
     """
-    task.status = STATUS_COMPLETED_PARTIAL
-    session.commit()
-    update_job_status(session, task.job_id)
-    logging.info(f"Task {task.id} marked as {STATUS_COMPLETED_PARTIAL}.")
+    return _mark_task(session, task, STATUS_COMPLETED_PARTIAL)
 
 def mark_task_retrying(session, task):
     """
     Mark a task as retrying (not yet reached max attempts), update job status.
     """
     if (task.attempt_count or 0) < (task.max_attempts or config.TASK_MAX_ATTEMPTS):
-        task.status = STATUS_RETRYING
-        task.updated_at = datetime.utcnow()
-        session.commit()
-        update_job_status(session, task.job_id)
-        logging.info(f"Task {task.id} marked as {STATUS_RETRYING}.")
+        return _mark_task(session, task, STATUS_RETRYING)
+    return False
 
 # --- Fine-tune Logic for Partial Tasks ---
 def handle_partial_tasks(session):
@@ -212,6 +229,10 @@ def main_loop():
     - Queues eligible tasks to Redis for worker processing.
     """
     r = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=False)
+    engine = get_engine()
+    ensure_rollup_tables(engine)  # transition_task() logs into them
+    ensure_job_summaries(engine, backfill=False)  # kept current on every task/job commit
+    ensure_strategy_rankings(engine)  # read by the dashboards, filled by the supervisor
     POLL_INTERVAL = 20  # seconds
 
     BATCH_SIZE = 10
@@ -428,16 +449,21 @@ def main_loop():
                 for task in batch:
                     logging.debug(f"Preparing to queue task id={task.id}, type={type(task.id)}, job_id={task.job_id}, type(job_id)={type(task.job_id)}")
                     old_status = task.status
-                    # Change task status to QUEUED and update timestamp
-                    task.status = STATUS_QUEUED
-                    task.updated_at = datetime.utcnow()
+                    # Change task status to QUEUED (and count the retry) in one conditional UPDATE
+                    fields = {}
                     if old_status == STATUS_RETRYING:
-                        task.attempt_count = (task.attempt_count or 0) + 1
+                        fields["attempt_count"] = (task.attempt_count or 0) + 1
+                    if not transition_task(session, task.id, STATUS_QUEUED, expected_status=old_status, **fields):
+                        session.commit()
+                        logging.info(f"Task {task.id} left {old_status} before queueing; skipped.")
+                        continue
                     session.commit()
                     update_job_status(session, task.job_id)
                     logging.debug(f"Committed task id={task.id}, now queuing to Redis")
                     queue_task_to_redis(r, task)
                     logging.debug(f"Queued task id={task.id} to Redis")
+                if batch:
+                    publish_queue_depth(r)
 
             time.sleep(POLL_INTERVAL)
         except Exception as e:
@@ -0,0 +1,368 @@
+"""
+Process-wide connection management.
+
+Every service (controller, worker, supervisor, Streamlit pages and the portfolio
+batch scripts) gets its SQLAlchemy engine, session factory and raw DBAPI
+connections from here, so each process holds exactly one tuned connection pool
+per database instead of one per module or per call.
+
+Pool sizing is taken from config (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE,
+DB_POOL_TIMEOUT, DB_POOL_PRE_PING). Checkout wait times and in-use counts are
+recorded by InstrumentedQueuePool and exposed through get_pool_metrics().
+
+Read-only work (dashboards, analytics) is routed by get_read_engine() and
+session_scope(read_only=True) to the replica at SQLALCHEMY_REPLICA_URL when its
+replication lag is within the caller's staleness tolerance, and to the primary
+otherwise, so heavy reads do not compete with the scheduler's row locks.
+
+Sessions should be opened with session_scope(), which commits, rolls back and
+closes for the caller. Every session created here is tracked so that sessions
+left open (and holding a pooled connection) can be reported by
+report_leaked_sessions().
+"""
+import os
+import time
+import logging
+import threading
+import traceback
+import weakref
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+import config
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+_lock = threading.Lock()
+_engines = {}
+_sessionmakers = {}
+_open_sessions = {}
+_open_sessions_lock = threading.Lock()
+_replica_lag = {"checked_at": 0.0, "seconds": None}
+_replica_lag_lock = threading.Lock()
+
+
+class PoolStats:
+    """Thread-safe counters for connection checkouts from one pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait_seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait_seconds
+            if wait_seconds > self.max_wait:
+                self.max_wait = wait_seconds
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.timeouts,
+                "avg_checkout_wait_ms": (self.total_wait / attempts * 1000) if attempts else 0.0,
+                "max_checkout_wait_ms": self.max_wait * 1000,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that measures how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return conn
+
+
+class TrackedSession(Session):
+    """
+    Session that registers itself while open, recording when and where it was
+    created, so leaked sessions can be found by report_leaked_sessions().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        key = id(self)
+        entry = {
+            "opened_at": time.time(),
+            "origin": _caller_origin(),
+            "ref": weakref.ref(self, lambda _ref, key=key: _forget_session(key)),
+        }
+        with _open_sessions_lock:
+            _open_sessions[key] = entry
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            _forget_session(id(self))
+
+
+@event.listens_for(TrackedSession, "before_flush")
+def _reject_read_only_flush(session, flush_context, instances):
+    if session.info.get("read_only"):
+        raise RuntimeError("Attempted to write through a read-only session_scope().")
+
+
+def _forget_session(key):
+    with _open_sessions_lock:
+        _open_sessions.pop(key, None)
+
+
+def _caller_origin():
+    """First stack frame outside SQLAlchemy and this module, as 'file:line in func'."""
+    here = os.path.abspath(__file__)
+    for frame in reversed(traceback.extract_stack(limit=12)[:-2]):
+        filename = os.path.abspath(frame.filename)
+        if filename == here or f"{os.sep}sqlalchemy{os.sep}" in filename:
+            continue
+        return f"{os.path.basename(filename)}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+def get_database_url():
+    """Primary database URL: SQLALCHEMY_DATABASE_URL, else built from the MYSQL_* settings."""
+    if config.SQLALCHEMY_DATABASE_URL:
+        return config.SQLALCHEMY_DATABASE_URL
+    return (
+        f"mysql+pymysql://{config.MYSQL_USER}:{config.MYSQL_PASSWORD}"
+        f"@{config.MYSQL_HOST}:{config.MYSQL_PORT or 3306}/{config.MYSQL_DATABASE}?charset=utf8mb4"
+    )
+
+
+def create_pooled_engine(url, pool_size=None, max_overflow=None, pool_recycle=None,
+                         pool_timeout=None, pool_pre_ping=None):
+    """
+    Create an engine using the instrumented pool and the configured pool settings.
+    SQLite URLs keep SQLAlchemy's default pool (used by the test suite).
+    """
+    if url.startswith("sqlite"):
+        return create_engine(url)
+    return create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=config.DB_POOL_SIZE if pool_size is None else pool_size,
+        max_overflow=config.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        pool_recycle=config.DB_POOL_RECYCLE if pool_recycle is None else pool_recycle,
+        pool_timeout=config.DB_POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+        pool_pre_ping=config.DB_POOL_PRE_PING if pool_pre_ping is None else pool_pre_ping,
+    )
+
+
+def get_engine(name=PRIMARY):
+    """
+    Return the process-wide engine for `name`, creating it on first use.
+    REPLICA uses SQLALCHEMY_REPLICA_URL and falls back to the primary engine
+    when no replica is configured.
+    """
+    engine = _engines.get(name)
+    if engine is not None:
+        return engine
+    if name == REPLICA and not config.SQLALCHEMY_REPLICA_URL:
+        return get_engine(PRIMARY)
+    with _lock:
+        if name not in _engines:
+            if name == PRIMARY:
+                url = get_database_url()
+            elif name == REPLICA:
+                url = config.SQLALCHEMY_REPLICA_URL
+            else:
+                raise KeyError(f"Unknown database '{name}'")
+            _engines[name] = create_pooled_engine(url)
+            logging.info(f"[db.connection] Created pooled engine '{name}'")
+        return _engines[name]
+
+
+def get_sessionmaker(name=PRIMARY):
+    """Return the process-wide session factory bound to the engine for `name`."""
+    factory = _sessionmakers.get(name)
+    if factory is not None:
+        return factory
+    engine = get_engine(name)
+    with _lock:
+        if name not in _sessionmakers:
+            _sessionmakers[name] = sessionmaker(
+                autocommit=False, autoflush=False, bind=engine, class_=TrackedSession
+            )
+        return _sessionmakers[name]
+
+
+def _query_replica_lag(engine):
+    """Seconds_Behind_Source reported by the replica, or None if unknown."""
+    try:
+        with engine.connect() as conn:
+            for statement, column in (
+                ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),  # MySQL < 8.0.22
+            ):
+                try:
+                    row = conn.execute(text(statement)).mappings().first()
+                except DBAPIError:
+                    continue
+                if row is None or row.get(column) is None:
+                    return None  # not configured as a replica, or replication stopped
+                return float(row[column])
+    except Exception as e:
+        logging.warning(f"[db.connection] Could not read replica lag: {e}")
+    return None
+
+
+def replica_lag_seconds(refresh=False):
+    """
+    Replication lag of the configured replica in seconds, cached for
+    REPLICA_LAG_CHECK_INTERVAL seconds. None when there is no replica or the lag
+    cannot be determined (the replica user needs REPLICATION CLIENT).
+    """
+    if not config.SQLALCHEMY_REPLICA_URL:
+        return None
+    with _replica_lag_lock:
+        now = time.time()
+        if refresh or now - _replica_lag["checked_at"] >= config.REPLICA_LAG_CHECK_INTERVAL:
+            _replica_lag["seconds"] = _query_replica_lag(get_engine(REPLICA))
+            _replica_lag["checked_at"] = now
+        return _replica_lag["seconds"]
+
+
+def _read_target(max_staleness=None):
+    """PRIMARY or REPLICA, whichever should serve a read tolerating `max_staleness`."""
+    if max_staleness is None:
+        max_staleness = config.REPLICA_MAX_STALENESS_SECONDS
+    if not config.SQLALCHEMY_REPLICA_URL or max_staleness <= 0:
+        return PRIMARY
+    lag = replica_lag_seconds()
+    if lag is None or lag > max_staleness:
+        return PRIMARY
+    return REPLICA
+
+
+def get_read_engine(max_staleness=None):
+    """
+    Engine for read-only queries that can tolerate `max_staleness` seconds of
+    replication lag (default REPLICA_MAX_STALENESS_SECONDS). Returns the replica
+    when it is configured and fresh enough, otherwise the primary. Use
+    max_staleness=0 for reads that must see the latest writes.
+    """
+    return get_engine(_read_target(max_staleness))
+
+
+@contextmanager
+def session_scope(read_only=False, max_staleness=None):
+    """
+    Transactional scope around a series of operations:
+
+        with session_scope() as session:
+            ...
+
+    - Commits on success, rolls back on error, and always closes the session so
+      its connection goes back to the pool.
+    - read_only=True routes the session through get_read_engine(max_staleness)
+      (replica when fresh enough, else primary), refuses flushes, and ends
+      without committing. ORM objects loaded in a read-only scope stay readable
+      (detached) after the block.
+    """
+    session = get_sessionmaker(_read_target(max_staleness) if read_only else PRIMARY)()
+    session.info["read_only"] = read_only
+    try:
+        yield session
+        if not read_only:
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def find_leaked_sessions(threshold_seconds=None):
+    """Sessions open for longer than threshold_seconds, oldest first."""
+    if threshold_seconds is None:
+        threshold_seconds = config.SESSION_LEAK_THRESHOLD_SECONDS
+    now = time.time()
+    with _open_sessions_lock:
+        entries = list(_open_sessions.values())
+    leaked = [
+        {"age_seconds": now - e["opened_at"], "origin": e["origin"]}
+        for e in entries
+        if e["ref"]() is not None and now - e["opened_at"] > threshold_seconds
+    ]
+    return sorted(leaked, key=lambda e: e["age_seconds"], reverse=True)
+
+
+def report_leaked_sessions(threshold_seconds=None):
+    """Log a warning for every session left open beyond the threshold; returns them."""
+    leaked = find_leaked_sessions(threshold_seconds)
+    for entry in leaked:
+        logging.warning(
+            f"[db.connection] Session open for {entry['age_seconds']:.0f}s, created at {entry['origin']}"
+        )
+    return leaked
+
+
+@contextmanager
+def raw_connection(name=PRIMARY):
+    """
+    Check out a raw DBAPI connection (pymysql for MySQL) from the shared pool.
+    The caller is responsible for commit; the connection is rolled back on error
+    and always returned to the pool on exit.
+    """
+    conn = get_engine(name).raw_connection()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def get_pool_metrics(name=PRIMARY):
+    """
+    Snapshot of pool usage for monitoring: configured size, connections in use,
+    overflow, and checkout wait statistics.
+    """
+    engine = _engines.get(name)
+    if engine is None:
+        return {}
+    pool = engine.pool
+    metrics = {"database": name, "pool_status": pool.status()}
+    with _open_sessions_lock:
+        metrics["open_sessions"] = len(_open_sessions)
+    if isinstance(pool, QueuePool):
+        metrics.update({
+            "pool_size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        metrics.update(pool.stats.snapshot())
+    return metrics
+
+
+def dispose_engines():
+    """Drop all pooled connections, e.g. in a child process after fork."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose(close=False)
@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    Column, Integer, String, Text, DateTime, ForeignKey, Float, LargeBinary, BLOB, JSON
+    Column, Integer, String, Text, DateTime, ForeignKey, Float, LargeBinary, BLOB, JSON, Index
 )
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
@@ -333,4 +333,104 @@ class TradeRecord(Base):
     test_metrics_id = Column(Integer, ForeignKey('test_metrics.id'))
 
     # Only valid relationship per your DB structure
-    test_metric = relationship("TestMetric", backref="trade_records")
\ No newline at end of file
+    test_metric = relationship("TestMetric", backref="trade_records")
+
+# --- Controller monitoring rollups (maintained by db/rollups.py) ---
+class TaskTransitionEvent(Base):
+    __tablename__ = 'controller_task_transitions'          # append-only, drained by the supervisor
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    at = Column(DateTime, nullable=False)
+    from_status = Column(String(32), nullable=False, default='')
+    to_status = Column(String(32), nullable=False)
+    wait_seconds = Column(Float, nullable=False, default=0)
+
+
+class TaskTransitionRollup(Base):
+    __tablename__ = 'controller_task_rollups'
+    granularity = Column(String(8), primary_key=True)      # 'minute' | 'day'
+    bucket_start = Column(DateTime, primary_key=True)
+    from_status = Column(String(32), primary_key=True)     # '' for newly created tasks
+    to_status = Column(String(32), primary_key=True)
+    transitions = Column(Integer, nullable=False, default=0)
+    wait_seconds = Column(Float, nullable=False, default=0)  # total time spent in from_status
+
+
+class TaskStatusCount(Base):
+    __tablename__ = 'controller_task_status_counts'
+    status = Column(String(32), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class QueueSample(Base):
+    __tablename__ = 'controller_queue_samples'
+    sampled_at = Column(DateTime, primary_key=True)        # minute bucket
+    queue_depth = Column(Integer, nullable=False, default=0)
+    waiting_tasks = Column(Integer, nullable=False, default=0)
+    starved_tasks = Column(Integer, nullable=False, default=0)
+    oldest_wait_seconds = Column(Float, nullable=True)
+
+
+# --- Job list summary for the Optimization Dashboard (maintained by db/job_summary.py) ---
+class JobSummary(Base):
+    __tablename__ = 'controller_job_summaries'
+    job_id = Column(Integer, primary_key=True)
+    user_id = Column(String(255))
+    user_name = Column(String(255))
+    symbol = Column(String(255))
+    timeframe = Column(String(255))
+    ea_name = Column(String(255))
+    original_file = Column(String(255))                    # file name without the folder
+    status = Column(String(32))
+    created_at = Column(DateTime)
+    number_of_attempt = Column(Integer, nullable=False, default=0)
+    number_of_refine = Column(Integer, nullable=False, default=0)
+    latest_update = Column(DateTime, nullable=True)         # latest task heartbeat
+
+    # Keyset reads: newest first, optionally filtered by user and/or status.
+    __table_args__ = (
+        Index('ix_job_summaries_created', 'created_at', 'job_id'),
+        Index('ix_job_summaries_user_created', 'user_name', 'created_at', 'job_id'),
+        Index('ix_job_summaries_status_created', 'status', 'created_at', 'job_id'),
+        Index('ix_job_summaries_user_status_created', 'user_name', 'status', 'created_at', 'job_id'),
+    )
+
+
+# --- Ranked strategy listing (maintained by db/strategy_query.py) ---
+class StrategyRanking(Base):
+    __tablename__ = 'strategy_rankings'
+    metric_id = Column(Integer, primary_key=True)
+    set_file_name = Column(String(255))
+    symbol = Column(String(255))
+    net_profit = Column(Float)
+    max_drawdown = Column(Float)
+    total_trades = Column(Integer)
+    recovery_factor = Column(Float)
+    weighted_score = Column(Float)
+    normalized_total_distance_to_good = Column(Float)
+    win_rate = Column(Float)
+    profit_factor = Column(Float)
+    expected_payoff = Column(Float)
+    status = Column(Integer)                                # criteria_passed
+    criteria_reason = Column(Text)
+    created_at = Column(DateTime)
+    rn = Column(Integer, nullable=False)                    # rank within the symbol
+    # Sort keys: NULLs replaced so they sort last, descending columns negated,
+    # so every listing sort is one ascending index range.
+    key_normalized_total_distance_to_good = Column(Float(precision=53), nullable=False)
+    key_weighted_score = Column(Float(precision=53), nullable=False)
+    key_net_profit = Column(Float(precision=53), nullable=False)
+    key_profit_factor = Column(Float(precision=53), nullable=False)
+    key_win_rate = Column(Float(precision=53), nullable=False)
+    key_max_drawdown = Column(Float(precision=53), nullable=False)
+
+    __table_args__ = (
+        Index('ix_strategy_rankings_rank', 'key_normalized_total_distance_to_good', 'key_weighted_score', 'metric_id'),
+        Index('ix_strategy_rankings_score', 'key_weighted_score', 'metric_id'),
+        Index('ix_strategy_rankings_net_profit', 'key_net_profit', 'metric_id'),
+        Index('ix_strategy_rankings_profit_factor', 'key_profit_factor', 'metric_id'),
+        Index('ix_strategy_rankings_win_rate', 'key_win_rate', 'metric_id'),
+        Index('ix_strategy_rankings_max_drawdown', 'key_max_drawdown', 'metric_id'),
+        Index('ix_strategy_rankings_newest', 'created_at', 'metric_id'),
+        Index('ix_strategy_rankings_rn', 'rn', 'metric_id'),
+        Index('ix_strategy_rankings_set_file_name', 'set_file_name'),
+    )
@@ -0,0 +1,167 @@
+"""
+Equity and drawdown series per strategy, computed from trade_records.
+
+The MT4 tester only leaves equity curves as GIF artifacts. The same curve is
+in the synced trades (close_time, balance_after_trade), so it is rebuilt here
+as numbers and downsampled to a fixed point budget with LTTB
+(Largest-Triangle-Three-Buckets), which keeps the visual shape of the curve.
+The deepest drawdown point is always kept, so the plotted max drawdown
+matches the real one. A few hundred points per strategy are a few KB, and
+many strategies can be overlaid on one interactive chart.
+
+Trades are fetched for all requested strategies in one SELECT of four
+columns. Downsampled curves are cached per (test_metrics_id, points), LRU,
+up to EQUITY_CURVE_CACHE_MAX entries, like the trade arrays in
+db/trade_records.py (trades do not change once synced).
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+import config
+from db.db_models import TradeRecord
+
+
+class EquityCurve(NamedTuple):
+    time: np.ndarray       # datetime64[s], ascending; the first point is the starting balance
+    equity: np.ndarray     # float64, account balance after each trade
+    drawdown: np.ndarray   # float64, equity minus its running peak (<= 0)
+    trades: int            # trades in the full series
+
+
+def lttb(x, y, n_out):
+    """Indices of the `n_out` points LTTB keeps from (x, y); all of them if n_out >= len(x)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # n_out - 2 buckets over the interior points; the first and last points are always kept.
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            avg_x, avg_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        # Twice the area of the triangle (previous kept point, candidate, next bucket average).
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def equity_series(close_time, balance, profit):
+    """Full EquityCurve from trades sorted by close_time (balance_after_trade may have gaps)."""
+    time = np.asarray(close_time, dtype="datetime64[s]")
+    balance = np.asarray(balance, dtype=np.float64)
+    profit = np.nan_to_num(np.asarray(profit, dtype=np.float64))
+    cum = np.cumsum(profit)
+    known = ~np.isnan(balance)
+    # Where the balance is missing, continue from the known balances with the trade profits.
+    offset = float(np.median(balance[known] - cum[known])) if known.any() else 0.0
+    equity = np.where(known, balance, cum + offset)
+    start = equity[0] - profit[0]
+    time = np.r_[time[:1], time]
+    equity = np.r_[start, equity]
+    drawdown = equity - np.maximum.accumulate(equity)
+    return EquityCurve(time, equity, drawdown, len(profit))
+
+
+def downsample(curve, points):
+    """`curve` reduced to about `points` points (LTTB on equity plus the max-drawdown point)."""
+    if len(curve.equity) <= points:
+        return curve
+    x = curve.time.astype(np.int64).astype(np.float64)
+    keep = np.union1d(lttb(x, curve.equity, points), [int(np.argmin(curve.drawdown))])
+    return EquityCurve(curve.time[keep], curve.equity[keep], curve.drawdown[keep], curve.trades)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _cache_lock:
+        curve = _cache.get(key)
+        if curve is not None:
+            _cache.move_to_end(key)
+        return curve
+
+
+def _cache_put(key, curve):
+    with _cache_lock:
+        _cache[key] = curve
+        _cache.move_to_end(key)
+        while len(_cache) > config.EQUITY_CURVE_CACHE_MAX:
+            _cache.popitem(last=False)
+
+
+def clear_equity_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _fetch(conn, test_metrics_ids):
+    stmt = (
+        select(TradeRecord.test_metrics_id, TradeRecord.close_time,
+               TradeRecord.balance_after_trade, TradeRecord.profit)
+        .where(TradeRecord.test_metrics_id.in_(test_metrics_ids))
+        .where(TradeRecord.close_time.isnot(None))
+        .order_by(TradeRecord.test_metrics_id, TradeRecord.close_time)
+    )
+    rows = conn.execute(stmt).all()
+    if not rows:
+        return {}
+    ids, times, balances, profits = zip(*rows)
+    ids = np.asarray(ids, dtype=np.int64)
+    times = pd.to_datetime(pd.Series(times)).to_numpy(dtype="datetime64[s]")
+    balances = np.asarray([np.nan if b is None else b for b in balances], dtype=np.float64)
+    profits = np.asarray([np.nan if p is None else p for p in profits], dtype=np.float64)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)]
+    return {
+        int(ids[s]): equity_series(times[s:e], balances[s:e], profits[s:e])
+        for s, e in zip(starts, ends)
+    }
+
+
+def load_equity_curves(conn, test_metrics_ids, points=None):
+    """
+    {test_metrics_id: EquityCurve} downsampled to `points` (EQUITY_CURVE_POINTS);
+    strategies without closed trades are left out. `conn` is a Connection or Session.
+    """
+    points = int(points or config.EQUITY_CURVE_POINTS)
+    result, missing = {}, []
+    for tm_id in dict.fromkeys(int(i) for i in test_metrics_ids):
+        curve = _cache_get((tm_id, points))
+        if curve is None:
+            missing.append(tm_id)
+        else:
+            result[tm_id] = curve
+    if missing:
+        for tm_id, curve in _fetch(conn, missing).items():
+            curve = downsample(curve, points)
+            _cache_put((tm_id, points), curve)
+            result[tm_id] = curve
+    return result
+
+
+def curves_frame(curves, labels=None):
+    """Long DataFrame (strategy, time, equity, drawdown) for overlay charts."""
+    labels = labels or {}
+    frames = [
+        pd.DataFrame({"strategy": labels.get(tm_id, str(tm_id)), "time": c.time,
+                      "equity": c.equity, "drawdown": c.drawdown})
+        for tm_id, c in curves.items()
+    ]
+    if not frames:
+        return pd.DataFrame(columns=["strategy", "time", "equity", "drawdown"])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,218 @@
+"""
+Job list summary for the Optimization Dashboard (controller_job_summaries).
+
+One row per job with everything the job list shows: the owner's user name,
+the job's own fields and its task aggregates (total attempts, deepest
+fine-tune, latest heartbeat). Rows are kept current as jobs and tasks change:
+
+- ORM inserts/updates/deletes of ControllerJob and ControllerTask (flush hook)
+  refresh the affected jobs' rows;
+- transition_task() and touch_task() report the task fields they set through
+  task_fields_changed(): a heartbeat is one conditional UPDATE of
+  latest_update, an attempt or fine-tune change refreshes that job's row.
+
+Both are queued on the Session and applied at the very end of its
+transaction, on its own connection, right before COMMIT (dropped on
+rollback). A job's summary row is therefore locked only for the commit round
+trip, not for the length of the task transaction, and no second pooled
+connection is needed.
+
+A refresh aggregates only that job's tasks, and the dashboard reads one page
+at a time by keyset on (created_at, job_id) DESC with the user/status filters
+as plain equality predicates, so the cost of both is independent of how many
+jobs exist. Every process that changes jobs or tasks creates the table at
+startup; the supervisor's ensure_job_summaries() also backfills jobs created
+before it.
+"""
+import ntpath
+from dataclasses import dataclass
+
+import pandas as pd
+from sqlalchemy import and_, delete, event, func, or_, select, update
+from sqlalchemy.orm import Session, attributes
+
+from db.db_models import ControllerJob, ControllerTask, JobSummary, User
+from db.rollups import upsert
+
+COLUMNS = [
+    "job_id", "user_name", "symbol", "timeframe", "ea_name", "original_file", "status",
+    "created_at", "number_of_attempt", "number_of_refine", "latest_update",
+]
+# Task fields that feed the summary (besides job_id).
+_TASK_FIELDS = ("attempt_count", "fine_tune_depth", "last_heartbeat")
+_BACKFILL_BATCH = 500
+_PENDING = "job_summary_changes"
+
+
+def _basename(path):
+    return ntpath.basename(path) if path else path
+
+
+def refresh_job_summaries(conn, job_ids):
+    """Recompute the summary rows of `job_ids` from their job and tasks (drops rows of deleted jobs)."""
+    ids = sorted({int(i) for i in job_ids if i is not None})
+    if not ids:
+        return
+    jobs = conn.execute(
+        select(
+            ControllerJob.id, ControllerJob.user_id, ControllerJob.symbol, ControllerJob.timeframe,
+            ControllerJob.ea_name, ControllerJob.original_file, ControllerJob.status, ControllerJob.created_at,
+        ).where(ControllerJob.id.in_(ids))
+    ).all()
+    tasks = {
+        row.job_id: row for row in conn.execute(
+            select(
+                ControllerTask.job_id,
+                func.coalesce(func.sum(ControllerTask.attempt_count), 0).label("attempts"),
+                func.coalesce(func.max(ControllerTask.fine_tune_depth), 0).label("refine"),
+                func.max(ControllerTask.last_heartbeat).label("heartbeat"),
+            ).where(ControllerTask.job_id.in_(ids)).group_by(ControllerTask.job_id)
+        ).all()
+    }
+    # controller_jobs.user_id is a string column holding users.id
+    user_ids = {int(j.user_id) for j in jobs if str(j.user_id or "").isdigit()}
+    names = dict(conn.execute(select(User.id, User.username).where(User.id.in_(user_ids))).all()) if user_ids else {}
+
+    for job in jobs:
+        agg = tasks.get(job.id)
+        upsert(conn, JobSummary, {"job_id": job.id}, values={
+            "user_id": job.user_id,
+            "user_name": names.get(int(job.user_id)) if str(job.user_id or "").isdigit() else None,
+            "symbol": job.symbol,
+            "timeframe": job.timeframe,
+            "ea_name": job.ea_name,
+            "original_file": _basename(job.original_file),
+            "status": job.status,
+            "created_at": job.created_at,
+            "number_of_attempt": int(agg.attempts) if agg else 0,
+            "number_of_refine": int(agg.refine) if agg else 0,
+            "latest_update": agg.heartbeat if agg else None,
+        })
+    gone = set(ids) - {job.id for job in jobs}
+    if gone:
+        conn.execute(delete(JobSummary).where(JobSummary.job_id.in_(gone)))
+
+
+def _pending(session):
+    return session.info.setdefault(_PENDING, {"jobs": set(), "tasks": set(), "heartbeats": {}})
+
+
+def task_fields_changed(session, task_id, fields, job_id=None):
+    """Queue the summary change for a Core UPDATE of `fields` on task `task_id`; applied before commit."""
+    pending = _pending(session)
+    if any(f in fields for f in ("attempt_count", "fine_tune_depth")):
+        if job_id is not None:
+            pending["jobs"].add(job_id)
+        else:
+            pending["tasks"].add(task_id)
+    elif fields.get("last_heartbeat") is not None:
+        heartbeat = fields["last_heartbeat"]
+        _, latest = pending["heartbeats"].get(task_id, (None, None))
+        if latest is None or latest < heartbeat:
+            pending["heartbeats"][task_id] = (job_id, heartbeat)
+
+
+def apply_changes(conn, pending):
+    """Apply queued summary changes (jobs in id order): refresh whole rows, then move latest_update forward."""
+    job_ids = set(pending["jobs"])
+    if pending["tasks"]:
+        job_ids.update(conn.execute(
+            select(ControllerTask.job_id).where(ControllerTask.id.in_(pending["tasks"]))
+        ).scalars())
+    job_ids.discard(None)
+    refresh_job_summaries(conn, job_ids)
+    for task_id, (job_id, heartbeat) in sorted(pending["heartbeats"].items()):
+        job = job_id if job_id is not None else (
+            select(ControllerTask.job_id).where(ControllerTask.id == task_id).scalar_subquery()
+        )
+        conn.execute(
+            update(JobSummary)
+            .where(JobSummary.job_id == job)
+            .where(or_(JobSummary.latest_update.is_(None), JobSummary.latest_update < heartbeat))
+            .values(latest_update=heartbeat)
+        )
+
+
+def _changed(obj, names):
+    return any(attributes.get_history(obj, name).has_changes() for name in names)
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_flushed_jobs(session, flush_context):
+    job_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, ControllerJob):
+            job_ids.add(obj.id)
+        elif isinstance(obj, ControllerTask):
+            if obj in session.new or obj in session.deleted or _changed(obj, _TASK_FIELDS):
+                job_ids.add(obj.job_id)
+            if _changed(obj, ("job_id",)):
+                job_ids.update(attributes.get_history(obj, "job_id").deleted)
+                job_ids.add(obj.job_id)
+    job_ids.discard(None)
+    if job_ids:
+        _pending(session)["jobs"].update(job_ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_before_commit(session):
+    session.flush()  # so the flush hook has queued its jobs
+    pending = session.info.pop(_PENDING, None)
+    if pending:
+        apply_changes(session.connection(), pending)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop(_PENDING, None)
+
+
+def ensure_job_summaries(engine, backfill=True):
+    """Create the summary table if missing and (with backfill) add rows for jobs that have none yet."""
+    JobSummary.metadata.create_all(engine, tables=[JobSummary.__table__])
+    if not backfill:
+        return 0
+    with engine.begin() as conn:
+        missing = conn.execute(
+            select(ControllerJob.id)
+            .outerjoin(JobSummary, JobSummary.job_id == ControllerJob.id)
+            .where(JobSummary.job_id.is_(None))
+        ).scalars().all()
+        for i in range(0, len(missing), _BACKFILL_BATCH):
+            refresh_job_summaries(conn, missing[i:i + _BACKFILL_BATCH])
+    return len(missing)
+
+
+# --- reads ---
+@dataclass
+class JobPage:
+    rows: pd.DataFrame
+    cursor: dict = None        # pass as `after` to fetch the next page; None on the last page
+
+
+def _filters(user_name, status):
+    clauses = []
+    if user_name:
+        clauses.append(JobSummary.user_name == user_name)
+    if status:
+        clauses.append(JobSummary.status == status)
+    return clauses
+
+
+def fetch_job_page(conn, user_name=None, status=None, page_size=50, after=None):
+    """One page of jobs, newest first; `after` is the cursor of the previous page."""
+    stmt = select(*[getattr(JobSummary, c) for c in COLUMNS]).where(*_filters(user_name, status))
+    if after:
+        stmt = stmt.where(or_(
+            JobSummary.created_at < after["created_at"],
+            and_(JobSummary.created_at == after["created_at"], JobSummary.job_id < after["job_id"]),
+        ))
+    stmt = stmt.order_by(JobSummary.created_at.desc(), JobSummary.job_id.desc()).limit(int(page_size) + 1)
+    df = pd.DataFrame(conn.execute(stmt).all(), columns=COLUMNS)
+    cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        cursor = {"created_at": pd.Timestamp(last["created_at"]).to_pydatetime(), "job_id": int(last["job_id"])}
+    return JobPage(rows=df.reset_index(drop=True), cursor=cursor)
+
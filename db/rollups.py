@@ -0,0 +1,237 @@
+"""
+Controller monitoring rollups, so the Controller Dashboard never scans
+controller_tasks.
+
+  controller_task_transitions    append-only log of status changes, written
+                                 in the transaction that makes the change
+  controller_task_rollups        per-minute and per-day counters of status
+                                 transitions (from -> to) with the total time
+                                 spent in the old status
+  controller_task_status_counts  number of tasks per status
+  controller_queue_samples       per-minute queue depth / waiting / starved
+                                 tasks
+
+Writers only INSERT a transition row: transition_task() records its
+conditional UPDATEs explicitly, and a flush hook covers tasks created or
+re-statused through the ORM. No counter row is touched inside a task
+transaction, so concurrent transitions never wait on each other. The
+supervisor is the only writer of the other tables: each poll it folds the
+logged transitions into the rollups and into the status counts (-1 for the
+old status, +1 for the new one) and deletes them, samples the queue, and
+prunes minute rows after ROLLUP_MINUTE_RETENTION_HOURS. The dashboard
+therefore lags by at most one SUPERVISOR_POLL_INTERVAL, and a poll costs the
+number of new transitions, not the task history.
+
+Deleted tasks and raw writes that bypass the log are not seen by the counts,
+so at startup and every STATUS_COUNT_RECONCILE_MINUTES the supervisor also
+replaces them with a GROUP BY of controller_tasks (snapshot_status_counts).
+
+ensure_rollup_tables() is called at startup by every process that changes
+task status (controller, worker, supervisor).
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import case, delete, event, func, insert, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, attributes
+
+import config
+from db.db_models import ControllerTask, TaskTransitionEvent, TaskTransitionRollup, TaskStatusCount, QueueSample
+from db.status_constants import STATUS_NEW, STATUS_RETRYING
+from telemetry import task_changed
+
+MINUTE, DAY = "minute", "day"
+ROLLUP_TABLES = [
+    TaskTransitionEvent.__table__, TaskTransitionRollup.__table__, TaskStatusCount.__table__, QueueSample.__table__,
+]
+
+
+def _bucket(at, granularity):
+    if granularity == DAY:
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return at.replace(second=0, microsecond=0)
+
+
+def upsert(conn, model, keys, increments=None, values=None):
+    """INSERT the row, or add `increments` to / overwrite `values` on the existing one."""
+    increments, values = increments or {}, values or {}
+    table = model.__table__
+    row = {**keys, **increments, **values}
+    if conn.dialect.name == "mysql":
+        stmt = mysql_insert(table).values(row)
+        new = stmt.inserted
+    else:
+        stmt = sqlite_insert(table).values(row)
+        new = stmt.excluded
+    updates = {c: table.c[c] + new[c] for c in increments}
+    updates.update({c: new[c] for c in values})
+    if conn.dialect.name == "mysql":
+        stmt = stmt.on_duplicate_key_update(**updates)
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=updates)
+    conn.execute(stmt)
+
+
+def record_transition(conn, from_status, to_status, waited_seconds=None, at=None):
+    """Log one from_status -> to_status change (from_status None/'' for a new task); a single INSERT."""
+    conn.execute(insert(TaskTransitionEvent.__table__).values(
+        at=at or datetime.utcnow(),
+        from_status=from_status or "",
+        to_status=to_status,
+        wait_seconds=float(max(waited_seconds or 0.0, 0.0)),
+    ))
+
+
+@event.listens_for(ControllerTask.status, "set", active_history=True)
+def _load_old_status(target, value, oldvalue, initiator):
+    # active_history loads the old status even when the attribute was expired
+    # (e.g. after a commit), so the flush hook below knows the transition.
+    return value
+
+
+@event.listens_for(Session, "after_flush")
+def _record_orm_changes(session, flush_context):
+    tasks_new = [o for o in session.new if isinstance(o, ControllerTask)]
+    tasks_dirty = [o for o in session.dirty if isinstance(o, ControllerTask)]
+    if not (tasks_new or tasks_dirty):
+        return
+    conn = session.connection()
+    for task in tasks_new:
+        if task.status:
+            record_transition(conn, None, task.status)
+            task_changed(session, task.id, None, task.status, worker=task.assigned_worker)
+    for task in tasks_dirty:
+        history = attributes.get_history(task, "status")
+        if history.added and history.deleted and history.added[0] != history.deleted[0]:
+            record_transition(conn, history.deleted[0], history.added[0])
+            task_changed(session, task.id, history.deleted[0], history.added[0],
+                         worker=task.assigned_worker, error=task.last_error)
+
+
+def aggregate_transitions(session, batch=None):
+    """Fold logged transitions into the minute/day rollups and status counts and delete them; returns how many."""
+    batch = batch or config.ROLLUP_AGGREGATE_BATCH
+    conn = session.connection()
+    folded, last_id = 0, 0
+    while True:
+        events = conn.execute(
+            select(TaskTransitionEvent.id, TaskTransitionEvent.at, TaskTransitionEvent.from_status,
+                   TaskTransitionEvent.to_status, TaskTransitionEvent.wait_seconds)
+            .where(TaskTransitionEvent.id > last_id).order_by(TaskTransitionEvent.id).limit(batch)
+        ).all()
+        if not events:
+            break
+        totals = defaultdict(lambda: [0, 0.0])
+        deltas = defaultdict(int)
+        for _, at, from_status, to_status, waited in events:
+            for granularity in (MINUTE, DAY):
+                total = totals[(granularity, _bucket(at, granularity), from_status or "", to_status)]
+                total[0] += 1
+                total[1] += waited or 0.0
+            if from_status:
+                deltas[from_status] -= 1
+            deltas[to_status] += 1
+        for (granularity, bucket_start, from_status, to_status), (n, waited) in sorted(totals.items()):
+            upsert(
+                conn, TaskTransitionRollup,
+                {"granularity": granularity, "bucket_start": bucket_start,
+                 "from_status": from_status, "to_status": to_status},
+                increments={"transitions": n, "wait_seconds": waited},
+            )
+        for status, delta in sorted(deltas.items()):
+            if delta:
+                upsert(conn, TaskStatusCount, {"status": status}, increments={"count": delta})
+        # By id, not by range: rows from transactions still open may hold lower ids.
+        conn.execute(delete(TaskTransitionEvent).where(TaskTransitionEvent.id.in_([e.id for e in events])))
+        folded += len(events)
+        last_id = events[-1].id
+        if len(events) < batch:
+            break
+    return folded
+
+
+def snapshot_status_counts(session):
+    """
+    Replace the per-status counts with a GROUP BY of controller_tasks (a full
+    scan: only for the periodic reconcile). Call it in the same transaction
+    right after aggregate_transitions(): under REPEATABLE READ both then read
+    one snapshot, so a transition is either already folded in and counted here,
+    or still logged and invisible here, never both.
+    """
+    counts = dict(session.execute(
+        select(ControllerTask.status, func.count()).where(ControllerTask.status.isnot(None))
+        .group_by(ControllerTask.status)
+    ).all())
+    conn = session.connection()
+    for status in sorted(counts):
+        upsert(conn, TaskStatusCount, {"status": status}, values={"count": counts[status]})
+    conn.execute(delete(TaskStatusCount).where(TaskStatusCount.status.notin_(list(counts))))
+
+
+def sample_queue(session, queue_depth, at=None):
+    """Record the queue depth and the waiting/starved task counts for this minute."""
+    at = at or datetime.utcnow()
+    starved_before = at - timedelta(minutes=config.STARVED_TASK_MINUTES)
+    waiting, oldest, starved = session.execute(
+        select(
+            func.count(),
+            func.min(ControllerTask.created_at),
+            func.coalesce(func.sum(case((ControllerTask.created_at < starved_before, 1), else_=0)), 0),
+        ).where(ControllerTask.status.in_([STATUS_NEW, STATUS_RETRYING]))
+    ).one()
+    upsert(
+        session.connection(), QueueSample, {"sampled_at": _bucket(at, MINUTE)},
+        values={
+            "queue_depth": int(queue_depth or 0),
+            "waiting_tasks": int(waiting or 0),
+            "starved_tasks": int(starved or 0),
+            "oldest_wait_seconds": (at - oldest).total_seconds() if oldest else None,
+        },
+    )
+
+
+def prune_rollups(session, now=None):
+    """Drop minute-level rows and queue samples older than ROLLUP_MINUTE_RETENTION_HOURS."""
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=config.ROLLUP_MINUTE_RETENTION_HOURS)
+    session.execute(delete(TaskTransitionRollup).where(
+        TaskTransitionRollup.granularity == MINUTE, TaskTransitionRollup.bucket_start < cutoff))
+    session.execute(delete(QueueSample).where(QueueSample.sampled_at < cutoff))
+
+
+def ensure_rollup_tables(engine):
+    """Create the rollup tables if missing."""
+    TaskTransitionRollup.metadata.create_all(engine, tables=ROLLUP_TABLES)
+
+
+# --- reads (all bounded by the rollup sizes, not by task history) ---
+def load_status_counts(conn):
+    rows = conn.execute(
+        select(TaskStatusCount.status, TaskStatusCount.count).where(TaskStatusCount.count > 0)
+        .order_by(TaskStatusCount.status)
+    ).all()
+    return pd.DataFrame(rows, columns=["status", "count"])
+
+
+def load_transitions(conn, granularity, since):
+    rows = conn.execute(
+        select(
+            TaskTransitionRollup.bucket_start, TaskTransitionRollup.from_status,
+            TaskTransitionRollup.to_status, TaskTransitionRollup.transitions,
+            TaskTransitionRollup.wait_seconds,
+        ).where(TaskTransitionRollup.granularity == granularity, TaskTransitionRollup.bucket_start >= since)
+        .order_by(TaskTransitionRollup.bucket_start)
+    ).all()
+    return pd.DataFrame(rows, columns=["bucket_start", "from_status", "to_status", "transitions", "wait_seconds"])
+
+
+def load_queue_samples(conn, since):
+    rows = conn.execute(
+        select(
+            QueueSample.sampled_at, QueueSample.queue_depth, QueueSample.waiting_tasks,
+            QueueSample.starved_tasks, QueueSample.oldest_wait_seconds,
+        ).where(QueueSample.sampled_at >= since).order_by(QueueSample.sampled_at)
+    ).all()
+    return pd.DataFrame(rows, columns=["sampled_at", "queue_depth", "waiting_tasks", "starved_tasks", "oldest_wait_seconds"])
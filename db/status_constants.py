@@ -24,6 +24,29 @@ ALL_TASK_STATUSES = {
     STATUS_FAILED,
 }
 
+# Legal task status transitions (see the diagram in controller/main.py).
+# Re-entering the same status is allowed where a retry or requeue may repeat.
+TASK_TRANSITIONS = {
+    STATUS_NEW: {STATUS_QUEUED, STATUS_RETRYING, STATUS_FAILED},
+    STATUS_QUEUED: {STATUS_WORKER_IN_PROGRESS, STATUS_RETRYING, STATUS_FAILED},
+    STATUS_WORKER_IN_PROGRESS: {STATUS_WORKER_COMPLETED, STATUS_WORKER_FAILED, STATUS_RETRYING, STATUS_FAILED},
+    STATUS_WORKER_COMPLETED: {STATUS_COMPLETED_SUCCESS, STATUS_COMPLETED_PARTIAL, STATUS_RETRYING, STATUS_FAILED},
+    STATUS_WORKER_FAILED: {STATUS_RETRYING, STATUS_FAILED},
+    STATUS_RETRYING: {STATUS_QUEUED, STATUS_RETRYING, STATUS_FAILED},
+    STATUS_FINE_TUNING: {STATUS_QUEUED, STATUS_RETRYING, STATUS_FAILED},
+    STATUS_COMPLETED_SUCCESS: set(),
+    STATUS_COMPLETED_PARTIAL: set(),
+    STATUS_FAILED: set(),
+}
+
+TERMINAL_TASK_STATUSES = {s for s, targets in TASK_TRANSITIONS.items() if not targets}
+
+# Inverse of TASK_TRANSITIONS: the statuses a task may be in to move to a given status.
+TASK_TRANSITION_SOURCES = {
+    target: {s for s, targets in TASK_TRANSITIONS.items() if target in targets}
+    for target in ALL_TASK_STATUSES
+}
+
 # In db/status_constants.py
 JOB_STATUS_NEW = "new"
 JOB_STATUS_QUEUED = "queued"
@@ -0,0 +1,256 @@
+"""
+Strategy listing queries shared by the Strategy Dashboard and Portfolio
+Management pages.
+
+The ranking (ROW_NUMBER() per symbol by (distance, score) over
+v_test_metrics_scored) is not computed per request: it is materialized into
+strategy_rankings. Every STRATEGY_RANKING_REFRESH_SECONDS the supervisor calls
+update_strategy_rankings(), which rebuilds the table only if test_metrics
+gained or lost rows since the last build. On MySQL the build goes into a
+staging table at READ COMMITTED (no shared locks on the test_metrics rows the
+workers keep inserting) and is swapped in with RENAME TABLE, so readers never
+wait on it or see a partial table. A listing therefore reflects new test
+metrics after at most one refresh interval.
+
+Each page is one query on strategy_rankings returning only the rows it
+displays:
+
+- rank filter: rn <= rank;
+- search on set_file_name, done by the database:
+    contains  LIKE '%term%'  (substring, case-insensitive like before; the default)
+    prefix    LIKE 'term%'   (can use ix_strategy_rankings_set_file_name)
+    fulltext  MATCH ... AGAINST in boolean mode (needs a FULLTEXT index)
+  chosen by STRATEGY_SEARCH_MODE;
+- keyset pagination: rows after the last row of the previous page by the
+  sort key columns plus metric_id as tie-breaker (no OFFSET).
+
+Small ranks (the default 1 is about one row per symbol) are served by
+ix_strategy_rankings_rn: pages and counts touch only the rows with
+rn <= rank and sort those. For wide ranks the database can walk the sort's own
+index instead (stored keys with NULLs replaced so they sort last and
+descending columns negated), where most rows it reads qualify. Either way the
+cost follows the number of rows within the rank, not the size of the table.
+The total is a separate COUNT(*) the caller can cache.
+
+Optional FULLTEXT index (MySQL):
+    CREATE FULLTEXT INDEX ftx_strategy_rankings_set_file_name ON strategy_rankings (set_file_name);
+"""
+from dataclasses import dataclass
+
+import pandas as pd
+from sqlalchemy import text
+
+import config
+from db.db_models import StrategyRanking
+
+COLUMNS = [
+    "metric_id", "set_file_name", "symbol", "net_profit", "max_drawdown", "total_trades",
+    "recovery_factor", "weighted_score", "normalized_total_distance_to_good", "win_rate",
+    "profit_factor", "expected_payoff", "status", "criteria_reason", "created_at",
+]
+
+# name -> ((column, "asc" | "desc"), ...); metric_id is appended as the tie-breaker.
+SORTS = {
+    "rank": (("normalized_total_distance_to_good", "asc"), ("weighted_score", "desc")),
+    "score": (("weighted_score", "desc"),),
+    "net_profit": (("net_profit", "desc"),),
+    "profit_factor": (("profit_factor", "desc"),),
+    "win_rate": (("win_rate", "desc"),),
+    "max_drawdown": (("max_drawdown", "asc"),),
+    "newest": (("created_at", "desc"),),
+}
+SEARCH_MODES = ("contains", "prefix", "fulltext")
+# column -> direction of its stored key; one per column, so each key serves every sort using it.
+_KEY_DIRECTIONS = {col: direction for keys in SORTS.values() for col, direction in keys if col != "created_at"}
+
+RANKED_SQL = """
+    SELECT
+      id AS metric_id, set_file_name, symbol, net_profit, max_drawdown, total_trades,
+      recovery_factor, weighted_score, normalized_total_distance_to_good, win_rate,
+      profit_factor, expected_payoff, criteria_passed AS status, criteria_reason, created_at,
+      ROW_NUMBER() OVER (
+        PARTITION BY symbol
+        ORDER BY normalized_total_distance_to_good, weighted_score DESC
+      ) AS rn
+    FROM v_test_metrics_scored
+"""
+RANKINGS_TABLE = StrategyRanking.__tablename__
+_STAGING_TABLE = f"{RANKINGS_TABLE}_new"
+_RETIRED_TABLE = f"{RANKINGS_TABLE}_old"
+
+
+@dataclass
+class StrategyPage:
+    rows: pd.DataFrame
+    cursor: dict = None        # pass as `after` to fetch the next page; None on the last page
+    sort: str = "rank"
+
+
+def _key_expr(col):
+    # NULLs sort last; keyset comparisons cannot handle NULL.
+    if _KEY_DIRECTIONS[col] == "asc":
+        return f"COALESCE({col}, 1e300)"
+    return f"-COALESCE({col}, -1e300)"
+
+
+def ensure_strategy_rankings(engine):
+    """Create strategy_rankings if missing (empty until the supervisor's first build)."""
+    StrategyRanking.__table__.create(engine, checkfirst=True)
+
+
+def rankings_version(conn):
+    """(row count, max id) of test_metrics; changes whenever metrics are added or removed."""
+    count, max_id = conn.execute(text("SELECT COUNT(*), MAX(id) FROM test_metrics")).one()
+    return int(count or 0), int(max_id or 0)
+
+
+def _insert_ranked(conn, table):
+    keys = list(_KEY_DIRECTIONS)
+    conn.execute(text(f"""
+        INSERT INTO {table} ({', '.join(COLUMNS)}, rn, {', '.join(f'key_{c}' for c in keys)})
+        SELECT {', '.join(COLUMNS)}, rn, {', '.join(_key_expr(c) for c in keys)}
+        FROM ({RANKED_SQL}) AS rank_metrics
+    """))
+
+
+def refresh_strategy_rankings(conn):
+    """
+    Rebuild strategy_rankings from v_test_metrics_scored; returns the row count.
+    MySQL builds a staging copy and swaps it in with RENAME TABLE; other
+    databases (the SQLite tests) DELETE and INSERT in the caller's transaction.
+    """
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"DROP TABLE IF EXISTS {_STAGING_TABLE}"))
+        conn.execute(text(f"CREATE TABLE {_STAGING_TABLE} LIKE {RANKINGS_TABLE}"))
+        _insert_ranked(conn, _STAGING_TABLE)
+        conn.execute(text(
+            f"RENAME TABLE {RANKINGS_TABLE} TO {_RETIRED_TABLE}, {_STAGING_TABLE} TO {RANKINGS_TABLE}"
+        ))
+        conn.execute(text(f"DROP TABLE {_RETIRED_TABLE}"))
+    else:
+        conn.execute(text(f"DELETE FROM {RANKINGS_TABLE}"))
+        _insert_ranked(conn, RANKINGS_TABLE)
+    return int(conn.execute(text(f"SELECT COUNT(*) FROM {RANKINGS_TABLE}")).scalar() or 0)
+
+
+def update_strategy_rankings(engine, built_version=None):
+    """Rebuild strategy_rankings unless test_metrics is still at `built_version`; returns the current version."""
+    with engine.connect() as conn:
+        if conn.dialect.name == "mysql":
+            # INSERT ... SELECT takes no shared locks on the source rows at this level.
+            conn.execution_options(isolation_level="READ COMMITTED")
+        version = rankings_version(conn)
+        if version != built_version:
+            refresh_strategy_rankings(conn)
+        conn.commit()
+    return version
+
+
+def _sort_keys(sort):
+    """([(cursor name, stored column)], direction); metric_id last, all keys in one direction."""
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort {sort!r}; expected one of {sorted(SORTS)}")
+    keys = [
+        (f"k{i}", col if col == "created_at" else f"key_{col}")
+        for i, (col, _) in enumerate(SORTS[sort])
+    ]
+    keys.append(("k_id", "metric_id"))
+    return keys, "desc" if sort == "newest" else "asc"
+
+
+def _search_clause(search, mode):
+    search = (search or "").strip()
+    if not search:
+        return "", {}
+    mode = mode or config.STRATEGY_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; expected one of {SEARCH_MODES}")
+    if mode == "fulltext":
+        return "MATCH(set_file_name) AGAINST (:search IN BOOLEAN MODE)", {"search": search}
+    escaped = search.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    pattern = f"{escaped}%" if mode == "prefix" else f"%{escaped}%"
+    return "set_file_name LIKE :search ESCAPE '!'", {"search": pattern}
+
+
+def _keyset_clause(keys, direction, after):
+    """(k0, k1, ..., metric_id) strictly after the cursor, as one row comparison the index can seek to."""
+    op = ">" if direction == "asc" else "<"
+    columns = ", ".join(col for _, col in keys)
+    values = ", ".join(f":after_{name}" for name, _ in keys)
+    params = {f"after_{name}": after[name] for name, _ in keys}
+    return f"({columns}) {op} ({values})", params
+
+
+def _where(user_rank, search, search_mode):
+    clauses, params = [], {}
+    if user_rank:
+        clauses.append("rn <= :user_rank")
+        params["user_rank"] = int(user_rank)
+    search_sql, search_params = _search_clause(search, search_mode)
+    if search_sql:
+        clauses.append(search_sql)
+        params.update(search_params)
+    return clauses, params
+
+
+def fetch_strategy_page(conn, user_rank=1, search="", sort="rank", page_size=20, after=None, search_mode=None):
+    """
+    One page of ranked strategies. `conn` is a Connection or Session;
+    `after` is the cursor of the previous page (None for the first page).
+    """
+    keys, direction = _sort_keys(sort)
+    clauses, params = _where(user_rank, search, search_mode)
+    if after:
+        keyset_sql, keyset_params = _keyset_clause(keys, direction, after)
+        clauses.append(keyset_sql)
+        params.update(keyset_params)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order = ", ".join(f"{col} {direction.upper()}" for _, col in keys)
+    select_keys = ", ".join(f"{col} AS {name}" for name, col in keys)
+    sql = text(f"""
+        SELECT {', '.join(COLUMNS)}, {select_keys}
+        FROM {RANKINGS_TABLE}
+        {where}
+        ORDER BY {order}
+        LIMIT :limit
+    """)
+    params["limit"] = int(page_size) + 1
+    result = conn.execute(sql, params)
+    df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+    cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        cursor = {name: _plain(last[name]) for name, _ in keys}
+    rows = df.drop(columns=[name for name, _ in keys]).reset_index(drop=True)
+    return StrategyPage(rows=rows, cursor=cursor, sort=sort)
+
+
+def count_strategies(conn, user_rank=1, search="", search_mode=None):
+    clauses, params = _where(user_rank, search, search_mode)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = text(f"SELECT COUNT(*) FROM {RANKINGS_TABLE} {where}")
+    return int(conn.execute(sql, params).scalar() or 0)
+
+
+def load_ranked_strategies(conn, user_rank=1):
+    """Every strategy with rank <= user_rank (for callers that need the whole list)."""
+    clauses, params = _where(user_rank, "", None)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = text(f"""
+        SELECT {', '.join(COLUMNS)} FROM {RANKINGS_TABLE}
+        {where}
+        ORDER BY key_normalized_total_distance_to_good, key_weighted_score, metric_id
+    """)
+    result = conn.execute(sql, params)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def _plain(value):
+    # Cursor values go back into bind parameters and st.session_state.
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
@@ -0,0 +1,138 @@
+"""
+Task state machine for controller_tasks.
+
+Every status change is a plain read of the current status followed by a
+conditional UPDATE:
+
+    UPDATE controller_tasks SET status = :to, <fields...>
+    WHERE id = :id AND status = :current   -- :current allowed to move to :to
+
+so the controller, supervisor and worker never hold a row lock across a
+SELECT ... FOR UPDATE / commit round trip. A transition that loses a race (the
+row has already moved on) matches no row and returns False instead of
+overwriting the other process's state. The applied transition is appended to
+the transition log of the monitoring rollups (db/rollups.py) in the same
+transaction and published to the live telemetry stream (telemetry.py) once it
+commits. Attempt and heartbeat fields also update the job list summary
+(db/job_summary.py) just before the commit.
+
+Legal transitions come from TASK_TRANSITIONS in db/status_constants.py. These
+functions do not commit; callers commit once for everything they changed.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.orm.util import identity_key
+
+from db.db_models import ControllerTask, ControllerAttempt
+from db.status_constants import (
+    ALL_TASK_STATUSES, TASK_TRANSITIONS, TASK_TRANSITION_SOURCES,
+    STATUS_WORKER_IN_PROGRESS,
+)
+from db.rollups import record_transition
+from db.job_summary import task_fields_changed
+from telemetry import task_changed
+
+
+class IllegalTransition(ValueError):
+    """Raised when a requested status change is not in TASK_TRANSITIONS."""
+
+
+def can_transition(from_status, to_status):
+    return to_status in TASK_TRANSITIONS.get(from_status, ())
+
+
+def _expire_cached(session, model, pk):
+    # Bulk UPDATEs bypass the identity map; make loaded objects reload on next access.
+    obj = session.identity_map.get(identity_key(model, pk))
+    if obj is not None:
+        session.expire(obj)
+
+
+def transition_task(session, task_id, to_status, expected_status=None, **fields):
+    """
+    Move a task to `to_status`, setting any extra column `fields` (for example
+    assigned_worker, last_error, last_heartbeat or a SQL expression such as
+    ControllerTask.attempt_count + 1) in the same statement.
+
+    - expected_status: the status the caller last saw. The update then only
+      applies if the task is still in exactly that status. Without it, any
+      status that may legally move to `to_status` is accepted.
+
+    Returns True if the task was updated, False if it was not in an allowed
+    status (or does not exist). Raises IllegalTransition for transitions that
+    can never be legal.
+    """
+    if to_status not in ALL_TASK_STATUSES:
+        raise IllegalTransition(f"Unknown task status {to_status!r}")
+    if expected_status is not None:
+        if not can_transition(expected_status, to_status):
+            raise IllegalTransition(f"Task {task_id}: {expected_status!r} -> {to_status!r} is not allowed")
+        sources = [expected_status]
+    else:
+        sources = sorted(TASK_TRANSITION_SOURCES[to_status])
+
+    # Read the current status, then apply the UPDATE only if it is still that
+    # status (compare-and-set), so the transition log knows exactly which
+    # transition happened. A concurrent change makes the UPDATE match nothing
+    # and the call returns False. It is not retried: under REPEATABLE READ a
+    # re-read in the same transaction would return the same stale snapshot.
+    current = session.execute(
+        select(ControllerTask.status, ControllerTask.updated_at, ControllerTask.job_id).where(ControllerTask.id == task_id)
+    ).first()
+    if current is None or current.status not in sources:
+        return False
+    now = datetime.utcnow()
+    values = {"updated_at": now, **fields, "status": to_status}
+    result = session.execute(
+        update(ControllerTask)
+        .where(ControllerTask.id == task_id, ControllerTask.status == current.status)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    waited = (now - current.updated_at).total_seconds() if current.updated_at else None
+    record_transition(session.connection(), current.status, to_status, waited, at=now)
+    task_changed(session, task_id, current.status, to_status,
+                 worker=fields.get("assigned_worker"), error=fields.get("last_error"))
+    task_fields_changed(session, task_id, fields, job_id=current.job_id)
+    _expire_cached(session, ControllerTask, task_id)
+    return True
+
+
+def touch_task(session, task_id, status=STATUS_WORKER_IN_PROGRESS, **fields):
+    """
+    Update `fields` on a task without changing its status, only while it is
+    still in `status`. Defaults to refreshing the worker heartbeat.
+    Returns True if the task was updated.
+    """
+    values = fields or {"last_heartbeat": datetime.utcnow()}
+    result = session.execute(
+        update(ControllerTask)
+        .where(ControllerTask.id == task_id, ControllerTask.status == status)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    _expire_cached(session, ControllerTask, task_id)
+    if result.rowcount != 1:
+        return False
+    task_fields_changed(session, task_id, values)
+    return True
+
+
+def close_attempt(session, attempt_id, status, error_message=None, result_json=None):
+    """Record the outcome of an attempt once; returns False if it was already finished."""
+    result = session.execute(
+        update(ControllerAttempt)
+        .where(ControllerAttempt.id == attempt_id, ControllerAttempt.finished_at.is_(None))
+        .values(
+            status=status,
+            finished_at=datetime.utcnow(),
+            error_message=error_message,
+            result_json=result_json,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    _expire_cached(session, ControllerAttempt, attempt_id)
+    return result.rowcount == 1
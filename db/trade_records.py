@@ -0,0 +1,123 @@
+"""
+Column-level access to trade_records for analytics.
+
+Portfolio analysis only needs (test_metrics_id, close_time, profit), so trades
+are fetched for all requested strategies in one SELECT of those three columns
+(no ORM objects) and split into per-strategy NumPy arrays.
+
+Trade records never change once a strategy's results are synced, so arrays are
+cached per test_metrics_id (LRU, TRADE_CACHE_MAX_STRATEGIES entries) and only
+the ids not yet cached hit the database. Strategies with no trades yet are not
+cached, so a later sync is picked up.
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+import config
+from db.db_models import TradeRecord, PortfolioSet
+
+
+class TradeArrays(NamedTuple):
+    close_time: np.ndarray  # datetime64[s], ascending
+    profit: np.ndarray      # float64
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(test_metrics_id):
+    with _cache_lock:
+        arrays = _cache.get(test_metrics_id)
+        if arrays is not None:
+            _cache.move_to_end(test_metrics_id)
+        return arrays
+
+
+def _cache_put(test_metrics_id, arrays):
+    with _cache_lock:
+        _cache[test_metrics_id] = arrays
+        _cache.move_to_end(test_metrics_id)
+        while len(_cache) > config.TRADE_CACHE_MAX_STRATEGIES:
+            _cache.popitem(last=False)
+
+
+def clear_trade_cache(test_metrics_ids=None):
+    """Drop cached arrays (all, or for the given strategies), e.g. after a re-sync."""
+    with _cache_lock:
+        if test_metrics_ids is None:
+            _cache.clear()
+        else:
+            for tm_id in test_metrics_ids:
+                _cache.pop(tm_id, None)
+
+
+def _empty():
+    return TradeArrays(np.empty(0, dtype="datetime64[s]"), np.empty(0, dtype=np.float64))
+
+
+def _fetch(session, test_metrics_ids):
+    stmt = (
+        select(TradeRecord.test_metrics_id, TradeRecord.close_time, TradeRecord.profit)
+        .where(TradeRecord.test_metrics_id.in_(test_metrics_ids))
+        .where(TradeRecord.profit.isnot(None))
+        .order_by(TradeRecord.test_metrics_id, TradeRecord.close_time)
+    )
+    rows = session.execute(stmt).all()
+    if not rows:
+        return {}
+    ids, times, profits = zip(*rows)
+    ids = np.asarray(ids, dtype=np.int64)
+    times = pd.to_datetime(pd.Series(times)).to_numpy(dtype="datetime64[s]")
+    profits = np.asarray(profits, dtype=np.float64)
+    # Rows are ordered by strategy, so each strategy is one contiguous slice.
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)]
+    return {int(ids[s]): TradeArrays(times[s:e], profits[s:e]) for s, e in zip(starts, ends)}
+
+
+def load_trade_arrays(session, test_metrics_ids):
+    """{test_metrics_id: TradeArrays} for every requested id (empty arrays if it has no trades)."""
+    result, missing = {}, []
+    for tm_id in dict.fromkeys(int(i) for i in test_metrics_ids):
+        arrays = _cache_get(tm_id)
+        if arrays is None:
+            missing.append(tm_id)
+        else:
+            result[tm_id] = arrays
+    if missing:
+        fetched = _fetch(session, missing)
+        for tm_id in missing:
+            arrays = fetched.get(tm_id)
+            if arrays is None:
+                result[tm_id] = _empty()
+                continue
+            _cache_put(tm_id, arrays)
+            result[tm_id] = arrays
+    return result
+
+
+def portfolio_strategy_ids(session, portfolio_id):
+    stmt = select(PortfolioSet.test_metrics_id).where(PortfolioSet.portfolio_id == portfolio_id)
+    return [row[0] for row in session.execute(stmt).all()]
+
+
+def load_portfolio_trades(session, portfolio_id):
+    """TradeArrays for every strategy in the portfolio, in one query for the uncached ones."""
+    return load_trade_arrays(session, portfolio_strategy_ids(session, portfolio_id))
+
+
+def trades_frame(trade_arrays):
+    """Long DataFrame (strategy, close_time, profit) of the trades with a close time."""
+    frames = [
+        pd.DataFrame({"strategy": tm_id, "close_time": arrays.close_time, "profit": arrays.profit})
+        for tm_id, arrays in trade_arrays.items() if len(arrays.profit)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=["strategy", "close_time", "profit"])
+    return pd.concat(frames, ignore_index=True).dropna(subset=["close_time"])
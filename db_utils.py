@@ -1,9 +1,11 @@
 import os
 import sys
+import json
 import time
+import random
 import logging
-from sqlalchemy import create_engine, and_, text
-from sqlalchemy.orm import sessionmaker, joinedload
+from sqlalchemy import and_, text, update
+from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import OperationalError
 import pandas as pd
 from datetime import datetime, timedelta
@@ -20,8 +22,11 @@ from db.status_constants import (
     STATUS_WORKER_FAILED, STATUS_RETRYING, STATUS_FINE_TUNING, STATUS_COMPLETED_SUCCESS,
     STATUS_COMPLETED_PARTIAL, STATUS_FAILED,
 )
+from db.connection import get_engine, get_sessionmaker, session_scope
+from db.task_state import transition_task, touch_task, close_attempt
+import query_cache  # registers the session hooks that invalidate dashboard caches on commit
 from config import (
-    SQLALCHEMY_DATABASE_URL, SYMBOL_CSV_PATH, LOCK_RETRY_COUNT, LOCK_RETRY_SLEEP
+    SYMBOL_CSV_PATH, LOCK_RETRY_COUNT, LOCK_RETRY_SLEEP
 )
 
 # Import the actual set file field extractor
@@ -30,28 +35,32 @@ if MT4_OPTIMIZER_PATH and MT4_OPTIMIZER_PATH not in sys.path:
     sys.path.append(MT4_OPTIMIZER_PATH)
 import extract_setfilename_fields
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600  # Optional
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = get_engine()
+SessionLocal = get_sessionmaker()
 
 SYMBOL_LIST = extract_setfilename_fields.load_symbol_list(SYMBOL_CSV_PATH)
 
 def get_db():
+    """
+    Return a new session. The caller must close it (`with get_db() as session:`);
+    prefer session_scope(), which also commits or rolls back.
+    """
     return SessionLocal()
 
 def safe_commit(session):
+    """
+    Commit, retrying lock wait timeouts and deadlocks with exponential backoff
+    and full jitter so competing services do not retry in lockstep.
+    """
     for attempt in range(LOCK_RETRY_COUNT):
         try:
             session.commit()
             return
         except OperationalError as e:
             logging.error(f"DB commit failed (attempt {attempt+1}/{LOCK_RETRY_COUNT}): {e}")
-            if "Lock wait timeout exceeded" in str(e):
+            if "Lock wait timeout exceeded" in str(e) or "Deadlock found" in str(e):
                 session.rollback()
-                time.sleep(LOCK_RETRY_SLEEP * (attempt + 1))
+                time.sleep(random.uniform(0, LOCK_RETRY_SLEEP * (2 ** attempt)))
             else:
                 raise
     raise RuntimeError("Failed to commit after lock timeout retries.")
@@ -177,19 +186,24 @@ def update_job_status(session, job_id):
         safe_commit(session)
 
 def update_task_status(session, task_id, status, assigned_worker=None):
-    task = session.query(ControllerTask).filter(ControllerTask.id == task_id).with_for_update().first()
-    if task:
-        task.status = status
-        if assigned_worker is not None:
-            task.assigned_worker = assigned_worker
-        task.updated_at = datetime.utcnow()
-        safe_commit(session)
+    """
+    Move a task to `status` if the transition is legal from its current status.
+    Returns False (and changes nothing) if another process moved it first.
+    """
+    fields = {"assigned_worker": assigned_worker} if assigned_worker is not None else {}
+    if status == STATUS_WORKER_IN_PROGRESS:
+        fields["last_heartbeat"] = datetime.utcnow()
+    applied = transition_task(session, task_id, status, **fields)
+    safe_commit(session)
+    if not applied:
+        logging.warning(f"Task {task_id} was not moved to {status}: not in a status that allows it.")
+    return applied
 
 def update_task_worker_job(session, task_id, worker_job_id):
-    task = session.query(ControllerTask).filter(ControllerTask.id == task_id).with_for_update().first()
-    if task:
-        task.worker_job_id = worker_job_id
-        safe_commit(session)
+    session.execute(
+        update(ControllerTask).where(ControllerTask.id == task_id).values(worker_job_id=worker_job_id)
+    )
+    safe_commit(session)
 
 def create_attempt(session, task_id, status=STATUS_WORKER_IN_PROGRESS):
     last_attempt = session.query(ControllerAttempt).filter(
@@ -207,19 +221,30 @@ def create_attempt(session, task_id, status=STATUS_WORKER_IN_PROGRESS):
     return attempt.id
 
 def finish_attempt(session, attempt_id, status, error_message=None, result_json=None):
-    attempt = session.query(ControllerAttempt).filter(ControllerAttempt.id == attempt_id).with_for_update().first()
-    if attempt:
-        attempt.status = status
-        attempt.finished_at = datetime.utcnow()
-        attempt.error_message = error_message
-        attempt.result_json = result_json
-        safe_commit(session)
+    close_attempt(session, attempt_id, status, error_message, result_json)
+    safe_commit(session)
+
+def finish_worker_task(session, task_id, attempt_id, status, error_message=None, result_json=None, worker_job_id=None):
+    """
+    Worker finalization in one transaction: moves the task out of
+    worker_in_progress (with heartbeat and worker_job_id in the same UPDATE)
+    and closes the attempt. Returns False if the task was no longer in progress
+    (e.g. the supervisor already requeued or failed it); the attempt is closed
+    either way.
+    """
+    fields = {"last_heartbeat": datetime.utcnow()}
+    if worker_job_id is not None:
+        fields["worker_job_id"] = worker_job_id
+    applied = transition_task(session, task_id, status, expected_status=STATUS_WORKER_IN_PROGRESS, **fields)
+    close_attempt(session, attempt_id, status, error_message, result_json)
+    safe_commit(session)
+    return applied
 
 def update_task_heartbeat(session, task_id):
-    task = session.query(ControllerTask).filter(ControllerTask.id == task_id).with_for_update().first()
-    if task:
-        task.last_heartbeat = datetime.utcnow()
-        safe_commit(session)
+    """Refresh last_heartbeat while the task is still worker_in_progress; False otherwise."""
+    alive = touch_task(session, task_id)
+    safe_commit(session)
+    return alive
 
 def get_stuck_tasks(session, threshold_minutes=60):
     cutoff = datetime.utcnow() - timedelta(minutes=threshold_minutes)
@@ -233,12 +258,11 @@ def requeue_task(session, task):
     Sets a stuck task's status to 'retrying' and updates its timestamp.
     Does NOT increment attempt_count.
     Only the controller should increment attempt_count when actually queuing to worker.
+    Returns False if the task has meanwhile reached a status that cannot be retried.
     """
-    locked_task = session.query(ControllerTask).filter(ControllerTask.id == task.id).with_for_update().first()
-    if locked_task and locked_task.status != "failed":
-        locked_task.status = "retrying"
-        locked_task.updated_at = datetime.utcnow()
-        safe_commit(session)
+    applied = transition_task(session, task.id, STATUS_RETRYING)
+    safe_commit(session)
+    return applied
 
 def get_inactive_workers(session, threshold_minutes=5):
     cutoff = datetime.utcnow() - timedelta(minutes=threshold_minutes)
@@ -449,6 +473,11 @@ def extract_symbol_code(symbol):
     return symbol.split()[0] if symbol else symbol
 
 def get_portfolio_currency_correlation(session, portfolio_id, timeframe='H1'):
+    """
+    Pairwise correlations between the portfolio's symbols as rows of
+    (symbol1, symbol2, correlation), in both orders and including the diagonal.
+    Correlation_Matrix stores only the upper triangle (symbol1 < symbol2).
+    """
     symbols = get_portfolio_symbols(session, portfolio_id)
     # Clean symbols to just the code
     symbols = [extract_symbol_code(s) for s in symbols]
@@ -462,11 +491,60 @@ def get_portfolio_currency_correlation(session, portfolio_id, timeframe='H1'):
         SELECT symbol1, symbol2, correlation
         FROM Correlation_Matrix
         WHERE timeframe = :tf
+        AND symbol1 < symbol2
         AND symbol1 IN ({placeholders}) AND symbol2 IN ({placeholders})
     """)
-    result = session.execute(sql, params)
-    rows = result.fetchall()
-    return pd.DataFrame(rows, columns=["symbol1", "symbol2", "correlation"])
+    upper = pd.DataFrame(session.execute(sql, params).fetchall(), columns=["symbol1", "symbol2", "correlation"])
+    # Every portfolio symbol correlates 1.0 with itself, stored pairs or not.
+    unique = sorted(set(symbols))
+    diagonal = pd.DataFrame({"symbol1": unique, "symbol2": unique, "correlation": 1.0})
+    if upper.empty:
+        return diagonal
+    lower = upper.rename(columns={"symbol1": "symbol2", "symbol2": "symbol1"})
+    return pd.concat([upper, lower[upper.columns], diagonal], ignore_index=True)
+
+def get_pip_values(session, symbols, lot_size, account_ccy='USD'):
+    """
+    {symbol: pip value} at lot_size from the latest pip_values grid. A lot
+    size outside the grid is scaled from the nearest stored one (pip values
+    are linear in lot size).
+    """
+    if not symbols:
+        return {}
+    placeholders = ','.join([':s' + str(i) for i in range(len(symbols))])
+    params = {f's{i}': symbol for i, symbol in enumerate(symbols)}
+    params.update({'acct': account_ccy})
+    sql = text(f"""
+        SELECT p.ccy_pair, p.lot_size, p.pip_value
+        FROM pip_values p
+        JOIN (
+            SELECT ccy_pair, MAX(value_date) AS value_date
+            FROM pip_values
+            WHERE account_ccy = :acct AND ccy_pair IN ({placeholders})
+            GROUP BY ccy_pair
+        ) latest ON latest.ccy_pair = p.ccy_pair AND latest.value_date = p.value_date
+        WHERE p.account_ccy = :acct
+    """)
+    best = {}
+    for pair, stored_lot, pip_value in session.execute(sql, params).fetchall():
+        stored_lot, pip_value = float(stored_lot), float(pip_value)
+        distance = abs(stored_lot - lot_size)
+        if pair not in best or distance < best[pair][0]:
+            best[pair] = (distance, pip_value * lot_size / stored_lot)
+    return {pair: value for pair, (_, value) in best.items()}
+
+def save_position_sizing_result(session, portfolio_id, method, input_params, result_summary, simulation_blob=None, job_id=None):
+    result = PositionSizingResult(
+        job_id=job_id,
+        portfolio_id=portfolio_id,
+        method=method,
+        input_params_json=json.dumps(input_params),
+        result_summary_json=json.dumps(result_summary),
+        simulation_blob=simulation_blob,
+    )
+    session.add(result)
+    safe_commit(session)
+    return result
 
 def aggregate_correlation(df):
     if df.empty:
@@ -0,0 +1,93 @@
+"""
+OpenRouter chat-completions client shared by the AI features.
+
+Pages do not call it directly any more: they enqueue requests with ai_queue.py
+and the AI worker (ai_worker/main.py) sends them. Everything about the HTTP
+call lives here: payload shape, timeout, which failures are worth retrying
+and how the answer is extracted.
+
+OPENROUTER_URL can point at the local mock (python -m ai_worker.mock_openrouter)
+for testing without an API key or network access.
+"""
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+DEFAULT_MODEL = "gpt-4o"
+# Rate limits and server-side failures; other 4xx (bad key, bad payload) fail at once.
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class OpenRouterError(Exception):
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def chat_payload(prompt, model=DEFAULT_MODEL, system=None, images=(), **options):
+    """Request body for one user prompt (optionally with a system prompt and base64 PNG images)."""
+    if images:
+        content = [{"type": "text", "text": prompt}] + [
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img}"}} for img in images
+        ]
+    else:
+        content = prompt
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": content})
+    return {"model": model, "messages": messages, **options}
+
+
+def http_session(pool_size=None):
+    """requests.Session with a connection pool sized for the worker's concurrency (keep-alive reuse)."""
+    pool_size = pool_size or config.AI_WORKER_CONCURRENCY
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def complete(payload, api_key, session=None, timeout=None):
+    """Send one chat completion and return the message content; raises OpenRouterError."""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": config.OPENROUTER_REFERER,
+    }
+    try:
+        response = (session or requests).post(
+            config.OPENROUTER_URL, headers=headers, json=payload,
+            timeout=timeout or config.AI_REQUEST_TIMEOUT_SECONDS,
+        )
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise OpenRouterError(f"Request failed: {e}", retryable=True) from e
+    if response.status_code != 200:
+        raise OpenRouterError(
+            f"Error from OpenRouter: {response.status_code} - {response.text[:500]}",
+            status=response.status_code,
+            retryable=response.status_code in RETRY_STATUSES,
+            retry_after=_retry_after(response),
+        )
+    try:
+        return response.json()["choices"][0]["message"]["content"]
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        raise OpenRouterError(f"Failed to parse AI response: {e}") from e
+
+
+def backoff_seconds(attempt, error=None):
+    """Exponential backoff with full jitter, or the server's Retry-After if it sent one."""
+    if error is not None and error.retry_after:
+        return min(error.retry_after, config.AI_RETRY_MAX_SECONDS)
+    return random.uniform(0, min(config.AI_RETRY_MAX_SECONDS, config.AI_RETRY_BASE_SECONDS * 2 ** attempt))
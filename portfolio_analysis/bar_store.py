@@ -0,0 +1,203 @@
+"""
+Columnar, memory-mapped store for exported bar data.
+
+Each Dukascopy export (Dukascopy-{pair}-{start}-{end}-bardata_{tf}.csv) is
+parsed once and appended to per-column binary files:
+
+    BAR_STORE_DIR/{timeframe}/{pair}/time.i8     epoch seconds (int64, ascending)
+    BAR_STORE_DIR/{timeframe}/{pair}/close.f8    float64 (likewise open/high/low/volume)
+    BAR_STORE_DIR/{timeframe}/{pair}/manifest.json
+
+The manifest records the committed row count and the export files already
+ingested; readers only look at the first `rows` values of each column, so a
+crash mid-append never exposes partial data. Reads are np.memmap slices located
+with a binary search on the time column, so range and last-value lookups cost
+no CSV parsing at all.
+"""
+import os
+import sys
+import glob
+import json
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+COLUMNS = {
+    "time": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+}
+CSV_COLUMNS = {"Open": "open", "High": "high", "Low": "low", "Close": "close", "Tick volume": "volume"}
+DATE_FORMAT = "%Y.%m.%d"
+
+
+def export_file_name(pair, start_date, end_date, timeframe="H1"):
+    return f"Dukascopy-{pair}-{start_date}-{end_date}-bardata_{timeframe}.csv"
+
+
+def _to_epoch(value):
+    """datetime / Timestamp / 'YYYY.MM.DD' string -> epoch seconds (UTC-naive)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.strptime(value, DATE_FORMAT)
+    return int((pd.Timestamp(value) - pd.Timestamp(0)) // pd.Timedelta(seconds=1))
+
+
+def parse_export_csv(csv_path):
+    """Parse one export into {column: ndarray}, sorted by time."""
+    df = pd.read_csv(csv_path, sep=",", skipinitialspace=True)
+    df.columns = df.columns.str.strip()
+    stamps = pd.to_datetime(df["Date"].str.strip() + " " + df["Time"].str.strip(), format="%Y.%m.%d %H:%M:%S")
+    data = {"time": stamps.to_numpy(dtype="datetime64[s]").astype(np.int64)}
+    for src, dst in CSV_COLUMNS.items():
+        data[dst] = df[src].to_numpy(dtype=np.float64) if src in df.columns else np.full(len(df), np.nan)
+    order = np.argsort(data["time"], kind="stable")
+    return {k: v[order] for k, v in data.items()}
+
+
+class BarStore:
+    def __init__(self, root=None):
+        self.root = root or config.BAR_STORE_DIR
+        self._lock = threading.Lock()
+
+    # --- layout / manifest ---
+    def _dir(self, pair, timeframe):
+        return os.path.join(self.root, timeframe, pair)
+
+    def _manifest_path(self, pair, timeframe):
+        return os.path.join(self._dir(pair, timeframe), "manifest.json")
+
+    def manifest(self, pair, timeframe="H1"):
+        path = self._manifest_path(pair, timeframe)
+        if not os.path.exists(path):
+            return {"rows": 0, "first": None, "last": None, "sources": {}}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, pair, timeframe, manifest):
+        path = self._manifest_path(pair, timeframe)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+
+    def _column_path(self, pair, timeframe, column):
+        suffix = "i8" if COLUMNS[column] is np.int64 else "f8"
+        return os.path.join(self._dir(pair, timeframe), f"{column}.{suffix}")
+
+    def _column(self, pair, timeframe, column, rows):
+        if rows == 0:
+            return np.empty(0, dtype=COLUMNS[column])
+        return np.memmap(self._column_path(pair, timeframe, column), dtype=COLUMNS[column], mode="r", shape=(rows,))
+
+    # --- writes ---
+    def append(self, pair, bars, timeframe="H1", source=None):
+        """
+        Append bars ({column: ndarray} with ascending 'time'); rows not newer
+        than the last stored bar are skipped. Returns the number of rows added.
+        """
+        with self._lock:
+            os.makedirs(self._dir(pair, timeframe), exist_ok=True)
+            manifest = self.manifest(pair, timeframe)
+            rows = manifest["rows"]
+            keep = slice(None)
+            if manifest["last"] is not None:
+                keep = slice(int(np.searchsorted(bars["time"], manifest["last"], side="right")), None)
+            new = {col: np.ascontiguousarray(bars[col][keep], dtype=dtype) for col, dtype in COLUMNS.items()}
+            added = len(new["time"])
+            if added:
+                for col, values in new.items():
+                    path = self._column_path(pair, timeframe, col)
+                    with open(path, "ab") as f:
+                        # Drop bytes past the committed row count left by an interrupted append.
+                        f.truncate(rows * values.itemsize)
+                        f.write(values.tobytes())
+                manifest["rows"] = rows + added
+                manifest["last"] = int(new["time"][-1])
+                if manifest["first"] is None:
+                    manifest["first"] = int(new["time"][0])
+            if source:
+                manifest["sources"][os.path.basename(source)] = _file_signature(source)
+            self._write_manifest(pair, timeframe, manifest)
+            return added
+
+    def ingest_csv(self, pair, csv_path, timeframe="H1"):
+        """Parse an export and append the bars newer than what is stored."""
+        return self.append(pair, parse_export_csv(csv_path), timeframe=timeframe, source=csv_path)
+
+    def sync_exports(self, export_dir=None, pairs=None, timeframe="H1"):
+        """
+        Ingest every export in `export_dir` not yet recorded (or changed since)
+        for the given pairs. Returns {pair: rows_added}.
+        """
+        export_dir = export_dir or config.EXPORT_DIR
+        added = {}
+        for pair in pairs if pairs is not None else config.CCY_PAIRS:
+            sources = self.manifest(pair, timeframe)["sources"]
+            pattern = os.path.join(export_dir, f"Dukascopy-{pair}-*-bardata_{timeframe}.csv")
+            # File names embed start/end dates, so name order is chronological.
+            for path in sorted(glob.glob(pattern)):
+                if sources.get(os.path.basename(path)) == _file_signature(path):
+                    continue
+                added[pair] = added.get(pair, 0) + self.ingest_csv(pair, path, timeframe)
+        return added
+
+    # --- reads ---
+    def read(self, pair, start=None, end=None, timeframe="H1", columns=("close",)):
+        """
+        Bars with start <= time <= end as a DataFrame indexed by datetime
+        (start/end: datetime or 'YYYY.MM.DD'; a date-only `end` includes the whole day).
+        Returns None if the pair has no stored bars.
+        """
+        rows = self.manifest(pair, timeframe)["rows"]
+        if rows == 0:
+            return None
+        times = self._column(pair, timeframe, "time", rows)
+        lo = 0 if start is None else int(np.searchsorted(times, _to_epoch(start), side="left"))
+        if end is None:
+            hi = rows
+        else:
+            end_epoch = _to_epoch(end) + (86399 if isinstance(end, str) else 0)
+            hi = int(np.searchsorted(times, end_epoch, side="right"))
+        index = pd.to_datetime(np.asarray(times[lo:hi]), unit="s")
+        data = {col: np.array(self._column(pair, timeframe, col, rows)[lo:hi]) for col in columns}
+        return pd.DataFrame(data, index=pd.Index(index, name="datetime"))
+
+    def close_series(self, pair, start=None, end=None, timeframe="H1"):
+        df = self.read(pair, start, end, timeframe=timeframe, columns=("close",))
+        return None if df is None else df["close"].rename("Close")
+
+    def last_close(self, pair, timeframe="H1"):
+        rows = self.manifest(pair, timeframe)["rows"]
+        if rows == 0:
+            return None
+        return float(self._column(pair, timeframe, "close", rows)[rows - 1])
+
+    def last_timestamp(self, pair, timeframe="H1"):
+        last = self.manifest(pair, timeframe)["last"]
+        return None if last is None else pd.Timestamp(last, unit="s").to_pydatetime()
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+_default_store = None
+
+
+def get_bar_store():
+    """Process-wide BarStore rooted at config.BAR_STORE_DIR."""
+    global _default_store
+    if _default_store is None:
+        _default_store = BarStore()
+    return _default_store
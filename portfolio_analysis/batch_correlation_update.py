@@ -1,78 +1,82 @@
 import os
 import sys
-import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+from datetime import datetime
+from sqlalchemy import column, table, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
 # Ensure project root is in sys.path so config.py can be imported
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from db.connection import get_engine
+from portfolio_analysis.bar_store import get_bar_store
+from portfolio_analysis.rolling_correlation import update_all
+from query_cache import invalidate as invalidate_cache, TAG_CORRELATION
 
-def get_date_range():
-    today = datetime.utcnow()
-    start = today - timedelta(days=config.CORRELATION_LOOKBACK_DAYS)
-    return start.strftime('%Y.%m.%d'), today.strftime('%Y.%m.%d')
+CORRELATION_TABLE = table(
+    "Correlation_Matrix",
+    column("symbol1"), column("symbol2"), column("timeframe"),
+    column("correlation"), column("date_calculated"),
+)
+UPSERT_CHUNK_ROWS = 1000
 
-def load_h1_data(pair, start_date, end_date):
-    file_name = f"Dukascopy-{pair}-{start_date}-{end_date}-bardata_H1.csv"
-    file_path = os.path.join(config.EXPORT_DIR, file_name)
-    if not os.path.exists(file_path):
-        print(f"[batch_correlation_update] WARNING: Missing exported data for {pair}: {file_path}")
-        return None
-    df = pd.read_csv(file_path, sep=",")
-    df.columns = df.columns.str.strip()
-    df['datetime'] = pd.to_datetime(df['Date'] + " " + df['Time'])
-    df.set_index('datetime', inplace=True)
-    return df['Close']
+def upper_triangle_rows(corr_matrix, timeframe, date_calculated):
+    """
+    One row per unordered pair (symbol1 < symbol2). The diagonal is always 1
+    and the lower half mirrors the upper, so neither is stored; readers
+    rebuild them (db_utils.get_portfolio_currency_correlation).
+    """
+    symbols = sorted(corr_matrix.columns)
+    values = corr_matrix.loc[symbols, symbols].to_numpy(dtype=float)
+    i, j = np.triu_indices(len(symbols), k=1)
+    return [
+        {
+            "symbol1": symbols[a],
+            "symbol2": symbols[b],
+            "timeframe": timeframe,
+            "correlation": float(values[a, b]),
+            "date_calculated": date_calculated,
+        }
+        for a, b in zip(i, j)
+        if np.isfinite(values[a, b])
+    ]
 
-def calc_log_returns(series):
-    return np.log(series / series.shift(1)).dropna()
-
-def calculate_correlation_matrix(close_dict):
-    returns_dict = {pair: calc_log_returns(close_dict[pair]) for pair in close_dict if close_dict[pair] is not None}
-    df = pd.DataFrame(returns_dict).dropna()
-    corr_matrix = df.corr()
-    return corr_matrix
-
-def save_correlation_matrix_to_db(corr_matrix, timeframe, date_calculated, db_url):
-    engine = create_engine(db_url)
-    with engine.begin() as conn:
-        for symbol1 in corr_matrix.columns:
-            for symbol2 in corr_matrix.index:
-                corr = corr_matrix.loc[symbol1, symbol2]
-                conn.execute(
-                    text("""
-                        INSERT INTO Correlation_Matrix (symbol1, symbol2, timeframe, correlation, date_calculated)
-                        VALUES (:symbol1, :symbol2, :timeframe, :correlation, :date_calculated)
-                        ON DUPLICATE KEY UPDATE correlation=:correlation, date_calculated=:date_calculated
-                    """),
-                    {
-                        "symbol1": symbol1,
-                        "symbol2": symbol2,
-                        "timeframe": timeframe,
-                        "correlation": float(corr),
-                        "date_calculated": date_calculated,
-                    },
-                )
+def save_correlation_matrix_to_db(corr_matrix, timeframe, date_calculated):
+    """
+    Upsert the upper triangle in one multi-row INSERT ... ON DUPLICATE KEY UPDATE
+    (chunked at UPSERT_CHUNK_ROWS) on the shared engine, and drop the
+    diagonal/lower-half rows older versions stored for this timeframe.
+    """
+    rows = upper_triangle_rows(corr_matrix, timeframe, date_calculated)
+    with get_engine().begin() as conn:
+        conn.execute(
+            text("DELETE FROM Correlation_Matrix WHERE timeframe = :tf AND symbol1 >= symbol2"),
+            {"tf": timeframe},
+        )
+        for start in range(0, len(rows), UPSERT_CHUNK_ROWS):
+            stmt = mysql_insert(CORRELATION_TABLE).values(rows[start:start + UPSERT_CHUNK_ROWS])
+            conn.execute(stmt.on_duplicate_key_update(
+                correlation=stmt.inserted.correlation,
+                date_calculated=stmt.inserted.date_calculated,
+            ))
+    return len(rows)
 
 def main():
-    start_date, end_date = get_date_range()
-    close_dict = {}
-    for pair in config.CCY_PAIRS:
-        print(f"[batch_correlation_update] Loading H1 data for {pair}")
-        close_dict[pair] = load_h1_data(pair, start_date, end_date)
-    print("[batch_correlation_update] Calculating correlation matrix...")
-    corr_matrix = calculate_correlation_matrix(close_dict)
-    print(corr_matrix)
+    # Fold any new exports into the bar store, then update every window/timeframe incrementally.
+    get_bar_store().sync_exports(config.EXPORT_DIR, config.CCY_PAIRS, timeframe="H1")
+    print("[batch_correlation_update] Updating rolling correlation matrices...")
+    matrices = update_all(config.CCY_PAIRS)
+    if not matrices:
+        print("[batch_correlation_update] WARNING: Not enough data to compute correlations.")
+        return
     date_calculated = datetime.utcnow()
-    print("[batch_correlation_update] Saving correlation matrix to DB...")
-    save_correlation_matrix_to_db(
-        corr_matrix,
-        getattr(config, "CORRELATION_TIMEFRAME", "H1"),
-        date_calculated,
-        getattr(config, "SQLALCHEMY_DATABASE_URL", None)
-    )
+    for timeframe, corr_matrix in matrices.items():
+        print(f"[batch_correlation_update] {timeframe}:")
+        print(corr_matrix)
+        print(f"[batch_correlation_update] Saving {timeframe} correlation matrix to DB...")
+        saved = save_correlation_matrix_to_db(corr_matrix, timeframe, date_calculated)
+        print(f"[batch_correlation_update] Saved {saved} pairs for {timeframe}.")
+    invalidate_cache(TAG_CORRELATION)
     print("[batch_correlation_update] Done.")
 
 if __name__ == "__main__":
@@ -1,44 +1,181 @@
+"""
+Nightly portfolio-analysis batch, run as a small dependency graph:
+
+    export ──> bar_store ──┬──> correlation   (process pool)
+                           └──> pip_values    (process pool)
+
+- Steps are in-process callables; independent steps run concurrently in a
+  process pool once their dependencies have succeeded.
+- Every step is timed, retried with exponential backoff on failure, and a failed
+  step skips everything downstream of it. The exit status is non-zero if any
+  step failed or was skipped.
+- Workers are paused (worker_pause lease) only while a step that touches tick
+  data runs (the Tick Data Manager update/export); the analysis steps read the
+  exported bars and run with workers back online.
+"""
 import os
-import time
 import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 
 # Import config from project root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from portfolio_analysis import batch_update_and_export, batch_correlation_update, populate_pip_values
+from portfolio_analysis.bar_store import get_bar_store
+from worker_pause import pause_workers
+
+@contextmanager
+def workers_paused():
+    """Pause (drain) every active worker for the duration of the block."""
+    print("[batch_orchestrator] Waiting for workers to drain and acknowledge pause...")
+    with pause_workers(holder="batch_orchestrator") as lease:
+        print(f"[batch_orchestrator] Workers paused (lease {lease}).")
+        yield
+    print("[batch_orchestrator] Workers resumed.")
+
+# --- Steps ---
+def sync_bar_store():
+    """Fold the fresh exports into the bar store once, before the parallel readers start."""
+    added = get_bar_store().sync_exports(config.EXPORT_DIR, config.CCY_PAIRS, timeframe="H1")
+    print(f"[batch_orchestrator] Bar store updated: {added}")
+
+def run_export():
+    if batch_update_and_export.main() != 0:
+        raise RuntimeError("Tick data export failed for one or more pairs")
+
+def run_pip_values():
+    populate_pip_values.main([])
+
+@dataclass
+class Step:
+    name: str
+    func: object
+    deps: tuple = ()
+    pause_workers: bool = False  # True if the step touches tick data used by the workers
+    parallel: bool = False       # run in the process pool instead of the orchestrator process
+    retries: int = 1
+
+@dataclass
+class StepResult:
+    status: str = "pending"      # pending | success | failed | skipped
+    attempts: int = 0
+    seconds: float = 0.0
+    error: str = None
+    timings: list = field(default_factory=list)
+
+STEPS = [
+    Step("export", run_export, pause_workers=True),
+    Step("bar_store", sync_bar_store, deps=("export",)),
+    Step("correlation", batch_correlation_update.main, deps=("bar_store",), parallel=True),
+    Step("pip_values", run_pip_values, deps=("bar_store",), parallel=True),
+]
+
+def _run_inline(step):
+    if step.pause_workers:
+        with workers_paused():
+            step.func()
+    else:
+        step.func()
+
+def run_dag(steps, max_workers=2, retry_delay=30):
+    """
+    Run `steps` respecting their deps. Returns {name: StepResult}.
+
+    A failed step is retried after a backoff delay without blocking the loop:
+    it gets a not-before time, and other steps keep completing and starting
+    meanwhile.
+    """
+    results = {s.name: StepResult() for s in steps}
+    running = {}  # future -> (step, started)
+    not_before = {}  # step name -> earliest retry time
+
+    def ready(step, now):
+        return results[step.name].status == "pending" and step not in [s for s, _ in running.values()] \
+            and not_before.get(step.name, 0) <= now \
+            and all(results[d].status == "success" for d in step.deps)
 
-def create_lock(lockfile):
-    open(lockfile, 'w').close()
+    def finish(step, started, error):
+        res = results[step.name]
+        res.attempts += 1
+        elapsed = time.time() - started
+        res.timings.append(round(elapsed, 2))
+        res.seconds += elapsed
+        if error is None:
+            res.status = "success"
+            print(f"[batch_orchestrator] {step.name} succeeded in {elapsed:.1f}s (attempt {res.attempts}).")
+            return
+        res.error = f"{type(error).__name__}: {error}"
+        if res.attempts <= step.retries:
+            delay = retry_delay * (2 ** (res.attempts - 1))
+            print(f"[batch_orchestrator] {step.name} failed ({res.error}); retrying in {delay}s.")
+            not_before[step.name] = time.time() + delay
+            return
+        res.status = "failed"
+        print(f"[batch_orchestrator] {step.name} FAILED after {res.attempts} attempts: {res.error}")
 
-def remove_lock(lockfile):
-    if os.path.exists(lockfile):
-        os.remove(lockfile)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            # Anything downstream of a failure will never run.
+            for s in steps:
+                if results[s.name].status == "pending" and any(results[d].status in ("failed", "skipped") for d in s.deps):
+                    results[s.name].status = "skipped"
+                    print(f"[batch_orchestrator] {s.name} skipped (dependency failed).")
 
-def wait_for_worker_paused(timeout=config.LOCK_WAIT_TIMEOUT_SECONDS):
-    waited = 0
-    print("Waiting for worker to acknowledge pause...")
-    while not os.path.exists(config.WORKER_PAUSED_LOCK_FILE):
-        time.sleep(2)
-        waited += 2
-        if waited > timeout:
-            raise TimeoutError("Worker did not pause in time.")
+            for step in [s for s in steps if ready(s, time.time())]:
+                if step.parallel and not step.pause_workers:
+                    running[pool.submit(step.func)] = (step, time.time())
+                    print(f"[batch_orchestrator] {step.name} started in process pool.")
+                    continue
+                print(f"[batch_orchestrator] {step.name} started.")
+                started = time.time()
+                try:
+                    _run_inline(step)
+                    error = None
+                except Exception as e:
+                    error = e
+                finish(step, started, error)
 
-def main():
-    create_lock(config.TICKDATA_LOCK_FILE)
-    wait_for_worker_paused()
-    print("Worker paused. Safe to run batch jobs...")
+            now = time.time()
+            if any(ready(s, now) for s in steps):
+                continue
+            retries = [not_before[s.name] for s in steps
+                       if results[s.name].status == "pending" and not_before.get(s.name, 0) > now]
+            timeout = max(0.0, min(retries) - now) if retries else None
+            if not running:
+                if timeout is None:
+                    break
+                time.sleep(timeout)  # nothing running: only a retry is left to wait for
+                continue
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                step, started = running.pop(fut)
+                finish(step, started, fut.exception())
 
-    # Step 1: Update and export tick data
-    os.system("python batch_update_and_export.py")
+    for name, res in results.items():
+        if res.status == "pending":
+            res.status = "skipped"
+    return results
 
-    # Step 2: Run correlation batch
-    os.system("python batch_correlation_update.py")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the nightly portfolio-analysis batch.")
+    parser.add_argument('--max_workers', type=int, default=2, help='Process pool size for parallel steps')
+    parser.add_argument('--retries', type=int, default=1, help='Retries per failed step')
+    parser.add_argument('--retry_delay', type=float, default=30, help='Initial retry delay in seconds (doubles per retry)')
+    args = parser.parse_args(argv)
 
-    # Step 3: Run pip value batch
-    os.system("python populate_pip_values.py")
+    steps = [Step(s.name, s.func, s.deps, s.pause_workers, s.parallel, args.retries) for s in STEPS]
+    started = time.time()
+    results = run_dag(steps, max_workers=args.max_workers, retry_delay=args.retry_delay)
 
-    print("Batch jobs complete. Releasing locks.")
-    remove_lock(config.TICKDATA_LOCK_FILE)
-    remove_lock(config.WORKER_PAUSED_LOCK_FILE)
+    print(f"[batch_orchestrator] Batch finished in {time.time() - started:.1f}s:")
+    for name, res in results.items():
+        print(f"  {name:<12} {res.status:<8} attempts={res.attempts} time={res.seconds:.1f}s"
+              + (f" error={res.error}" if res.error else ""))
+    return 0 if all(r.status == "success" for r in results.values()) else 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
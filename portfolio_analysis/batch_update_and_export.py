@@ -1,46 +1,108 @@
+"""
+Tick Data Manager update and H1 export, one subprocess per pair.
+
+Pairs are sharded across a bounded thread pool (EXPORT_MAX_PARALLEL), each
+running its own Tick Data Manager update + export, so one slow or failing pair
+no longer blocks the rest. Each pair only exports the range the bar store does
+not hold yet (from the day of its last stored bar, or the full lookback for a
+new pair). Per-pair duration and failures are reported at the end.
+
+The executable is config.TICK_DATA_MANAGER_PATH; any program accepting the
+same /update, /export, /eformat and /output arguments can be substituted
+(e.g. a stub script in tests).
+"""
 import os
 import sys
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 # Ensure project root is in sys.path so config.py can be imported
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from portfolio_analysis.bar_store import get_bar_store
+
+DATE_FORMAT = '%Y.%m.%d'
 
 def get_date_range():
     today = datetime.utcnow()
     start = today - timedelta(days=config.CORRELATION_LOOKBACK_DAYS)
-    return start.strftime('%Y.%m.%d'), today.strftime('%Y.%m.%d')
-
-def quote_path(path):
-    # Add quotes if not already present (prevents double quoting)
-    if not (path.startswith('"') and path.endswith('"')):
-        return f'"{path}"'
-    return path
-
-def update_tick_data():
-    tick_data_manager = quote_path(config.TICK_DATA_MANAGER_PATH)
-    pairs = ",".join(config.CCY_PAIRS)
-    cmd = f'{tick_data_manager} /update:Dukascopy:{pairs}'
-    print(f"[batch_update_and_export] Updating tick data:\n{cmd}")
-    os.system(cmd)
-
-def export_tick_data(start_date, end_date):
-    if not os.path.exists(config.EXPORT_DIR):
-        os.makedirs(config.EXPORT_DIR)
-    tick_data_manager = quote_path(config.TICK_DATA_MANAGER_PATH)
-    pairs = ",".join(config.CCY_PAIRS)
-    cmd = (
-        f'{tick_data_manager} /export:Dukascopy:{pairs}:{start_date}-{end_date} '
-        f'/eformat:{config.EXPORT_FORMAT} /output:{config.EXPORT_DIR}'
-    )
-    print(f"[batch_update_and_export] Exporting tick data:\n{cmd}")
-    os.system(cmd)
+    return start.strftime(DATE_FORMAT), today.strftime(DATE_FORMAT)
+
+def unquote_path(path):
+    # The setting may be stored pre-quoted for the old shell command line.
+    return path[1:-1] if len(path) > 1 and path.startswith('"') and path.endswith('"') else path
+
+def missing_range(pair, store=None, today=None):
+    """(start, end) date strings still to export for pair, based on the bar store."""
+    today = today or datetime.utcnow()
+    last = (store or get_bar_store()).last_timestamp(pair, "H1")
+    if last is None:
+        start = today - timedelta(days=config.CORRELATION_LOOKBACK_DAYS)
+    else:
+        # Re-export the day of the last bar; the store skips bars it already has.
+        start = max(last, today - timedelta(days=config.CORRELATION_LOOKBACK_DAYS))
+    return start.strftime(DATE_FORMAT), today.strftime(DATE_FORMAT)
+
+def _run(cmd, timeout):
+    proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        detail = (proc.stderr or proc.stdout or "").strip().splitlines()
+        raise RuntimeError(f"exit code {proc.returncode}: {detail[-1] if detail else cmd[1]}")
+
+def update_and_export_pair(pair, start_date, end_date, executable=None, export_dir=None, timeout=None):
+    """Update and export one pair. Returns a report dict; never raises."""
+    executable = executable or unquote_path(config.TICK_DATA_MANAGER_PATH)
+    export_dir = export_dir or config.EXPORT_DIR
+    timeout = timeout or config.EXPORT_PAIR_TIMEOUT_SECONDS
+    report = {"pair": pair, "start": start_date, "end": end_date, "status": "success", "seconds": 0.0, "error": None}
+    started = time.time()
+    try:
+        _run([executable, f"/update:Dukascopy:{pair}"], timeout)
+        _run([
+            executable,
+            f"/export:Dukascopy:{pair}:{start_date}-{end_date}",
+            f"/eformat:{config.EXPORT_FORMAT}",
+            f"/output:{export_dir}",
+        ], timeout)
+    except subprocess.TimeoutExpired:
+        report.update(status="failed", error=f"timed out after {timeout}s")
+    except Exception as e:
+        report.update(status="failed", error=str(e))
+    report["seconds"] = round(time.time() - started, 2)
+    return report
+
+def export_all(pairs=None, executable=None, export_dir=None, max_parallel=None, store=None):
+    """Update/export every pair in parallel. Returns the per-pair reports."""
+    pairs = pairs if pairs is not None else config.CCY_PAIRS
+    export_dir = export_dir or config.EXPORT_DIR
+    os.makedirs(export_dir, exist_ok=True)
+    reports = []
+    with ThreadPoolExecutor(max_workers=max_parallel or config.EXPORT_MAX_PARALLEL) as pool:
+        futures = []
+        for pair in pairs:
+            start_date, end_date = missing_range(pair, store)
+            print(f"[batch_update_and_export] {pair}: exporting {start_date} - {end_date}")
+            futures.append(pool.submit(update_and_export_pair, pair, start_date, end_date, executable, export_dir))
+        for fut in as_completed(futures):
+            rep = fut.result()
+            reports.append(rep)
+            suffix = f" ({rep['error']})" if rep["error"] else ""
+            print(f"[batch_update_and_export] {rep['pair']}: {rep['status']} in {rep['seconds']}s{suffix}")
+    return sorted(reports, key=lambda r: r["pair"])
 
 def main():
-    start_date, end_date = get_date_range()
-    update_tick_data()
-    export_tick_data(start_date, end_date)
+    reports = export_all()
+    failed = [r["pair"] for r in reports if r["status"] != "success"]
+    total = sum(r["seconds"] for r in reports)
+    print(f"[batch_update_and_export] {len(reports) - len(failed)}/{len(reports)} pairs exported "
+          f"({total:.1f}s of subprocess time).")
+    if failed:
+        print(f"[batch_update_and_export] FAILED pairs: {', '.join(failed)}")
+        return 1
     print("[batch_update_and_export] Tick data update/export complete.")
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -1,12 +1,38 @@
+"""
+Pip values for every pair x lot size x account currency, computed in one pass.
+
+Last closes are read once from the bar store and turned into a cross-rate
+table between all currencies involved: direct quotes, their inverses and,
+where neither is exported, crosses triangulated through a third currency.
+The pip-value grid is then a single NumPy broadcast
+
+    pip_value[pair, lot, acct] = lot * CONTRACT_SIZE * pip_size[pair] * rate[quote(pair) -> acct]
+
+and is bulk-upserted into pip_values, so sizing pages can read any configured
+lot size (or scale a stored one, pip values being linear in lot size).
+"""
 import os
 import sys
-import pandas as pd
 import argparse
 from datetime import datetime, timedelta
 
+import numpy as np
+from sqlalchemy import column, table
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
 # Add the parent directory to sys.path so config.py at project root is importable
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from db.connection import get_engine
+from portfolio_analysis.bar_store import get_bar_store
+
+CONTRACT_SIZE = 100_000
+PIP_VALUES_TABLE = table(
+    "pip_values",
+    column("ccy_pair"), column("account_ccy"), column("lot_size"), column("pip_value"),
+    column("value_date"), column("price_used"), column("quote_to_account_ccy_rate"),
+)
+UPSERT_CHUNK_ROWS = 1000
 
 def get_pip_size(pair):
     """Return pip size. 0.01 for JPY pairs, else 0.0001."""
@@ -15,127 +41,144 @@ def get_pip_size(pair):
 def get_quote_ccy(pair):
     return pair[-3:]
 
-def get_exported_csv(pair, start_date, end_date, export_dir):
-    file_name = f"Dukascopy-{pair}-{start_date}-{end_date}-bardata_H1.csv"
-    file_path = os.path.join(export_dir, file_name)
-    if not os.path.exists(file_path):
+def get_last_close(pair, start_date, end_date, store=None):
+    """Last stored H1 close for pair if it falls inside [start_date, end_date], else None."""
+    store = store or get_bar_store()
+    last = store.last_timestamp(pair, "H1")
+    if last is None:
         return None
-    return file_path
-
-def get_last_close_from_csv(csv_path):
-    df = pd.read_csv(csv_path)
-    return float(df.iloc[-1]['Close'])
+    if not (datetime.strptime(start_date, '%Y.%m.%d') <= last < datetime.strptime(end_date, '%Y.%m.%d') + timedelta(days=1)):
+        return None
+    return store.last_close(pair, "H1")
 
-def get_needed_quotes(pairs, account_ccy='USD'):
-    needed = set()
+def conversion_pairs(pairs, account_ccys):
+    """Pairs whose closes feed the rate table: the pairs themselves, account/quote rates, and all inverses."""
+    needed = set(pairs)
+    for pair in pairs:
+        for acct in account_ccys:
+            if get_quote_ccy(pair) != acct:
+                needed.add(f"{acct}{get_quote_ccy(pair)}")
+    return sorted(needed | {f"{p[3:]}{p[:3]}" for p in needed})
+
+def load_last_closes(pairs, start_date, end_date, store=None):
+    """{pair: last close} for the pairs with a bar inside the date range."""
+    store = store or get_bar_store()
+    closes = {}
     for pair in pairs:
-        quote = get_quote_ccy(pair)
-        if quote != account_ccy:
-            needed.add(f"{account_ccy}{quote}")
-    return needed
-
-def get_or_synth_close(pair, start_date, end_date, export_dir):
-    # Try direct
-    file_path = get_exported_csv(pair, start_date, end_date, export_dir)
-    if file_path:
-        return get_last_close_from_csv(file_path)
-    # Try to synthesize from inverse
-    base, quote = pair[:3], pair[3:]
-    inverse_pair = f"{quote}{base}"
-    inverse_file_path = get_exported_csv(inverse_pair, start_date, end_date, export_dir)
-    if inverse_file_path:
-        inverse_close = get_last_close_from_csv(inverse_file_path)
-        if inverse_close:
-            return 1.0 / inverse_close
-    return None
-
-def main():
+        close = get_last_close(pair, start_date, end_date, store)
+        if close:
+            closes[pair] = close
+    return closes
+
+def build_rate_table(closes, currencies=()):
+    """
+    Cross-rate table from {pair: close}: returns (currencies, rates) where
+    rates[i, j] is the price of one unit of currencies[i] in currencies[j]
+    (NaN if it cannot be derived). Direct quotes win over inverses, and
+    inverses over triangulated crosses.
+    """
+    ccys = sorted(set(currencies) | {p[:3] for p in closes} | {p[3:] for p in closes})
+    idx = {c: i for i, c in enumerate(ccys)}
+    rates = np.full((len(ccys), len(ccys)), np.nan)
+    np.fill_diagonal(rates, 1.0)
+    for pair, close in closes.items():
+        base, quote = idx[pair[:3]], idx[pair[3:]]
+        rates[base, quote] = close
+    inverse = np.isnan(rates) & np.isfinite(rates.T)
+    rates[inverse] = 1.0 / rates.T[inverse]
+    # Triangulate the remaining gaps through each currency in turn (Floyd-Warshall style).
+    for k in range(len(ccys)):
+        via = np.outer(rates[:, k], rates[k, :])
+        gaps = np.isnan(rates) & np.isfinite(via)
+        rates[gaps] = via[gaps]
+    return ccys, rates
+
+def pip_value_grid(pairs, lot_sizes, account_ccys, ccys, rates):
+    """
+    Returns (grid, prices, quote_rates):
+      grid[p, l, a]      pip value of pairs[p] at lot_sizes[l] in account_ccys[a]
+      prices[p]          close used for the pair (direct or synthesized)
+      quote_rates[p, a]  price of the account currency in the pair's quote currency
+    Entries that cannot be derived are NaN.
+    """
+    idx = {c: i for i, c in enumerate(ccys)}
+    base = np.array([idx[p[:3]] for p in pairs], dtype=int)
+    quote = np.array([idx[p[3:]] for p in pairs], dtype=int)
+    acct = np.array([idx[a] for a in account_ccys], dtype=int)
+    pip_sizes = np.array([get_pip_size(p) for p in pairs])
+    lots = np.asarray(lot_sizes, dtype=float)
+
+    prices = rates[base, quote]
+    to_account = rates[quote[:, None], acct[None, :]]    # (pairs, accounts)
+    grid = lots[None, :, None] * CONTRACT_SIZE * pip_sizes[:, None, None] * to_account[:, None, :]
+    return grid, prices, rates[acct[None, :], quote[:, None]]
+
+def pip_value_rows(pairs, lot_sizes, account_ccys, grid, prices, quote_rates, value_date):
+    """Flatten the grid into pip_values rows, skipping pairs with no price or no conversion rate."""
+    p, l, a = np.nonzero(np.isfinite(grid) & np.isfinite(prices)[:, None, None])
+    return [
+        {
+            "ccy_pair": pairs[i],
+            "account_ccy": account_ccys[k],
+            "lot_size": float(lot_sizes[j]),
+            "pip_value": float(grid[i, j, k]),
+            "value_date": value_date,
+            "price_used": float(prices[i]),
+            "quote_to_account_ccy_rate": float(quote_rates[i, k]),
+        }
+        for i, j, k in zip(p, l, a)
+    ]
+
+def save_pip_values(rows):
+    """Multi-row INSERT ... ON DUPLICATE KEY UPDATE, chunked at UPSERT_CHUNK_ROWS, in one transaction."""
+    with get_engine().begin() as conn:
+        for start in range(0, len(rows), UPSERT_CHUNK_ROWS):
+            stmt = mysql_insert(PIP_VALUES_TABLE).values(rows[start:start + UPSERT_CHUNK_ROWS])
+            conn.execute(stmt.on_duplicate_key_update(
+                pip_value=stmt.inserted.pip_value,
+                price_used=stmt.inserted.price_used,
+                quote_to_account_ccy_rate=stmt.inserted.quote_to_account_ccy_rate,
+            ))
+    return len(rows)
+
+def main(argv=None):
     parser = argparse.ArgumentParser()
-    parser.add_argument('--account_ccy', type=str, default=config.ACCOUNT_CCY, help='Account currency, e.g. USD')
-    parser.add_argument('--lot_size', type=float, default=0.01, help='Lot size for pip value calculation (default 0.01)')
+    parser.add_argument('--account_ccy', dest='account_ccys', type=str, nargs='+', default=config.PIP_VALUE_ACCOUNT_CCYS, help='Account currencies, e.g. USD EUR')
+    parser.add_argument('--lot_size', dest='lot_sizes', type=float, nargs='+', default=config.PIP_VALUE_LOT_SIZES, help='Lot sizes for pip value calculation')
     parser.add_argument('--export_dir', type=str, default=config.EXPORT_DIR, help='Path to exported bar data directory')
     parser.add_argument('--lookback_days', type=int, default=getattr(config, 'CORRELATION_LOOKBACK_DAYS', 365), help='Lookback days for pip value date range')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    account_ccy = args.account_ccy.upper()
-    lot_size = args.lot_size
-    export_dir = args.export_dir
-    lookback_days = args.lookback_days
+    account_ccys = [c.upper() for c in args.account_ccys]
+    lot_sizes = sorted(set(args.lot_sizes))
 
-    # Determine date range for file search (unified with batch_correlation_update)
+    # Determine date range for the last close (unified with batch_correlation_update)
     today = datetime.utcnow()
-    start = today - timedelta(days=lookback_days)
-    start_str = start.strftime('%Y.%m.%d')
+    start_str = (today - timedelta(days=args.lookback_days)).strftime('%Y.%m.%d')
     end_str = today.strftime('%Y.%m.%d')
 
-    all_pairs = config.CCY_PAIRS
-
-    # Step 1: For all needed conversion rates, get closing price for account_ccy/quote, using direct or synthesized
-    needed_quotes = get_needed_quotes(all_pairs, account_ccy=account_ccy)
-    usd_quote_prices = {}
-    for quote in needed_quotes:
-        price = get_or_synth_close(quote, start_str, end_str, export_dir)
-        if price:
-            usd_quote_prices[quote] = price
-        else:
-            print(f"[populate_pip_values] WARNING: Missing conversion rate for {quote} (and its inverse).")
-
-    # Step 2: For each FX pair, calculate pip value using direct or synthesized close
-    pip_value_records = []
-    for pair in all_pairs:
-        last_close = get_or_synth_close(pair, start_str, end_str, export_dir)
-        if not last_close:
-            print(f"[populate_pip_values] WARNING: No tickdata for {pair} and no inverse. Skipping.")
+    pairs = config.CCY_PAIRS
+    store = get_bar_store()
+    # Fold any new exports (pairs, conversion rates and their inverses) into the bar store once
+    store_pairs = conversion_pairs(pairs, account_ccys)
+    store.sync_exports(args.export_dir, store_pairs, timeframe="H1")
+
+    closes = load_last_closes(store_pairs, start_str, end_str, store)
+    ccys, rates = build_rate_table(closes, currencies=account_ccys + [c for p in pairs for c in (p[:3], p[3:])])
+    grid, prices, quote_rates = pip_value_grid(pairs, lot_sizes, account_ccys, ccys, rates)
+
+    for i, pair in enumerate(pairs):
+        if not np.isfinite(prices[i]):
+            print(f"[populate_pip_values] WARNING: No tickdata for {pair}, its inverse or a cross. Skipping.")
             continue
-        pip_size = get_pip_size(pair)
-        try:
-            pipval = pip_value_generic(pair, lot_size, pip_size, last_close, account_ccy, usd_quote_prices)
-            pip_value_records.append({
-                'ccy_pair': pair,
-                'account_ccy': account_ccy,
-                'lot_size': lot_size,
-                'pip_value': pipval,
-                'value_date': datetime.utcnow().date(),
-                'price_used': last_close,
-                'quote_to_account_ccy_rate': usd_quote_prices.get(f"{account_ccy}{get_quote_ccy(pair)}", 1.0),
-            })
-        except Exception as e:
-            print(f"[populate_pip_values] Error for {pair}: {e}")
-
-    # Step 3: Insert/update into controller DB using config DB settings
-    import mysql.connector
-    cnx = mysql.connector.connect(
-        host=config.MYSQL_HOST,
-        port=config.MYSQL_PORT,
-        user=config.MYSQL_USER,
-        password=config.MYSQL_PASSWORD,
-        database=config.MYSQL_DATABASE
-    )
-    cursor = cnx.cursor()
-    for rec in pip_value_records:
-        sql = """
-        INSERT INTO pip_values (ccy_pair, account_ccy, lot_size, pip_value, value_date, price_used, quote_to_account_ccy_rate)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE pip_value=VALUES(pip_value), price_used=VALUES(price_used), quote_to_account_ccy_rate=VALUES(quote_to_account_ccy_rate)
-        """
-        cursor.execute(sql, (
-            rec['ccy_pair'], rec['account_ccy'], rec['lot_size'], rec['pip_value'],
-            rec['value_date'], rec['price_used'], rec['quote_to_account_ccy_rate']
-        ))
-    cnx.commit()
-    cursor.close()
-    cnx.close()
-    print(f"[populate_pip_values] Done populating pip values for lot size {lot_size}, account_ccy {account_ccy}!")
-
-def pip_value_generic(pair, lot_size, pip_size, price, account_ccy, usd_quote_prices):
-    quote_ccy = get_quote_ccy(pair)
-    if quote_ccy == account_ccy:
-        return lot_size * 100_000 * pip_size
-    else:
-        usd_quote = f"{account_ccy}{quote_ccy}"
-        if usd_quote not in usd_quote_prices:
-            raise ValueError(f"Missing conversion rate for {usd_quote}")
-        return (lot_size * 100_000 * pip_size) / usd_quote_prices[usd_quote]
+        for k, acct in enumerate(account_ccys):
+            if not np.isfinite(quote_rates[i, k]):
+                print(f"[populate_pip_values] WARNING: Missing conversion rate {acct}{get_quote_ccy(pair)}.")
+
+    rows = pip_value_rows(pairs, lot_sizes, account_ccys, grid, prices, quote_rates, today.date())
+    save_pip_values(rows)
+    print(f"[populate_pip_values] Upserted {len(rows)} pip values "
+          f"({len(pairs)} pairs x {len(lot_sizes)} lot sizes x {len(account_ccys)} account currencies).")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,4 @@
 import streamlit as st
-import requests
 import base64
 from PIL import Image
 import io
@@ -8,6 +7,8 @@ import json
 import re
 import config
 import redis
+import ai_queue
+from openrouter import chat_payload
 from session_manager import is_authenticated, sync_streamlit_session
 
 # --------- REDIS/API KEY SUPPORT (unified, uses config.py) ---------
@@ -51,39 +52,27 @@ def image_to_base64(image_file):
     img_b64 = base64.b64encode(img_bytes).decode()
     return img_b64
 
-# --------- OPENROUTER MULTIMODAL GPT-4o CALL ---------
-def call_openrouter_multimodal(api_key, image_b64_list, prompt, model="openai/gpt-4o", temperature=0):
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "HTTP-Referer": "your-app-or-email",  # Replace with your app or email as required by OpenRouter
-        "Content-Type": "application/json"
-    }
-    content = [{"type": "text", "text": prompt}]
-    for img_b64 in image_b64_list:
-        content.append({
-            "type": "image_url",
-            "image_url": {"url": f"data:image/png;base64,{img_b64}"}
-        })
-    data = {
-        "model": model,
-        "messages": [
-            {
-                "role": "user",
-                "content": content
-            }
-        ],
-        "temperature": temperature
-    }
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers=headers,
-        json=data,
-        timeout=120
-    )
-    if response.ok:
-        return response.json()["choices"][0]["message"]["content"]
-    else:
-        return f"Error: {response.status_code}\n{response.text}"
+# --------- OPENROUTER MULTIMODAL GPT-4o REQUEST (sent by the AI worker) ---------
+def review_payload(image_b64_list, prompt, model="openai/gpt-4o", temperature=0):
+    return chat_payload(prompt, model=model, images=image_b64_list, temperature=temperature)
+
+@st.fragment(run_every=config.AI_POLL_SECONDS)
+def review_job_status():
+    try:
+        job = ai_queue.get_job(st.session_state["review_job"])
+    except redis.RedisError as e:
+        st.warning(f"Cannot check the AI review request: {e}")
+        return
+    if job is None or job["status"] in ai_queue.FINISHED:
+        del st.session_state["review_job"]
+        if job is None:
+            st.error("The AI review request expired before it was processed. Is the AI worker running?")
+        elif job["status"] == ai_queue.STATUS_DONE:
+            st.session_state["last_response"] = job["result"]
+        else:
+            st.session_state["review_error"] = f"Error: {job.get('error')}"
+        st.rerun()
+    st.info(f"Sending image(s) to OpenRouter GPT-4o: {job['status']}...")
 
 # --------- RENDER AI RESPONSE (robust JSON extraction) ---------
 def render_ai_review(json_str):
@@ -197,17 +186,25 @@ for label, img in zip(img_labels, uploaded_imgs):
 if "last_response" not in st.session_state:
     st.session_state["last_response"] = None
 
-submit = st.button("Process with AI", disabled=not (uploaded_imgs and api_key and prompt_template))
+submit = st.button(
+    "Process with AI",
+    disabled=not (uploaded_imgs and api_key and prompt_template) or "review_job" in st.session_state,
+)
 
 if submit:
-    with st.spinner("Sending image(s) to OpenRouter GPT-4o..."):
-        img_b64_list = [image_to_base64(img) for img in uploaded_imgs]
-        ai_response_text = call_openrouter_multimodal(api_key, img_b64_list, prompt_template, temperature=0)
-        st.session_state["last_response"] = ai_response_text
-    st.markdown("---")
-    st.subheader("AI Portfolio Review")
-    render_ai_review(st.session_state["last_response"])
+    img_b64_list = [image_to_base64(img) for img in uploaded_imgs]
+    try:
+        st.session_state["review_job"] = ai_queue.submit(
+            ai_queue.KIND_PORTFOLIO_REVIEW, review_payload(img_b64_list, prompt_template, temperature=0), api_key
+        )
+        st.session_state["last_response"] = None
+    except redis.RedisError as e:
+        st.error(f"Failed to queue AI review request: {e}")
+if "review_job" in st.session_state:
+    review_job_status()
+if st.session_state.get("review_error"):
+    st.error(st.session_state.pop("review_error"))
 elif st.session_state["last_response"]:
     st.markdown("---")
     st.subheader("AI Portfolio Review")
-    render_ai_review(st.session_state["last_response"])
\ No newline at end of file
+    render_ai_review(st.session_state["last_response"])
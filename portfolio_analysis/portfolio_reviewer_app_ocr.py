@@ -4,10 +4,12 @@ import pytesseract
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 import pandas as pd
 import numpy as np
-import requests
 import json
 import os
 import re
+import config
+import ai_queue
+from openrouter import chat_payload
 
 # --------- SYSTEM: LOAD PROMPT TEMPLATE FROM FILE ---------
 def load_prompt_template():
@@ -81,28 +83,25 @@ def df_to_markdown_table(df):
         return ""
     return df.to_markdown(index=False)
 
-# --------- OPENROUTER API CALL ---------
-def call_openrouter_api(prompt, api_key, model="gpt-4o"):
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
-    response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
-    if response.status_code == 200:
-        result = response.json()
-        try:
-            ai_content = result["choices"][0]["message"]["content"]
-        except Exception:
-            ai_content = "Failed to parse AI response."
-        return ai_content
-    else:
-        return f"Error from OpenRouter: {response.status_code} - {response.text}"
+# --------- OPENROUTER REQUEST (queued, sent by the AI worker) ---------
+@st.fragment(run_every=config.AI_POLL_SECONDS)
+def review_job_status():
+    try:
+        job = ai_queue.get_job(st.session_state["ocr_review_job"])
+    except Exception as e:
+        st.warning(f"Cannot check the AI review request: {e}")
+        return
+    if job is None or job["status"] in ai_queue.FINISHED:
+        del st.session_state["ocr_review_job"]
+        if job is None:
+            st.session_state["ocr_review_response"] = None
+            st.session_state["ocr_review_error"] = "The AI review request expired before it was processed. Is the AI worker running?"
+        elif job["status"] == ai_queue.STATUS_DONE:
+            st.session_state["ocr_review_response"] = job["result"]
+        else:
+            st.session_state["ocr_review_error"] = f"Error from OpenRouter: {job.get('error')}"
+        st.rerun()
+    st.info(f"Calling AI reviewer: {job['status']}...")
 
 # --------- RENDER AI RESPONSE ---------
 def render_ai_review(json_str):
@@ -209,9 +208,17 @@ api_key = st.text_input("OpenRouter API key", value=get_open_router_api_key() or
 
 prompt_template = load_prompt_template()
 
-if st.button("Process with AI", disabled=not (api_key and prompt_template and history_table_md and open_table_md)):
-    with st.spinner("Calling AI reviewer..."):
-        prompt = prompt_template.replace("{history_table}", history_table_md).replace("{open_table}", open_table_md)
-        ai_response_text = call_openrouter_api(prompt, api_key)
-        st.markdown("### AI Portfolio Review")
-        render_ai_review(ai_response_text)
\ No newline at end of file
+if st.button("Process with AI", disabled=not (api_key and prompt_template and history_table_md and open_table_md) or "ocr_review_job" in st.session_state):
+    prompt = prompt_template.replace("{history_table}", history_table_md).replace("{open_table}", open_table_md)
+    try:
+        st.session_state["ocr_review_job"] = ai_queue.submit(ai_queue.KIND_PORTFOLIO_REVIEW, chat_payload(prompt), api_key)
+        st.session_state.pop("ocr_review_response", None)
+    except Exception as e:
+        st.error(f"Failed to queue AI review request: {e}")
+if "ocr_review_job" in st.session_state:
+    review_job_status()
+if st.session_state.get("ocr_review_error"):
+    st.error(st.session_state.pop("ocr_review_error"))
+elif st.session_state.get("ocr_review_response"):
+    st.markdown("### AI Portfolio Review")
+    render_ai_review(st.session_state["ocr_review_response"])
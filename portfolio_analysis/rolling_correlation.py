@@ -0,0 +1,240 @@
+"""
+Incremental rolling correlation of log returns.
+
+For each timeframe the engine keeps the aligned log-return rows (timestamps at
+which every pair has a return) for the longest configured window, plus, for
+every window, the running sums
+
+    n, Σx (per pair), Σxxᵀ (per pair pair)
+
+over the rows inside that window. An update only folds in the rows newer than
+the last processed bar and subtracts the rows that fell out of each window, so
+the cost is proportional to the new data rather than to the lookback. Sums are
+rebuilt from the stored rows every CORRELATION_REBUILD_EVERY updates to keep
+floating-point drift in check.
+
+State is persisted per timeframe in CORRELATION_STATE_DIR/{timeframe}.npz and
+discarded automatically if the pair list or the windows change.
+"""
+import os
+import sys
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from portfolio_analysis.bar_store import get_bar_store
+
+DAY_SECONDS = 86400
+# Bars re-read before the last processed one, so every pair has a previous close
+# to compute its first new return from (covers weekends and holidays).
+OVERLAP = timedelta(days=7)
+# Timeframes derived from H1 bars when the store has no export of their own.
+RESAMPLE_RULES = {"H4": "4h", "D1": "1D"}
+
+
+def window_label(timeframe, window_days):
+    """Timeframe value stored in Correlation_Matrix: the default window keeps the bare timeframe."""
+    if window_days == config.CORRELATION_LOOKBACK_DAYS:
+        return timeframe
+    return f"{timeframe}_{window_days}D"
+
+
+class _WindowSums:
+    __slots__ = ("days", "start", "n", "sx", "sxx")
+
+    def __init__(self, days, n_pairs, start=0):
+        self.days = days
+        self.start = start  # index of the oldest row inside the window
+        self.n = 0
+        self.sx = np.zeros(n_pairs)
+        self.sxx = np.zeros((n_pairs, n_pairs))
+
+    def add(self, rows):
+        if len(rows):
+            self.n += len(rows)
+            self.sx += rows.sum(axis=0)
+            self.sxx += rows.T @ rows
+
+    def remove(self, rows):
+        if len(rows):
+            self.n -= len(rows)
+            self.sx -= rows.sum(axis=0)
+            self.sxx -= rows.T @ rows
+
+    def correlation(self):
+        if self.n < 2:
+            return None
+        cov = self.n * self.sxx - np.outer(self.sx, self.sx)
+        var = np.clip(np.diag(cov), 0, None)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = cov / np.sqrt(np.outer(var, var))
+        np.fill_diagonal(corr, 1.0)
+        return np.clip(corr, -1.0, 1.0)
+
+
+class RollingCorrelation:
+    """Rolling correlation state for one timeframe across several windows (days)."""
+
+    def __init__(self, pairs, windows, timeframe="H1", store=None, state_dir=None):
+        self.pairs = list(pairs)
+        self.windows = sorted(set(int(w) for w in windows))
+        self.timeframe = timeframe
+        self.store = store or get_bar_store()
+        self.state_dir = state_dir or config.CORRELATION_STATE_DIR
+        self.times = np.empty(0, dtype=np.int64)
+        self.rows = np.empty((0, len(self.pairs)))
+        self.sums = {w: _WindowSums(w, len(self.pairs)) for w in self.windows}
+        self.updates_since_rebuild = 0
+
+    # --- persistence ---
+    @property
+    def state_path(self):
+        return os.path.join(self.state_dir, f"{self.timeframe}.npz")
+
+    def load(self):
+        """Restore persisted state; returns False (fresh state) if absent or incompatible."""
+        if not os.path.exists(self.state_path):
+            return False
+        with np.load(self.state_path, allow_pickle=False) as st:
+            if list(st["pairs"]) != self.pairs or list(st["windows"]) != self.windows:
+                return False
+            self.times = st["times"]
+            self.rows = st["rows"]
+            self.updates_since_rebuild = int(st["updates_since_rebuild"])
+            for i, w in enumerate(self.windows):
+                sums = _WindowSums(w, len(self.pairs), start=int(st["starts"][i]))
+                sums.n = int(st["counts"][i])
+                sums.sx = st["sx"][i]
+                sums.sxx = st["sxx"][i]
+                self.sums[w] = sums
+        return True
+
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp = self.state_path + ".tmp.npz"
+        np.savez(
+            tmp,
+            pairs=np.array(self.pairs),
+            windows=np.array(self.windows),
+            times=self.times,
+            rows=self.rows,
+            updates_since_rebuild=self.updates_since_rebuild,
+            starts=np.array([self.sums[w].start for w in self.windows]),
+            counts=np.array([self.sums[w].n for w in self.windows]),
+            sx=np.stack([self.sums[w].sx for w in self.windows]),
+            sxx=np.stack([self.sums[w].sxx for w in self.windows]),
+        )
+        os.replace(tmp, self.state_path)
+
+    # --- data ---
+    def _closes(self, pair, since):
+        if self.store.manifest(pair, self.timeframe)["rows"] == 0 and self.timeframe in RESAMPLE_RULES:
+            h1 = self.store.close_series(pair, since, None, timeframe="H1")
+            if h1 is None or h1.empty:
+                return None
+            resampled = h1.resample(RESAMPLE_RULES[self.timeframe]).last().dropna()
+            return resampled.iloc[:-1]  # the last bucket may still be filling
+        return self.store.close_series(pair, since, None, timeframe=self.timeframe)
+
+    def new_returns(self):
+        """Aligned log-return rows newer than the last processed bar: (times, rows)."""
+        last = int(self.times[-1]) if len(self.times) else None
+        since = None
+        if last is not None:
+            since = pd.Timestamp(last, unit="s").to_pydatetime() - OVERLAP
+        elif self.windows:
+            latest = [self.store.last_timestamp(p, "H1" if self.timeframe in RESAMPLE_RULES else self.timeframe) for p in self.pairs]
+            latest = [t for t in latest if t is not None]
+            if latest:
+                since = max(latest) - timedelta(days=self.windows[-1] + OVERLAP.days)
+        returns = {}
+        for pair in self.pairs:
+            close = self._closes(pair, since)
+            if close is None or close.empty:
+                print(f"[rolling_correlation] WARNING: No {self.timeframe} bars for {pair}; skipping this update.")
+                return np.empty(0, dtype=np.int64), np.empty((0, len(self.pairs)))
+            returns[pair] = np.log(close / close.shift(1)).dropna()
+        df = pd.DataFrame(returns).dropna()
+        times = df.index.values.astype("datetime64[s]").astype(np.int64)
+        if last is not None:
+            keep = times > last
+            times, df = times[keep], df[keep]
+        return times, df[self.pairs].to_numpy(dtype=np.float64)
+
+    # --- update ---
+    def update(self):
+        """Fold in new bars and expire old ones. Returns the number of new rows."""
+        times, rows = self.new_returns()
+        if len(times):
+            self.times = np.concatenate([self.times, times])
+            self.rows = np.vstack([self.rows, rows])
+            for sums in self.sums.values():
+                sums.add(rows)
+        if not len(self.times):
+            return 0
+
+        latest = int(self.times[-1])
+        for w, sums in self.sums.items():
+            new_start = int(np.searchsorted(self.times, latest - w * DAY_SECONDS, side="right"))
+            if new_start > sums.start:
+                sums.remove(self.rows[sums.start:new_start])
+                sums.start = new_start
+
+        # Rows older than the longest window are no longer needed.
+        drop = min(s.start for s in self.sums.values())
+        if drop:
+            self.times = self.times[drop:]
+            self.rows = self.rows[drop:]
+            for sums in self.sums.values():
+                sums.start -= drop
+
+        self.updates_since_rebuild += 1
+        if self.updates_since_rebuild >= config.CORRELATION_REBUILD_EVERY:
+            self.rebuild()
+        return len(times)
+
+    def rebuild(self):
+        """Recompute every window's sums from the stored rows."""
+        for w, sums in self.sums.items():
+            fresh = _WindowSums(w, len(self.pairs), start=sums.start)
+            fresh.add(self.rows[sums.start:])
+            self.sums[w] = fresh
+        self.updates_since_rebuild = 0
+
+    def correlation(self, window_days):
+        """Correlation matrix (DataFrame, pairs x pairs) over the window, or None."""
+        corr = self.sums[window_days].correlation()
+        if corr is None:
+            return None
+        return pd.DataFrame(corr, index=self.pairs, columns=self.pairs)
+
+    def matrices(self):
+        """{Correlation_Matrix timeframe label: DataFrame} for every window."""
+        out = {}
+        for w in self.windows:
+            corr = self.correlation(w)
+            if corr is not None:
+                out[window_label(self.timeframe, w)] = corr
+        return out
+
+
+def update_all(pairs=None, timeframes=None, windows=None, store=None, state_dir=None):
+    """
+    Update (and persist) the rolling state of every timeframe in one pass.
+    Returns {Correlation_Matrix timeframe label: DataFrame}.
+    """
+    pairs = pairs if pairs is not None else config.CCY_PAIRS
+    timeframes = timeframes or config.CORRELATION_TIMEFRAMES
+    windows = windows or config.CORRELATION_WINDOWS
+    matrices = {}
+    for tf in timeframes:
+        engine = RollingCorrelation(pairs, windows, timeframe=tf, store=store, state_dir=state_dir)
+        engine.load()
+        added = engine.update()
+        engine.save()
+        print(f"[rolling_correlation] {tf}: folded in {added} new bars, {len(engine.times)} rows retained.")
+        matrices.update(engine.matrices())
+    return matrices
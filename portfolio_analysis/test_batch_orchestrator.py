@@ -0,0 +1,44 @@
+import time
+
+from portfolio_analysis.batch_orchestrator import Step, run_dag
+
+def ok():
+    return None
+
+def boom():
+    raise RuntimeError("boom")
+
+def test_run_dag_runs_parallel_steps_and_skips_downstream_of_failures():
+    steps = [
+        Step("prepare", ok),
+        Step("good", ok, deps=("prepare",), parallel=True),
+        Step("bad", boom, deps=("prepare",), parallel=True, retries=1),
+        Step("after_bad", ok, deps=("bad",)),
+    ]
+    results = run_dag(steps, max_workers=2, retry_delay=0)
+    assert results["prepare"].status == "success"
+    assert results["good"].status == "success"
+    assert results["bad"].status == "failed"
+    assert results["bad"].attempts == 2
+    assert "boom" in results["bad"].error
+    assert results["after_bad"].status == "skipped"
+
+def slow():
+    time.sleep(0.2)
+
+_started = []
+
+def record_start():
+    _started.append(time.time())
+
+def test_retry_wait_does_not_block_other_steps():
+    steps = [
+        Step("bad", boom, parallel=True, retries=1),
+        Step("slow", slow, parallel=True),
+        Step("after_slow", record_start, deps=("slow",)),
+    ]
+    t0 = time.time()
+    results = run_dag(steps, max_workers=2, retry_delay=1.5)
+    assert results["bad"].attempts == 2 and results["after_slow"].status == "success"
+    # after_slow started while "bad" was still waiting for its retry.
+    assert _started[0] - t0 < 1.0
@@ -0,0 +1,50 @@
+import os
+import sys
+import stat
+from datetime import datetime
+from portfolio_analysis.bar_store import BarStore
+from portfolio_analysis.batch_update_and_export import export_all, missing_range
+
+# Stand-in for Tick Data Manager: writes a one-bar export, fails for BADPAIR.
+STUB = """#!{python}
+import os, sys
+args = dict(a[1:].split(":", 1) for a in sys.argv[1:])
+if "export" in args:
+    _, pair, dates = args["export"].split(":")
+    if pair == "BADPAIR":
+        sys.stderr.write("no data for BADPAIR")
+        sys.exit(3)
+    start, end = dates.split("-")
+    with open(os.path.join(args["output"], f"Dukascopy-{{pair}}-{{start}}-{{end}}-bardata_H1.csv"), "w") as f:
+        f.write("Date,Time,Open,High,Low,Close,Tick volume\\n")
+        f.write(f"{{end}},00:00:00,1.1,1.1,1.1,1.1,1\\n")
+"""
+
+def make_stub(tmp_path):
+    path = tmp_path / "tdm_stub.py"
+    path.write_text(STUB.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+def test_export_all_runs_pairs_independently(tmp_path):
+    export_dir = tmp_path / "exports"
+    store = BarStore(root=str(tmp_path / "bars"))
+    reports = export_all(["EURUSD", "BADPAIR", "GBPUSD"], executable=make_stub(tmp_path),
+                         export_dir=str(export_dir), max_parallel=2, store=store)
+    by_pair = {r["pair"]: r for r in reports}
+    assert by_pair["EURUSD"]["status"] == "success"
+    assert by_pair["GBPUSD"]["status"] == "success"
+    assert by_pair["BADPAIR"]["status"] == "failed"
+    assert "no data for BADPAIR" in by_pair["BADPAIR"]["error"]
+    assert len(os.listdir(export_dir)) == 2
+
+def test_missing_range_starts_at_last_stored_bar(tmp_path):
+    store = BarStore(root=str(tmp_path / "bars"))
+    today = datetime(2025, 3, 10)
+    assert missing_range("EURUSD", store, today)[1] == "2025.03.10"
+    export_dir = tmp_path / "exports"
+    export_dir.mkdir()
+    (export_dir / "Dukascopy-EURUSD-2025.03.01-2025.03.07-bardata_H1.csv").write_text(
+        "Date,Time,Open,High,Low,Close,Tick volume\n2025.03.07,21:00:00,1.1,1.1,1.1,1.1,1\n")
+    store.sync_exports(str(export_dir), ["EURUSD"])
+    assert missing_range("EURUSD", store, today) == ("2025.03.07", "2025.03.10")
@@ -0,0 +1,22 @@
+from datetime import datetime
+import pandas as pd
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from portfolio_analysis.batch_correlation_update import CORRELATION_TABLE, upper_triangle_rows
+
+def test_upper_triangle_rows_skip_diagonal_and_mirror():
+    symbols = ["GBPUSD", "EURUSD", "USDJPY"]
+    corr = pd.DataFrame(
+        [[1.0, 0.8, -0.5], [0.8, 1.0, -0.4], [-0.5, -0.4, 1.0]], index=symbols, columns=symbols
+    )
+    rows = upper_triangle_rows(corr, "H1", datetime(2025, 1, 1))
+    assert [(r["symbol1"], r["symbol2"], r["correlation"]) for r in rows] == [
+        ("EURUSD", "GBPUSD", 0.8),
+        ("EURUSD", "USDJPY", -0.4),
+        ("GBPUSD", "USDJPY", -0.5),
+    ]
+
+    stmt = mysql_insert(CORRELATION_TABLE).values(rows)
+    sql = str(stmt.on_duplicate_key_update(correlation=stmt.inserted.correlation)
+              .compile(dialect=mysql.dialect()))
+    assert sql.count("INSERT") == 1 and "ON DUPLICATE KEY UPDATE" in sql
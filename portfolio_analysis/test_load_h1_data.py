@@ -1,34 +1,50 @@
 import os
-import pandas as pd
-
-EXPORT_DIR = "test_exports"
-os.makedirs(EXPORT_DIR, exist_ok=True)
+import numpy as np
+from portfolio_analysis.bar_store import BarStore, export_file_name
 
 csv_content = """Date,Time,Open,High,Low,Close,Tick volume
 2024.09.09,00:00:00,1.10864,1.1091,1.10823,1.10832,2104
 2024.09.09,01:00:00,1.10831,1.10909,1.10813,1.1082,3273
 """
 
+csv_update = """Date,Time,Open,High,Low,Close,Tick volume
+2024.09.09,01:00:00,1.10831,1.10909,1.10813,1.1082,3273
+2024.09.10,00:00:00,1.10820,1.10900,1.10800,1.10850,1800
+"""
+
 pair = "EURUSD"
-start_date = "2024.09.09"
-end_date = "2024.09.09"
-file_name = f"Dukascopy-{pair}-{start_date}-{end_date}-bardata_H1.csv"
-file_path = os.path.join(EXPORT_DIR, file_name)
-with open(file_path, "w") as f:
-    f.write(csv_content)
-
-def load_h1_data(pair, start_date, end_date):
-    file_name = f"Dukascopy-{pair}-{start_date}-{end_date}-bardata_H1.csv"
-    file_path = os.path.join(EXPORT_DIR, file_name)
-    df = pd.read_csv(file_path, sep=",")
-    df.columns = df.columns.str.strip()
-    df['datetime'] = pd.to_datetime(df['Date'] + " " + df['Time'])
-    df.set_index('datetime', inplace=True)
-    return df['Close']
-
-def test_load_h1_data():
-    close_series = load_h1_data(pair, start_date, end_date)
+
+def write_export(export_dir, start_date, end_date, content):
+    file_path = os.path.join(export_dir, export_file_name(pair, start_date, end_date))
+    with open(file_path, "w") as f:
+        f.write(content)
+    return file_path
+
+def test_load_h1_data(tmp_path):
+    export_dir = tmp_path / "test_exports"
+    export_dir.mkdir()
+    write_export(export_dir, "2024.09.09", "2024.09.09", csv_content)
+    store = BarStore(root=str(tmp_path / "bar_store"))
+    assert store.sync_exports(str(export_dir), [pair]) == {pair: 2}
+
+    close_series = store.close_series(pair, "2024.09.09", "2024.09.09")
     assert len(close_series) == 2
     assert close_series.iloc[0] == 1.10832
     assert close_series.iloc[1] == 1.1082
-    print(close_series)
\ No newline at end of file
+    assert store.last_close(pair) == 1.1082
+
+def test_bar_store_appends_only_new_bars(tmp_path):
+    export_dir = tmp_path / "test_exports"
+    export_dir.mkdir()
+    write_export(export_dir, "2024.09.09", "2024.09.09", csv_content)
+    store = BarStore(root=str(tmp_path / "bar_store"))
+    store.sync_exports(str(export_dir), [pair])
+    assert store.sync_exports(str(export_dir), [pair]) == {}
+
+    write_export(export_dir, "2024.09.09", "2024.09.10", csv_update)
+    assert store.sync_exports(str(export_dir), [pair]) == {pair: 1}
+    df = store.read(pair, columns=("open", "close", "volume"))
+    assert len(df) == 3
+    assert np.all(np.diff(df.index.values).astype("int64") > 0)
+    assert store.last_close(pair) == 1.10850
+    assert store.close_series(pair, "2024.09.10", "2024.09.10").tolist() == [1.10850]
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from portfolio_analysis.populate_pip_values import build_rate_table, pip_value_grid, pip_value_rows
+
+CLOSES = {"EURUSD": 1.10, "USDJPY": 150.0, "GBPUSD": 1.25}
+
+def rate(ccys, rates, a, b):
+    return rates[ccys.index(a), ccys.index(b)]
+
+def test_rate_table_inverse_and_triangulated_crosses():
+    ccys, rates = build_rate_table(CLOSES, currencies=["CHF"])
+    assert rate(ccys, rates, "USD", "EUR") == pytest.approx(1 / 1.10)
+    assert rate(ccys, rates, "EUR", "JPY") == pytest.approx(1.10 * 150.0)
+    assert rate(ccys, rates, "EUR", "GBP") == pytest.approx(1.10 / 1.25)
+    assert np.isnan(rate(ccys, rates, "CHF", "USD"))
+
+def test_grid_matches_per_pair_formula():
+    pairs = ["EURUSD", "USDJPY", "EURGBP", "USDCHF"]
+    lots, accounts = [0.01, 0.1, 1.0], ["USD", "EUR"]
+    ccys, rates = build_rate_table(CLOSES, currencies=accounts + ["CHF"])
+    grid, prices, quote_rates = pip_value_grid(pairs, lots, accounts, ccys, rates)
+
+    assert grid.shape == (4, 3, 2)
+    assert grid[0, 2, 0] == pytest.approx(10.0)                    # EURUSD, 1 lot, USD account
+    assert grid[1, 0, 0] == pytest.approx(0.01 * 100_000 * 0.01 / 150.0)
+    assert grid[2, 1, 1] == pytest.approx(0.1 * 100_000 * 0.0001 / (1.10 / 1.25))
+    assert prices[2] == pytest.approx(1.10 / 1.25)                 # synthesized EURGBP
+    assert quote_rates[1, 0] == pytest.approx(150.0)
+
+    rows = pip_value_rows(pairs, lots, accounts, grid, prices, quote_rates, "2025-01-01")
+    assert len(rows) == 3 * 3 * 2                                  # USDCHF has no price
+    assert {r["ccy_pair"] for r in rows} == {"EURUSD", "USDJPY", "EURGBP"}
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from portfolio_analysis.bar_store import BarStore
+from portfolio_analysis.rolling_correlation import RollingCorrelation
+
+pairs = ["EURUSD", "GBPUSD", "USDJPY"]
+
+def synthetic_bars(hours=24 * 40, seed=7):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2024-01-01", periods=hours, freq="h").values.astype("datetime64[s]").astype(np.int64)
+    common = rng.normal(0, 0.001, hours)
+    bars = {}
+    for i, pair in enumerate(pairs):
+        rets = common * (1 - 0.4 * i) + rng.normal(0, 0.001, hours)
+        close = 1.1 * np.exp(np.cumsum(rets))
+        bars[pair] = {"time": times, "open": close, "high": close, "low": close, "close": close, "volume": np.ones(hours)}
+    return bars
+
+def _slice(bars, lo, hi):
+    return {k: v[lo:hi] for k, v in bars.items()}
+
+def test_incremental_update_matches_full_recompute(tmp_path):
+    bars = synthetic_bars()
+    store = BarStore(root=str(tmp_path / "bars"))
+    for pair in pairs:
+        store.append(pair, _slice(bars[pair], 0, 24 * 25))
+
+    engine = RollingCorrelation(pairs, [5, 10], store=store, state_dir=str(tmp_path / "state"))
+    assert engine.update() > 0
+    engine.save()
+
+    for pair in pairs:
+        store.append(pair, _slice(bars[pair], 0, 24 * 40))
+    resumed = RollingCorrelation(pairs, [5, 10], store=store, state_dir=str(tmp_path / "state"))
+    assert resumed.load()
+    assert resumed.update() == 24 * 15
+
+    closes = pd.DataFrame({p: bars[p]["close"] for p in pairs},
+                          index=pd.to_datetime(bars[pairs[0]]["time"], unit="s"))
+    returns = np.log(closes / closes.shift(1)).dropna()
+    for days in (5, 10):
+        window = returns[returns.index > returns.index[-1] - pd.Timedelta(days=days)]
+        expected = window.corr().to_numpy()
+        np.testing.assert_allclose(resumed.correlation(days).to_numpy(), expected, atol=1e-9)
+    assert len(resumed.times) == 24 * 10
@@ -0,0 +1,249 @@
+"""
+Redis-backed result cache shared by every dashboard process and session.
+
+    @cached("controller.status_counts", tags=(TAG_TASKS,), ttl=30)
+    def status_counts(): ...
+
+Keys (prefix QUERY_CACHE_PREFIX):
+  {prefix}:tag:{tag}                         version counter per tag
+  {prefix}:val:{name}:{args hash}:{versions} serialized result (TTL)
+  {prefix}:lock:{...}                        single-flight recompute lock
+
+- Tag invalidation: each key embeds the current version of its tags, so
+  invalidate(tag) is one INCR and every dependent entry becomes unreachable
+  at once (old entries just expire).
+- Stampede protection: on a miss only the caller holding the lock recomputes;
+  the others poll for its result (up to QUERY_CACHE_WAIT_SECONDS) instead of
+  all running the same query.
+- Serialization: DataFrames as Arrow IPC streams, anything else pickled.
+- Invalidation is automatic for ORM sessions: rows of the tables in
+  TABLE_TAGS flushed or bulk-updated through a Session mark their tag, and
+  the tags are invalidated after that session commits. Raw-connection
+  writers call invalidate() themselves after committing.
+
+The cache is best effort: any Redis error makes the call run the function
+(or return the value it just computed). The client gives up on Redis within
+a second or two, and after a connection failure the cache is bypassed for
+30s, so neither queries nor commits wait on a Redis that is down.
+"""
+import io
+import time
+import uuid
+import pickle
+import hashlib
+import logging
+import functools
+
+import pandas as pd
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import config
+
+try:
+    import pyarrow as pa
+except ImportError:  # pickled DataFrames then
+    pa = None
+
+TAG_TASKS = "tasks"
+TAG_JOBS = "jobs"
+TAG_METRICS = "metrics"
+TAG_CORRELATION = "correlation"
+TAG_PORTFOLIOS = "portfolios"
+TAG_ARTIFACTS = "artifacts"
+TABLE_TAGS = {
+    "controller_tasks": TAG_TASKS,
+    "controller_attempts": TAG_TASKS,
+    "controller_jobs": TAG_JOBS,
+    "test_metrics": TAG_METRICS,
+    "portfolio_sets": TAG_PORTFOLIOS,
+    "controller_artifacts": TAG_ARTIFACTS,
+}
+
+_ARROW, _PICKLE = b"A", b"P"
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_redis = None
+# After a connection failure the cache is bypassed for a while instead of
+# making every query (and every commit) wait on Redis timeouts again.
+_RETRY_AFTER_SECONDS = 30
+_down_until = 0.0
+
+
+def _key(*parts):
+    return ":".join((config.QUERY_CACHE_PREFIX,) + parts)
+
+
+def get_redis():
+    global _redis
+    if time.time() < _down_until:
+        raise redis.ConnectionError("query cache disabled after a recent Redis failure")
+    if _redis is None:
+        _redis = redis.Redis(
+            host=config.REDIS_HOST, port=config.REDIS_PORT,
+            socket_connect_timeout=1, socket_timeout=2, retry=Retry(NoBackoff(), 0),
+        )
+    return _redis
+
+
+def mark_unavailable(e):
+    global _down_until
+    if isinstance(e, redis.ConnectionError):
+        _down_until = time.time() + _RETRY_AFTER_SECONDS
+
+
+# --- serialization ---
+def serialize(value):
+    if pa is not None and isinstance(value, pd.DataFrame):
+        try:
+            table = pa.Table.from_pandas(value, preserve_index=True)
+            sink = io.BytesIO()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return _ARROW + sink.getvalue()
+        except (pa.ArrowException, TypeError, ValueError):
+            pass  # e.g. mixed-type object columns
+    return _PICKLE + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize(data):
+    kind, body = data[:1], data[1:]
+    if kind == _ARROW:
+        return pa.ipc.open_stream(body).read_all().to_pandas()
+    return pickle.loads(body)
+
+
+# --- invalidation ---
+def invalidate(*tags, r=None):
+    """Bump the version of each tag; entries cached under the old versions are never read again."""
+    if not tags:
+        return
+    try:
+        pipe = (r or get_redis()).pipeline()
+        for tag in tags:
+            pipe.incr(_key("tag", tag))
+        pipe.execute()
+    except redis.RedisError as e:
+        mark_unavailable(e)
+        logging.warning(f"[query_cache] Invalidation of {tags} failed: {e}")
+
+
+def mark_dirty(session, *tags):
+    """Invalidate `tags` once `session` commits (dropped on rollback)."""
+    session.info.setdefault("query_cache_tags", set()).update(tags)
+
+
+@event.listens_for(Session, "after_flush")
+def _tag_flushed_rows(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tag = TABLE_TAGS.get(getattr(getattr(obj, "__table__", None), "name", None))
+        if tag:
+            mark_dirty(session, tag)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _tag_bulk_statements(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        tag = TABLE_TAGS.get(mapper.local_table.name) if mapper is not None else None
+        if tag:
+            mark_dirty(orm_execute_state.session, tag)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    invalidate(*session.info.pop("query_cache_tags", ()))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop("query_cache_tags", None)
+
+
+# --- lookups ---
+def _entry_key(r, name, tags, args, kwargs):
+    digest = hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()[:16]
+    versions = r.mget([_key("tag", t) for t in tags]) if tags else []
+    return _key("val", name, digest, ".".join((v or b"0").decode() for v in versions))
+
+
+def get_or_compute(name, compute, tags=(), ttl=None, args=(), kwargs=None, r=None):
+    """Cached result of compute(*args, **kwargs), recomputed by a single caller on a miss."""
+    kwargs = kwargs or {}
+    ttl = ttl or config.QUERY_CACHE_TTL_SECONDS
+    try:
+        r = r or get_redis()
+        key = _entry_key(r, name, tuple(tags), args, kwargs)
+        data = r.get(key)
+    except redis.RedisError as e:
+        mark_unavailable(e)
+        logging.warning(f"[query_cache] {name}: cache unavailable ({e}); querying directly.")
+        return compute(*args, **kwargs)
+    if data is not None:
+        return deserialize(data)
+
+    lock_key = key.replace(_key("val"), _key("lock"), 1)
+    token = uuid.uuid4().hex
+    try:
+        locked, data = _acquire(r, key, lock_key, token)
+    except redis.RedisError as e:
+        mark_unavailable(e)
+        logging.warning(f"[query_cache] {name}: cache unavailable ({e}); querying directly.")
+        return compute(*args, **kwargs)
+    try:
+        if data is not None:
+            return deserialize(data)
+        if not locked:
+            logging.warning(f"[query_cache] {name}: waited too long for recompute; querying directly.")
+            return compute(*args, **kwargs)
+        value = compute(*args, **kwargs)
+        try:
+            r.set(key, serialize(value), ex=int(ttl))
+        except redis.RedisError as e:
+            mark_unavailable(e)
+            logging.warning(f"[query_cache] {name}: storing the result failed ({e}).")
+        return value
+    finally:
+        if locked:
+            try:
+                r.register_script(_RELEASE_LUA)(keys=[lock_key], args=[token])
+            except redis.RedisError as e:
+                logging.warning(f"[query_cache] {name}: lock release failed ({e}); it expires on its own.")
+
+
+def _acquire(r, key, lock_key, token):
+    """
+    (locked, data): the recompute lock, or the result another caller stored
+    while we waited; (False, None) after QUERY_CACHE_WAIT_SECONDS.
+    """
+    deadline = time.time() + config.QUERY_CACHE_WAIT_SECONDS
+    while not r.set(lock_key, token, nx=True, px=int(config.QUERY_CACHE_LOCK_SECONDS * 1000)):
+        # Someone else is recomputing; wait for their result.
+        time.sleep(0.05)
+        data = r.get(key)
+        if data is not None:
+            return False, data
+        if time.time() > deadline:
+            return False, None
+    return True, r.get(key)  # filled while we were acquiring the lock
+
+
+def cached(name=None, tags=(), ttl=None):
+    """Decorator form of get_or_compute; arguments must have a stable repr()."""
+    def decorate(func):
+        cache_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_or_compute(cache_name, func, tags=tags, ttl=ttl, args=args, kwargs=kwargs)
+        wrapper.uncached = func
+        return wrapper
+    return decorate
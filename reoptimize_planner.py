@@ -0,0 +1,206 @@
+"""
+Idle auto re-optimization planner used by the supervisor.
+
+Each tick the planner:
+  1. estimates free worker capacity (recently active workers minus tasks in
+     progress, tasks waiting to be queued and .set files not yet picked up),
+  2. loads every candidate job in one set-based query (best metric per job,
+     jobs not yet re-optimized, status priority failed > partial > success),
+  3. picks up to that many candidates, preferring symbols that have been
+     re-optimized least (a cached per-symbol count, updated in memory as jobs
+     are triggered) and never more than REOPTIMIZE_MAX_PER_SYMBOL per symbol,
+  4. hands each pick to reoptimize_utils.reoptimize_by_metric().
+"""
+import os
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import sqlalchemy
+
+import config
+from reoptimize_utils import reoptimize_by_metric
+from db.status_constants import (
+    JOB_STATUS_FAILED, JOB_STATUS_COMPLETED_PARTIAL, JOB_STATUS_COMPLETED_SUCCESS,
+    STATUS_NEW, STATUS_QUEUED, STATUS_RETRYING, STATUS_FINE_TUNING, STATUS_WORKER_IN_PROGRESS,
+)
+
+# Job statuses eligible for auto re-optimization, highest priority first.
+REOPTIMIZE_STATUSES = [
+    JOB_STATUS_FAILED,
+    JOB_STATUS_COMPLETED_PARTIAL,
+    JOB_STATUS_COMPLETED_SUCCESS,
+]
+
+PENDING_TASK_STATUSES = [STATUS_NEW, STATUS_QUEUED, STATUS_RETRYING, STATUS_FINE_TUNING]
+
+CANDIDATES_SQL = sqlalchemy.text("""
+    SELECT job_id, ea_name, symbol, timeframe, job_status, metric_id, set_file_name, distance, score
+    FROM (
+        SELECT
+            jobs.id AS job_id,
+            jobs.ea_name,
+            jobs.symbol,
+            jobs.timeframe,
+            jobs.status AS job_status,
+            metrics.id AS metric_id,
+            metrics.set_file_name,
+            metrics.normalized_total_distance_to_good AS distance,
+            metrics.weighted_score AS score,
+            ROW_NUMBER() OVER (
+                PARTITION BY jobs.id
+                ORDER BY metrics.normalized_total_distance_to_good ASC, metrics.weighted_score DESC
+            ) AS rn
+        FROM controller_jobs jobs
+        JOIN controller_tasks tasks ON tasks.job_id = jobs.id
+        JOIN v_test_metrics_best_per_symbol metrics ON metrics.controller_task_id = tasks.id
+        WHERE metrics.id IS NOT NULL
+          AND jobs.status IN :statuses
+          AND NOT EXISTS (SELECT 1 FROM reoptimize_history rh WHERE rh.job_id = jobs.id)
+    ) ranked
+    WHERE rn = 1
+    ORDER BY CASE job_status WHEN :failed THEN 0 WHEN :partial THEN 1 ELSE 2 END,
+             distance ASC, score DESC
+    LIMIT :limit
+""").bindparams(sqlalchemy.bindparam("statuses", expanding=True))
+
+SYMBOL_COUNTS_SQL = sqlalchemy.text("""
+    SELECT cj.symbol, COUNT(*) AS cnt
+    FROM reoptimize_history rh
+    JOIN controller_jobs cj ON rh.job_id = cj.id
+    GROUP BY cj.symbol
+""")
+
+CAPACITY_SQL = sqlalchemy.text("""
+    SELECT
+        (SELECT COUNT(DISTINCT assigned_worker) FROM controller_tasks
+          WHERE assigned_worker IS NOT NULL AND last_heartbeat >= :since) AS workers,
+        (SELECT COUNT(*) FROM controller_tasks WHERE status = :in_progress) AS busy,
+        (SELECT COUNT(*) FROM controller_tasks WHERE status IN :pending) AS pending
+""").bindparams(sqlalchemy.bindparam("pending", expanding=True))
+
+_symbol_counts = {"loaded_at": 0.0, "counts": {}}
+_symbol_counts_lock = threading.Lock()
+
+
+def get_symbol_reoptimize_counts(conn, refresh=False):
+    """Per-symbol reoptimize_history counts, reloaded every REOPTIMIZE_COUNT_CACHE_SECONDS."""
+    with _symbol_counts_lock:
+        now = time.time()
+        if refresh or now - _symbol_counts["loaded_at"] >= config.REOPTIMIZE_COUNT_CACHE_SECONDS:
+            rows = conn.execute(SYMBOL_COUNTS_SQL).fetchall()
+            _symbol_counts["counts"] = {row.symbol: int(row.cnt) for row in rows}
+            _symbol_counts["loaded_at"] = now
+        return dict(_symbol_counts["counts"])
+
+
+def _record_reoptimized(symbol):
+    with _symbol_counts_lock:
+        counts = _symbol_counts["counts"]
+        counts[symbol] = counts.get(symbol, 0) + 1
+
+
+def free_worker_capacity(conn, watch_folder=None):
+    """Worker slots not already covered by running or waiting work."""
+    row = conn.execute(CAPACITY_SQL, {
+        "since": datetime.utcnow() - timedelta(minutes=config.REOPTIMIZE_WORKER_WINDOW_MINUTES),
+        "in_progress": STATUS_WORKER_IN_PROGRESS,
+        "pending": PENDING_TASK_STATUSES,
+    }).fetchone()
+    workers = config.REOPTIMIZE_WORKER_COUNT or max(int(row.workers or 0), 1)
+    # .set files in the watch folder become new tasks on the controller's next poll.
+    pending_files = len(list(Path(watch_folder).glob("*.set"))) if watch_folder and os.path.isdir(watch_folder) else 0
+    return max(0, workers - int(row.busy or 0) - int(row.pending or 0) - pending_files)
+
+
+def _status_rank(cand):
+    status = cand.get("job_status")
+    return REOPTIMIZE_STATUSES.index(status) if status in REOPTIMIZE_STATUSES else len(REOPTIMIZE_STATUSES)
+
+
+def plan_reoptimizations(candidates, symbol_counts, capacity, per_symbol_budget=None):
+    """
+    Pick up to `capacity` candidates (in priority order: distance, then score).
+    Higher-priority job statuses go first; within a status, the symbol with the
+    fewest re-optimizations so far goes first, and each symbol gets at most
+    `per_symbol_budget` picks.
+    """
+    per_symbol_budget = per_symbol_budget or config.REOPTIMIZE_MAX_PER_SYMBOL
+    by_symbol = {}
+    for rank, cand in enumerate(sorted(candidates, key=_status_rank)):
+        by_symbol.setdefault(cand["symbol"], []).append((rank, cand))
+
+    def key(sym, count):
+        rank, cand = by_symbol[sym][0]
+        return (_status_rank(cand), count, rank, sym)
+
+    heap = [key(sym, symbol_counts.get(sym, 0)) for sym in by_symbol]
+    heapq.heapify(heap)
+    taken = {}
+    plan = []
+    while heap and len(plan) < capacity:
+        _, count, _, sym = heapq.heappop(heap)
+        plan.append(by_symbol[sym].pop(0)[1])
+        taken[sym] = taken.get(sym, 0) + 1
+        if by_symbol[sym] and taken[sym] < per_symbol_budget:
+            heapq.heappush(heap, key(sym, count + 1))
+    return plan
+
+
+def run_reoptimize_planner(engine, watch_folder, user_id, max_per_tick=None):
+    """
+    Trigger re-optimizations to fill free worker capacity. Returns the number
+    of jobs re-optimized.
+    """
+    max_per_tick = config.REOPTIMIZE_MAX_PER_TICK if max_per_tick is None else max_per_tick
+    with engine.connect() as conn:
+        capacity = min(free_worker_capacity(conn, watch_folder), max_per_tick)
+        if capacity <= 0:
+            logging.debug("[reoptimize_planner] No free worker capacity.")
+            return 0
+        rows = conn.execute(CANDIDATES_SQL, {
+            "statuses": REOPTIMIZE_STATUSES,
+            "failed": JOB_STATUS_FAILED,
+            "partial": JOB_STATUS_COMPLETED_PARTIAL,
+            "limit": config.REOPTIMIZE_CANDIDATE_LIMIT,
+        }).mappings().all()
+        symbol_counts = get_symbol_reoptimize_counts(conn)
+
+    plan = plan_reoptimizations([dict(r) for r in rows], symbol_counts, capacity)
+    done = 0
+    for cand in plan:
+        job_row = {
+            "id": cand["job_id"],
+            "symbol": cand["symbol"],
+            "timeframe": cand["timeframe"],
+            "ea_name": cand["ea_name"],
+        }
+        metric_row = {
+            "metric_id": cand["metric_id"],
+            "set_file_name": cand["set_file_name"],
+        }
+        try:
+            reoptimize_by_metric(
+                engine=engine,
+                metric_id=cand["metric_id"],
+                job_row=job_row,
+                metric_row=metric_row,
+                user_id=user_id,
+                meta_extras={
+                    "auto_reoptimize": True,
+                    "auto_reoptimize_status": cand["job_status"]
+                },
+                prefix="A",
+                watch_folder=watch_folder
+            )
+            _record_reoptimized(cand["symbol"])
+            done += 1
+            logging.info(f"[reoptimize_planner] Auto re-optimized: job_id={job_row['id']} metric_id={cand['metric_id']} status={cand['job_status']}")
+        except Exception as e:
+            logging.error(f"[reoptimize_planner] Failed to auto reoptimize job_id={job_row['id']} metric_id={cand['metric_id']}: {e}")
+    if plan:
+        logging.info(f"[reoptimize_planner] Triggered {done}/{len(plan)} re-optimizations (capacity {capacity}, {len(rows)} candidates).")
+    return done
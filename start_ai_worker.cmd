@@ -0,0 +1,3 @@
+cd /d C:\Users\Philip\Documents\GitHub\PocketFlowProject
+call .\venv\Scripts\activate
+python -m ai_worker.main
\ No newline at end of file
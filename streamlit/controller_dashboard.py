@@ -7,21 +7,33 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 import redis
 from datetime import datetime, timedelta
+from db.connection import get_engine, get_read_engine, get_pool_metrics, find_leaked_sessions
 from session_manager import is_authenticated, sync_streamlit_session
+from telemetry import LiveState, latest_events, read_events
+from db.rollups import MINUTE, DAY, load_status_counts, load_transitions, load_queue_samples
+from db.status_constants import (
+    STATUS_WORKER_IN_PROGRESS, STATUS_RETRYING, STATUS_FINE_TUNING, STATUS_COMPLETED_SUCCESS, STATUS_COMPLETED_PARTIAL, STATUS_FAILED,
+)
 
 # --- CONFIGURATION ---
-if config.SQLALCHEMY_DATABASE_URL:
-    DB_URL = config.SQLALCHEMY_DATABASE_URL
-else:
-    DB_URL = (
-        f"mysql+pymysql://{config.MYSQL_USER}:{config.MYSQL_PASSWORD}"
-        f"@{config.MYSQL_HOST}:{config.MYSQL_PORT}/{config.MYSQL_DATABASE}"
-    )
-
-engine = sqlalchemy.create_engine(DB_URL)
+engine = get_engine()
+read_engine = get_read_engine()  # monitoring reads tolerate replica lag
 r = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
 REDIS_QUEUE = config.REDIS_QUEUE
 
+# --- MONITORING QUERIES ---
+# Everything below reads the rollup tables kept up to date by db/rollups.py
+# (status counts, per-minute/per-day transitions, supervisor queue samples),
+# never controller_tasks itself, so a page load costs the same at any history size.
+def load_rollups(now):
+    with read_engine.connect() as conn:
+        return {
+            "status": load_status_counts(conn),
+            "minute": load_transitions(conn, MINUTE, now - timedelta(hours=2)),
+            "day": load_transitions(conn, DAY, (now - timedelta(days=14)).replace(hour=0, minute=0, second=0, microsecond=0)),
+            "queue": load_queue_samples(conn, now - timedelta(hours=24)),
+        }
+
 # --- STREAMLIT APP ---
 st.set_page_config(page_title="Controller/Worker Monitoring Dashboard", layout="wide")
 st.markdown(
@@ -80,101 +92,138 @@ with engine.connect() as conn:
 
 st.markdown("---")
 
+# --- LIVE TELEMETRY (only this fragment reruns, reading new stream events) ---
+def _start_live_state():
+    # Stream position first, then the in-progress snapshot: events after that
+    # position are replayed on top of it, and replaying one twice is harmless.
+    state = LiveState().apply(latest_events(200))
+    with read_engine.connect() as conn:
+        rows = conn.execute(sqlalchemy.text(
+            "SELECT id, assigned_worker FROM controller_tasks WHERE status = :status"
+        ), {"status": STATUS_WORKER_IN_PROGRESS}).all()
+    state.in_progress = {task_id: worker or "?" for task_id, worker in rows}
+    if state.queue_depth is None:
+        state.queue_depth = r.llen(REDIS_QUEUE)
+    return state
+
+@st.fragment(run_every=config.TELEMETRY_REFRESH_SECONDS)
+def live_panel():
+    st.header("Live")
+    try:
+        if "live_state" not in st.session_state:
+            st.session_state["live_state"] = _start_live_state()
+        live = st.session_state["live_state"]
+        live.apply(read_events(live.last_id))
+    except redis.RedisError as e:
+        st.warning(f"Live telemetry unavailable: {e}")
+        return
+
+    lc1, lc2, lc3, lc4 = st.columns(4)
+    lc1.metric("Redis Queue Depth", live.queue_depth if live.queue_depth is not None else "-")
+    lc2.metric("Processing Queue", live.processing_depth if live.processing_depth is not None else "-")
+    lc3.metric("Tasks In Progress", len(live.in_progress))
+    lc4.metric("Status Changes Seen", live.transitions)
+    if live.queue_at:
+        st.caption(f"Queue depth as of {datetime.utcfromtimestamp(live.queue_at):%H:%M:%S} UTC.")
+
+    workers = live.workers()
+    if workers:
+        st.subheader("In Progress per Worker")
+        st.data_editor(
+            pd.DataFrame([{"worker": w, "tasks": len(ids), "task_ids": ", ".join(map(str, ids))} for w, ids in workers.items()]),
+            width="stretch", hide_index=True, disabled=True,
+        )
+    if live.recent_failures:
+        st.subheader("Recent Failures")
+        failures = pd.DataFrame(list(live.recent_failures))
+        failures["at"] = pd.to_datetime(failures["at"], unit="s")
+        st.data_editor(failures, width="stretch", hide_index=True, disabled=True)
+
+live_panel()
+
+rollups = load_rollups(datetime.utcnow())
+
 # --- TASK STATUS OVERVIEW ---
 st.header("Task Status Overview")
-with engine.connect() as conn:
-    df_status = pd.read_sql(
-        "SELECT status, COUNT(*) AS count FROM controller_tasks GROUP BY status", conn
-    )
+df_status = rollups["status"]
 if not df_status.empty:
     st.bar_chart(df_status.set_index("status"))
 else:
     st.info("No task data found in the database.")
 
-# --- QUEUE DEPTH ---
-queue_depth = r.llen(REDIS_QUEUE)
-st.metric("Redis Queue Depth", queue_depth)
-
 # --- AGING/WAIT TIME ---
 st.header("Task Aging / Wait Time")
-with engine.connect() as conn:
-    df_aging = pd.read_sql(
-        """
-        SELECT id, status, attempt_count, created_at, updated_at, 
-               TIMESTAMPDIFF(MINUTE, created_at, NOW()) as wait_mins
-        FROM controller_tasks 
-        WHERE status = 'new' OR status = 'retrying'
-        ORDER BY wait_mins DESC
-        LIMIT 20
-        """,
-        conn,
-    )
-if not df_aging.empty:
-    st.data_editor(df_aging, width="stretch", hide_index=True, disabled=True)
-    starved = df_aging[df_aging['wait_mins'] > 60]
-    if not starved.empty:
-        st.warning(f"⚠️ {len(starved)} tasks have been waiting over 60 minutes!")
+df_queue = rollups["queue"]
+if not df_queue.empty:
+    latest = df_queue.iloc[-1]
+    qc1, qc2, qc3 = st.columns(3)
+    qc1.metric("Waiting (new/retrying)", int(latest["waiting_tasks"]))
+    oldest = latest["oldest_wait_seconds"]
+    qc2.metric("Oldest Wait (min)", f"{oldest / 60:.0f}" if pd.notna(oldest) else "-")
+    qc3.metric(f"Waiting > {config.STARVED_TASK_MINUTES} min", int(latest["starved_tasks"]))
+    if latest["starved_tasks"] > 0:
+        st.warning(f"⚠️ {int(latest['starved_tasks'])} tasks have been waiting over {config.STARVED_TASK_MINUTES} minutes!")
+    st.caption(f"Sampled by the supervisor at {latest['sampled_at']} UTC.")
+    st.line_chart(df_queue.set_index("sampled_at")[["queue_depth", "waiting_tasks", "starved_tasks"]])
 else:
-    st.info("No new or retrying tasks waiting.")
+    st.info("No queue samples yet (the supervisor records one per poll).")
+
+df_minute = rollups["minute"]
+if not df_minute.empty:
+    left = df_minute[df_minute["from_status"] != ""]
+    if not left.empty:
+        st.subheader("Average Time in Status Before Moving On (last 2 hours)")
+        waits = left.groupby("from_status")[["wait_seconds", "transitions"]].sum()
+        waits["avg_wait_mins"] = (waits["wait_seconds"] / waits["transitions"] / 60).round(1)
+        st.data_editor(
+            waits[["transitions", "avg_wait_mins"]].reset_index(),
+            width="stretch", hide_index=True, disabled=True,
+        )
 
 # --- FINE-TUNE/RETRY CHAINS ---
 st.header("Fine-Tune / Retry Chains")
-with engine.connect() as conn:
-    df_chain = pd.read_sql(
-        """
-        SELECT id, parent_task_id, fine_tune_depth, attempt_count, status, updated_at
-        FROM controller_tasks
-        WHERE fine_tune_depth > 0 OR attempt_count > 1
-        ORDER BY updated_at DESC LIMIT 30
-        """,
-        conn,
-    )
+df_day = rollups["day"]
+df_chain = df_day[df_day["to_status"].isin([STATUS_RETRYING, STATUS_FINE_TUNING])]
 if not df_chain.empty:
-    st.data_editor(df_chain, width="stretch", hide_index=True, disabled=True)
+    st.bar_chart(df_chain.pivot_table(index="bucket_start", columns="to_status", values="transitions", aggfunc="sum").fillna(0))
 else:
     st.info("No fine-tune or retry chains found.")
 
 # --- FAILURE/ATTEMPT RATES ---
 st.header("Completions, Failures, Retries (Last 14 days)")
-with engine.connect() as conn:
-    df_result = pd.read_sql(
-        """
-        SELECT DATE(updated_at) as day, status, COUNT(*) as count
-        FROM controller_tasks
-        WHERE updated_at > CURDATE() - INTERVAL 14 DAY
-        GROUP BY day, status
-        """,
-        conn,
-    )
+outcomes = [STATUS_COMPLETED_SUCCESS, STATUS_COMPLETED_PARTIAL, STATUS_FAILED, STATUS_RETRYING]
+df_result = df_day[df_day["to_status"].isin(outcomes)]
 if not df_result.empty:
-    pivot = df_result.pivot(index="day", columns="status", values="count").fillna(0)
+    pivot = df_result.pivot_table(index="bucket_start", columns="to_status", values="transitions", aggfunc="sum").fillna(0)
     st.line_chart(pivot)
 else:
     st.info("No recent completion/failure/retry data.")
 
 # --- RECENT ACTIVITY ---
-st.header("Recent Task Activity")
-with engine.connect() as conn:
-    df_recent = pd.read_sql(
-        """
-        SELECT 
-            ct.id, 
-            ct.status, 
-            ct.attempt_count, 
-            ct.fine_tune_depth, 
-            vtm.weighted_score, 
-            vtm.normalized_total_distance_to_good, 
-            ct.last_error, 
-            ct.updated_at
-        FROM controller_tasks ct
-        LEFT JOIN v_test_metrics_scored vtm ON vtm.controller_task_id = ct.id
-        ORDER BY ct.updated_at DESC LIMIT 20
-        """,
-        conn,
+st.header("Recent Task Activity (last 2 hours)")
+if not df_minute.empty:
+    df_recent = df_minute.assign(from_status=df_minute["from_status"].replace("", "(created)"))
+    st.line_chart(df_recent.pivot_table(index="bucket_start", columns="to_status", values="transitions", aggfunc="sum").fillna(0))
+    st.data_editor(
+        df_recent.sort_values("bucket_start", ascending=False)[["bucket_start", "from_status", "to_status", "transitions"]],
+        width="stretch", hide_index=True, disabled=True,
     )
-if not df_recent.empty:
-    st.data_editor(df_recent, width="stretch", hide_index=True, disabled=True)
 else:
     st.info("No recent task activity found.")
 
-st.caption("Refresh the page to update live data.")
\ No newline at end of file
+# --- CONNECTION POOL ---
+st.header("Database Connection Pool (Dashboard Process)")
+pool_metrics = get_pool_metrics()
+if pool_metrics:
+    pc1, pc2, pc3, pc4 = st.columns(4)
+    pc1.metric("In Use", pool_metrics.get("in_use", 0))
+    pc2.metric("Pool Size / Overflow", f"{pool_metrics.get('pool_size', 0)} / {pool_metrics.get('overflow', 0)}")
+    pc3.metric("Avg Checkout Wait (ms)", f"{pool_metrics.get('avg_checkout_wait_ms', 0.0):.1f}")
+    pc4.metric("Checkout Timeouts", pool_metrics.get("checkout_timeouts", 0))
+    st.caption(pool_metrics.get("pool_status", ""))
+    leaked_sessions = find_leaked_sessions()
+    if leaked_sessions:
+        st.warning(f"⚠️ {len(leaked_sessions)} sessions open longer than {config.SESSION_LEAK_THRESHOLD_SECONDS}s")
+        st.data_editor(pd.DataFrame(leaked_sessions), width="stretch", hide_index=True, disabled=True)
+
+st.caption(f"The Live section updates every {config.TELEMETRY_REFRESH_SECONDS:g}s; refresh the page to update the rollup charts.")
\ No newline at end of file
@@ -9,8 +9,11 @@ import hashlib
 
 # --- CONFIG ---
 from db_utils import extract_setfile_metadata
+from db.connection import get_engine, get_read_engine
 import config
 import session_manager
+from db.job_summary import fetch_job_page
+from query_cache import cached, TAG_JOBS, TAG_TASKS
 
 # --- SHARED RE-OPTIMIZE LOGIC ---
 from reoptimize_utils import reoptimize_by_metric  # Shared utility at project root
@@ -31,14 +34,7 @@ ALLOWED_REOPTIMIZE_STATUSES = [
     JOB_STATUS_FAILED,
 ]
 
-if hasattr(config, "SQLALCHEMY_DATABASE_URL") and config.SQLALCHEMY_DATABASE_URL:
-    DB_URL = config.SQLALCHEMY_DATABASE_URL
-else:
-    DB_URL = (
-        f"mysql+pymysql://{config.MYSQL_USER}:{config.MYSQL_PASSWORD}"
-        f"@{config.MYSQL_HOST}:{config.MYSQL_PORT}/{config.MYSQL_DATABASE}"
-    )
-engine = sqlalchemy.create_engine(DB_URL)
+engine = get_engine()
 
 st.set_page_config(page_title="Job & Strategy Dashboard", layout="wide")
 
@@ -58,43 +54,13 @@ st.title("📋 Job & Strategy Dashboard")
 if "username" in st.session_state:
     session_manager.sync_streamlit_session(st.session_state, st.session_state["username"])
 
-@st.cache_data(ttl=60)
-def load_jobs(user_name=None, status=None):
-    query = """
-    SELECT * FROM (
-        SELECT 
-            controller_jobs.id,
-            (SELECT username FROM users WHERE id = controller_jobs.user_id) AS user,
-            controller_jobs.symbol,
-            controller_jobs.timeframe,
-            controller_jobs.ea_name,
-            SUBSTRING_INDEX(controller_jobs.original_file, '\\\\', -1) AS original_file,
-            controller_jobs.status,
-            controller_jobs.created_at,
-            task_summary.number_of_attempt,
-            task_summary.number_of_refine,
-            task_summary.latest_update
-        FROM
-            trading_optimization.controller_jobs,
-            (SELECT 
-                job_id,
-                    SUM(attempt_count) AS number_of_attempt,
-                    MAX(fine_tune_depth) AS number_of_refine,
-                    MAX(last_heartbeat) AS latest_update
-            FROM
-                controller_tasks
-            GROUP BY job_id) task_summary
-        WHERE
-            controller_jobs.id = task_summary.job_id
-    ) jobs
-    WHERE (%s IS NULL OR user = %s)
-      AND (%s IS NULL OR status = %s)
-    ORDER BY created_at DESC, id DESC
-    """
-    params = (user_name, user_name, status, status)
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn, params=params)
-    return df
+JOB_PAGE_SIZE = 50
+
+@cached("optimization_dashboard.job_page", tags=(TAG_JOBS, TAG_TASKS))
+def load_job_page(user_name=None, status=None, page_size=JOB_PAGE_SIZE, after=None):
+    # One keyset page of controller_job_summaries (kept current by db/job_summary.py).
+    with get_read_engine().connect() as conn:
+        return fetch_job_page(conn, user_name=user_name, status=status, page_size=page_size, after=after)
 
 @st.cache_data(ttl=30)
 def load_details(job_id: int):
@@ -126,7 +92,7 @@ def load_details(job_id: int):
             AND tasks.job_id = %s
     ORDER BY metrics.normalized_total_distance_to_good , metrics.weighted_score DESC
     """
-    with engine.connect() as conn:
+    with get_read_engine().connect() as conn:
         details = pd.read_sql(query, conn, params=(int(job_id),))
     return details
 
@@ -278,40 +244,31 @@ with st.expander("Filters"):
     selected_status_value = status_values[selected_status_idx]
     filter_btn = st.button("Apply Filter")
 
-jobs_df = load_jobs(
-    user_name=selected_user_value,
-    status=selected_status_value,
-)
+# Keyset pagination: remember the cursor that starts each visited page; reset when the filters change.
+ss = st.session_state
+query_key = (selected_user_value, selected_status_value)
+if ss.get("jobs_query_key") != query_key:
+    ss.jobs_query_key = query_key
+    ss.jobs_cursors = [None]
+cursors = ss.jobs_cursors
+page = load_job_page(user_name=selected_user_value, status=selected_status_value, after=cursors[-1])
+jobs_df = page.rows.rename(columns={"job_id": "id", "user_name": "user"})
 
 if jobs_df.empty:
     st.info("No jobs found.")
 else:
-    jobs_df_display = jobs_df.copy().reset_index(drop=True)
-    ss = st.session_state
-    if 'selected_job_index' not in ss:
-        ss.selected_job_index = None
-    if 'jobs_df_display' not in ss or not jobs_df_display.drop(columns=['selected'], errors='ignore').equals(
-            ss.jobs_df_display.drop(columns=['selected'], errors='ignore') if 'selected' in ss.jobs_df_display.columns else ss.jobs_df_display):
-        ss.jobs_df_display = jobs_df_display.copy()
-        ss.jobs_df_display['selected'] = [False] * len(jobs_df_display)
-        ss.selected_job_index = None
-
-    cols = ss.jobs_df_display.columns.tolist()
-    if 'selected' in cols:
-        cols.insert(0, cols.pop(cols.index('selected')))
-        ss.jobs_df_display = ss.jobs_df_display[cols]
+    # The selection is kept by job id, so refreshed rows (new attempts, heartbeats) keep it.
+    if ss.get('selected_job_id') not in set(jobs_df['id']):
+        ss.selected_job_id = None
+    jobs_df.insert(0, 'selected', jobs_df['id'] == ss.selected_job_id)
+    ss.jobs_df_display = jobs_df
 
     def select_change():
         edited_rows = ss.job_table['edited_rows']
         if edited_rows:
             recent_idx = list(edited_rows)[-1]
             was_checked = edited_rows[recent_idx].get("selected", False)
-            ss.jobs_df_display['selected'] = False
-            if was_checked:
-                ss.jobs_df_display.at[recent_idx, "selected"] = True
-                ss.selected_job_index = recent_idx
-            else:
-                ss.selected_job_index = None
+            ss.selected_job_id = int(ss.jobs_df_display.at[recent_idx, "id"]) if was_checked else None
 
     # Dynamically determine column width for "ea_name" (optional)
     if not ss.jobs_df_display.empty and "ea_name" in ss.jobs_df_display.columns:
@@ -333,9 +290,17 @@ else:
                 "ea_name": st.column_config.Column(width=ea_col_width),
             },
         )
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    if prev_col.button("◀ Previous", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    info_col.write(f"Page {len(cursors)}")
+    if next_col.button("Next ▶", disabled=page.cursor is None):
+        cursors.append(page.cursor)
+        st.rerun()
 
-    if ss.selected_job_index is not None:
-        selected_job_row = ss.jobs_df_display.iloc[ss.selected_job_index]
+    if ss.selected_job_id is not None:
+        selected_job_row = ss.jobs_df_display[ss.jobs_df_display['id'] == ss.selected_job_id].iloc[0]
         job_id = selected_job_row['id']
         st.markdown("#### Strategy Details for Selected Job")
         detail_df = load_details(int(job_id))
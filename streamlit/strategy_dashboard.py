@@ -5,21 +5,18 @@ import sys
 import os
 from io import BytesIO
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db_utils import get_db, store_set_file_summary
+from db.connection import get_engine, get_read_engine
+from db.strategy_query import fetch_strategy_page, count_strategies, SORTS
+from query_cache import cached, TAG_METRICS, TAG_ARTIFACTS
+from artifact_previews import thumbnail_type
+from db.equity_curves import load_equity_curves, curves_frame
 import config
 import redis
+from ai_queue import submit, get_job, set_file_summary_payload, KIND_SET_FILE_SUMMARY, STATUS_DONE, FINISHED
 from user_management.session_manager import is_authenticated, sync_streamlit_session
 
 # --- CONFIG ---
-if hasattr(config, "SQLALCHEMY_DATABASE_URL") and config.SQLALCHEMY_DATABASE_URL:
-    DB_URL = config.SQLALCHEMY_DATABASE_URL
-else:
-    DB_URL = (
-        f"mysql+pymysql://{config.MYSQL_USER}:{config.MYSQL_PASSWORD}"
-        f"@{config.MYSQL_HOST}:{config.MYSQL_PORT}/{config.MYSQL_DATABASE}"
-    )
-
-engine = sqlalchemy.create_engine(DB_URL)
+engine = get_engine()
 r = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
 
 # --- Session Check ---
@@ -38,63 +35,24 @@ user_rank = st.sidebar.number_input(
     help="Select which ranked strategies to display (default: 1 = best per symbol)"
 )
 
-# --- Load Data ---
-@st.cache_data(ttl=60)
-def load_metrics(user_rank):
-    query = """
-    SELECT
-      metric_id,
-      set_file_name,
-      symbol,
-      net_profit,
-      max_drawdown,
-      total_trades,
-      recovery_factor,
-      weighted_score,
-      normalized_total_distance_to_good,
-      win_rate,
-      profit_factor,
-      expected_payoff,
-      status,
-      criteria_reason,
-      created_at
-    FROM (
-      SELECT
-        id AS metric_id,
-        set_file_name,
-        symbol,
-        net_profit,
-        max_drawdown,
-        total_trades,
-        recovery_factor,
-        weighted_score,
-        normalized_total_distance_to_good,
-        win_rate,
-        profit_factor,
-        expected_payoff,
-        criteria_passed AS status,
-        criteria_reason,
-        created_at,
-        ROW_NUMBER() OVER (
-          PARTITION BY v_test_metrics_scored.symbol
-          ORDER BY v_test_metrics_scored.normalized_total_distance_to_good,
-                   v_test_metrics_scored.weighted_score DESC
-        ) AS rn
-      FROM v_test_metrics_scored
-    ) AS rank_metrics
-    WHERE rn <= %s
-    ORDER BY normalized_total_distance_to_good, weighted_score DESC
-    """
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn, params=(user_rank,))
-    return df
+# --- Load Data (shared Redis cache, invalidated when test metrics change) ---
+@cached("strategy_dashboard.metrics_page", tags=(TAG_METRICS,))
+def load_metrics_page(user_rank, search, sort, page_size, after):
+    with get_read_engine().connect() as conn:
+        return fetch_strategy_page(conn, user_rank=user_rank, search=search, sort=sort, page_size=page_size, after=after)
 
-@st.cache_data(ttl=60)
+@cached("strategy_dashboard.metrics_count", tags=(TAG_METRICS,))
+def load_metrics_count(user_rank, search):
+    with get_read_engine().connect() as conn:
+        return count_strategies(conn, user_rank=user_rank, search=search)
+
+@cached("strategy_dashboard.artifacts", tags=(TAG_ARTIFACTS,))
 def load_artifacts_for_task(link_id):
-    with engine.connect() as conn:
+    # Artifact list without the blobs; blobs are fetched one at a time by load_artifact_blob().
+    with get_read_engine().connect() as conn:
         df = pd.read_sql(
             """
-            SELECT artifact_type, file_name, file_blob
+            SELECT id, artifact_type, file_name
             FROM controller_artifacts
             WHERE link_id = %s
               and link_type = "test_metrics"
@@ -104,6 +62,18 @@ def load_artifacts_for_task(link_id):
         )
     return df
 
+def load_artifact_blob(artifact_id):
+    # Not cached: set files and report images would fill Redis; one primary-key read each.
+    with get_read_engine().connect() as conn:
+        return conn.execute(
+            sqlalchemy.text("SELECT file_blob FROM controller_artifacts WHERE id = :id"), {"id": int(artifact_id)}
+        ).scalar()
+
+def load_curves(metric_ids, labels):
+    # Downsampled equity/drawdown series (a few KB per strategy, cached in-process).
+    with get_read_engine().connect() as conn:
+        return curves_frame(load_equity_curves(conn, metric_ids), labels)
+
 def get_open_router_api_key():
     key = st.session_state.get("open_router_api_key")
     if key:
@@ -115,34 +85,28 @@ def get_open_router_api_key():
             return val
     return None
 
-def call_open_router_api(set_file_blob, summary_metrics_blob, user_api_key):
-    with open(os.path.join(os.path.dirname(__file__), "explain_set.md"), "r") as f:
-        prompt_template = f.read()
-    set_file_str = set_file_blob.decode() if isinstance(set_file_blob, bytes) else set_file_blob
-    summary_csv_str = summary_metrics_blob.decode() if isinstance(summary_metrics_blob, bytes) else summary_metrics_blob
-    prompt = prompt_template.replace("Here is the .set file:", f"Here is the .set file:\n\n{set_file_str}\n\n")
-    prompt = prompt.replace("And here is the backtest summary (.csv):", f"And here is the backtest summary (.csv):\n\n{summary_csv_str}\n\n")
-    import requests
-    headers = {
-        "Authorization": f"Bearer {user_api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "gpt-4o",
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
-    response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=data)
-    if response.status_code == 200:
-        result = response.json()
-        try:
-            ai_content = result["choices"][0]["message"]["content"]
-        except Exception:
-            ai_content = "Failed to parse AI response."
-        return ai_content
-    else:
-        return f"Error from OpenRouter: {response.status_code} - {response.text}"
+@st.fragment(run_every=config.AI_POLL_SECONDS)
+def ai_summary_status(metric_id):
+    """Polls the queued summary job; the AI worker saves the artifact, this only reports progress."""
+    job_state_key = f"ai_summary_job_{metric_id}"
+    try:
+        job = get_job(st.session_state[job_state_key])
+    except redis.RedisError as e:
+        st.warning(f"Cannot check the AI summary request: {e}")
+        return
+    if job is None or job["status"] in FINISHED:
+        del st.session_state[job_state_key]
+        if job is None:
+            st.session_state[f"ai_summary_error_{metric_id}"] = "The AI summary request expired before it was processed. Is the AI worker running?"
+        elif job["status"] == STATUS_DONE:
+            st.session_state[f"ai_summary_shown_{metric_id}"] = True
+            st.session_state[f"last_ai_summary_{metric_id}"] = job["result"]
+        else:
+            st.session_state[f"ai_summary_error_{metric_id}"] = job.get("error") or "Failed to generate AI Set File Summary."
+        st.rerun()
+    attempts = int(job.get("attempts") or 0)
+    retry_note = f" (attempt {attempts})" if attempts > 1 else ""
+    st.info(f"Generating AI summary via OpenRouter: {job['status']}{retry_note}... You can keep using the dashboard.")
 
 # --- UI Layout ---
 st.set_page_config(page_title="Strategy Dashboard", layout="wide")
@@ -159,45 +123,50 @@ st.markdown(
 )
 st.title("📈 Strategy Dashboard")
 
-metrics_df = load_metrics(user_rank)
-search = st.text_input("Search strategies...", "")
-
-if search:
-    filtered = metrics_df[metrics_df["set_file_name"].str.contains(search, case=False, na=False)]
-else:
-    filtered = metrics_df
-
-filtered = filtered.reset_index(drop=True)
-filtered['Rank'] = filtered.index + 1
-
-display_cols = [
-    "Rank", "set_file_name", "symbol", "net_profit", "max_drawdown",
-    "total_trades", "recovery_factor", "weighted_score", "win_rate", "profit_factor",
-    "expected_payoff", "normalized_total_distance_to_good", "status"
-]
-display_df = filtered[display_cols]
-
-st.write(f"Number of strategies found: {len(display_df)} for rank {user_rank}")
-
-max_page_size = min(50, len(display_df))
-default_page_size = min(3, max_page_size if max_page_size > 0 else 1)
-records_per_page_key = f"records_per_page_{len(display_df)}_{user_rank}"
-
+SEARCH_LABELS = {"contains": "name contains", "prefix": "name starts with", "fulltext": "words in name"}
+search = st.text_input(f"Search strategies ({SEARCH_LABELS.get(config.STRATEGY_SEARCH_MODE, 'name')})...", "")
+sort = st.selectbox("Sort by", list(SORTS), index=0)
 page_size = st.number_input(
     "Records per page",
     min_value=1,
-    max_value=max_page_size if max_page_size > 0 else 1,
-    value=st.session_state.get("page_size", default_page_size),
+    max_value=50,
+    value=st.session_state.get("page_size", 3),
     step=1,
-    key=records_per_page_key
 )
 st.session_state["page_size"] = page_size
 
-num_pages = max((len(display_df) - 1) // page_size + 1, 1)
-page_num = st.number_input("Page", min_value=1, max_value=num_pages, value=1, step=1)
-start_idx = (page_num - 1) * page_size
-end_idx = start_idx + page_size
-paged_df = display_df.iloc[start_idx:end_idx].reset_index(drop=True)
+total = load_metrics_count(user_rank, search)
+st.write(f"Number of strategies found: {total} for rank {user_rank}")
+
+# Keyset pagination: remember the cursor that starts each visited page; reset when the query changes.
+query_key = (user_rank, search, sort, page_size)
+if st.session_state.get("strategy_query_key") != query_key:
+    st.session_state["strategy_query_key"] = query_key
+    st.session_state["strategy_cursors"] = [None]
+cursors = st.session_state["strategy_cursors"]
+page_idx = len(cursors) - 1
+page = load_metrics_page(user_rank, search, sort, page_size, cursors[-1])
+
+num_pages = max((total - 1) // page_size + 1, 1)
+prev_col, info_col, next_col = st.columns([1, 2, 1])
+if prev_col.button("◀ Previous", disabled=page_idx == 0):
+    cursors.pop()
+    st.rerun()
+info_col.write(f"Page {page_idx + 1} of {num_pages}")
+if next_col.button("Next ▶", disabled=page.cursor is None):
+    cursors.append(page.cursor)
+    st.rerun()
+
+start_idx = page_idx * page_size
+filtered = page.rows.copy()
+filtered['Rank'] = start_idx + filtered.index + 1
+
+display_cols = [
+    "Rank", "set_file_name", "symbol", "net_profit", "max_drawdown",
+    "total_trades", "recovery_factor", "weighted_score", "win_rate", "profit_factor",
+    "expected_payoff", "normalized_total_distance_to_good", "status"
+]
+paged_df = filtered[display_cols]
 
 # --- Rename columns for UI/table display ---
 paged_df_ui = paged_df.rename(columns={
@@ -232,11 +201,25 @@ st.data_editor(
 )
 
 strategy_names = paged_df_ui["Strategy"].tolist()
+
+# --- Equity curve overlay for strategies on this page ---
+with st.expander("Compare Equity Curves"):
+    compare_names = st.multiselect("Strategies", strategy_names, default=strategy_names[:3], key="compare_curves")
+    if compare_names:
+        compare = filtered[filtered["set_file_name"].isin(compare_names)]
+        labels = dict(zip(compare["metric_id"].astype(int), compare["set_file_name"]))
+        curves_df = load_curves(list(labels), labels)
+        if curves_df.empty:
+            st.info("No closed trades found for the selected strategies.")
+        else:
+            st.line_chart(curves_df, x="time", y="equity", color="strategy")
+            st.caption("Drawdown")
+            st.line_chart(curves_df, x="time", y="drawdown", color="strategy")
+
 selected_name = st.selectbox("Select strategy for details", strategy_names)
 selected_idx = None
 if selected_name:
-    sel_row = paged_df_ui[paged_df_ui["Strategy"] == selected_name].index[0]
-    selected_idx = start_idx + sel_row
+    selected_idx = paged_df_ui[paged_df_ui["Strategy"] == selected_name].index[0]
 
 if selected_idx is not None and 0 <= selected_idx < len(filtered):
     strategy = filtered.iloc[selected_idx]
@@ -273,10 +256,11 @@ if selected_idx is not None and 0 <= selected_idx < len(filtered):
 
     if not set_file_row.empty:
         set_file = set_file_row.iloc[0]
-        if set_file["file_blob"] is not None:
+        set_file_blob = load_artifact_blob(int(set_file["id"]))
+        if set_file_blob is not None:
             st.download_button(
                 label=f"Download {set_file['file_name']}",
-                data=set_file["file_blob"],
+                data=set_file_blob,
                 file_name=set_file["file_name"],
                 mime="application/octet-stream"
             )
@@ -294,10 +278,21 @@ if selected_idx is not None and 0 <= selected_idx < len(filtered):
         if not gif_row.empty:
             break
 
+    curve_df = load_curves([int(strategy["metric_id"])], {})
+    if not curve_df.empty:
+        st.markdown("#### Equity Curve")
+        st.line_chart(curve_df, x="time", y=["equity", "drawdown"])
+
     if not gif_row.empty:
+        st.markdown("#### MT4 Tester Chart")
+        # Thumbnail by default (generated at sync time by artifact_previews.py); full GIF on request.
         gif = gif_row.iloc[0]
-        if gif["file_blob"] is not None:
-            st.image(BytesIO(gif["file_blob"]), caption=gif["file_name"], width="stretch")
+        thumb_row = artifacts[artifacts["artifact_type"] == thumbnail_type(gif["artifact_type"], max(config.ARTIFACT_THUMBNAIL_WIDTHS))]
+        full_size = thumb_row.empty or st.toggle("Show full-size equity curve", key=f"full_gif_{strategy['metric_id']}")
+        shown = gif if full_size else thumb_row.iloc[0]
+        image_blob = load_artifact_blob(int(shown["id"]))
+        if image_blob is not None:
+            st.image(BytesIO(image_blob), caption=gif["file_name"], width="stretch")
         else:
             st.info("No equity curve available (file is empty).")
     else:
@@ -307,7 +302,7 @@ if selected_idx is not None and 0 <= selected_idx < len(filtered):
     summary_shown_key = f"ai_summary_shown_{strategy['metric_id']}"
     summary_md = None
     if not set_file_summary_row.empty:
-        summary_md = set_file_summary_row.iloc[0]["file_blob"]
+        summary_md = load_artifact_blob(int(set_file_summary_row.iloc[0]["id"]))
         if isinstance(summary_md, bytes):
             summary_md = summary_md.decode()
         st.session_state[summary_shown_key] = True
@@ -323,7 +318,8 @@ if selected_idx is not None and 0 <= selected_idx < len(filtered):
     output_set_row = artifacts[artifacts["artifact_type"] == "output_set"]
     summary_metrics_csv_row = artifacts[artifacts["artifact_type"] == "summary_metrics_csv"]
     enable_button = user_api_key and not output_set_row.empty and not summary_metrics_csv_row.empty
-    disable_btn = st.session_state.get(summary_shown_key, False)
+    job_state_key = f"ai_summary_job_{strategy['metric_id']}"
+    disable_btn = st.session_state.get(summary_shown_key, False) or bool(st.session_state.get(job_state_key))
     btn = st.button(
         "Generate AI Set Summary",
         disabled=not enable_button or disable_btn,
@@ -333,25 +329,24 @@ if selected_idx is not None and 0 <= selected_idx < len(filtered):
         st.info("To enable: store your OpenRouter API key in your profile and make sure output_set and summary_metrics_csv are available.")
 
     if btn and enable_button and not disable_btn:
-        with st.spinner("Generating AI summary via OpenRouter..."):
-            set_file_blob = output_set_row.iloc[0]["file_blob"]
-            summary_metrics_blob = summary_metrics_csv_row.iloc[0]["file_blob"]
-            ai_summary = call_open_router_api(set_file_blob, summary_metrics_blob, user_api_key)
-            if ai_summary:
-                session = get_db()
-                try:
-                    store_set_file_summary(session, int(strategy["metric_id"]), ai_summary)
-                    st.success("Set file summary saved!")
-                    st.session_state[summary_shown_key] = True
-                    st.session_state[f"last_ai_summary_{strategy['metric_id']}"] = ai_summary
-                    st.markdown("### AI Set File Summary")
-                    st.markdown(ai_summary)
-                except Exception as e:
-                    st.error(f"Failed to save summary: {e}")
-            else:
-                st.error("Failed to generate AI Set File Summary.")
+        set_file_blob = load_artifact_blob(int(output_set_row.iloc[0]["id"]))
+        summary_metrics_blob = load_artifact_blob(int(summary_metrics_csv_row.iloc[0]["id"]))
+        try:
+            st.session_state[job_state_key] = submit(
+                KIND_SET_FILE_SUMMARY,
+                set_file_summary_payload(set_file_blob, summary_metrics_blob),
+                user_api_key,
+                meta={"metric_id": int(strategy["metric_id"])},
+            )
+        except redis.RedisError as e:
+            st.error(f"Failed to queue AI summary request: {e}")
+    if st.session_state.get(job_state_key):
+        ai_summary_status(strategy["metric_id"])
+    ai_error = st.session_state.pop(f"ai_summary_error_{strategy['metric_id']}", None)
+    if ai_error:
+        st.error(ai_error)
 else:
-    if len(display_df) == 0:
+    if total == 0:
         st.warning("No strategy data available.")
     else:
         st.info("Select a strategy from the table above to view details.")
@@ -5,6 +5,12 @@ import json
 import os
 import sqlalchemy
 
+from db.connection import get_engine, report_leaked_sessions
+from db.task_state import transition_task
+from db.rollups import ensure_rollup_tables, aggregate_transitions, snapshot_status_counts, sample_queue, prune_rollups
+from db.job_summary import ensure_job_summaries
+from db.strategy_query import ensure_strategy_rankings, update_strategy_rankings
+from query_cache import invalidate, TAG_METRICS
 from db_utils import (
     get_db,
     get_stuck_tasks,
@@ -13,8 +19,9 @@ from db_utils import (
     ControllerTask,
 )
 from notify import send_email, send_telegram
-from reoptimize_utils import reoptimize_by_metric
+from reoptimize_planner import run_reoptimize_planner
 import config
+from telemetry import publish_queue_depth
 
 # --- Use status constants from db.status_constants ---
 from db.status_constants import (
@@ -24,6 +31,7 @@ from db.status_constants import (
     JOB_STATUS_COMPLETED_SUCCESS,
     JOB_STATUS_COMPLETED_PARTIAL,
     JOB_STATUS_FAILED,
+    STATUS_FAILED,
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -108,8 +116,11 @@ def ensure_file_blob_in_redis(r, task, session):
             logging.info(f"Restored missing file_blob for task {task.id} from DB")
             return True
         else:
-            task.status = JOB_STATUS_FAILED
-            task.last_error = "Missing file_blob in Redis and DB"
+            if not transition_task(session, task.id, STATUS_FAILED, expected_status=task.status,
+                                   last_error="Missing file_blob in Redis and DB"):
+                session.commit()
+                logging.info(f"Task {task.id} changed status concurrently; not failing it for the missing file_blob.")
+                return False
             session.commit()
             logging.error(f"Failed to restore missing file_blob for task {task.id}; marked as failed")
             notify_task_failed(task)
@@ -144,106 +155,33 @@ def reconcile_db_redis(session, r):
 
 def auto_reoptimize_when_idle(engine, watch_folder, user_id):
     """
-    Performs auto-reoptimize if the queue is empty.
-    Auto-Reoptimize Summary:
+    Performs auto-reoptimize when workers are idle.
+    Auto-Reoptimize Summary (see reoptimize_planner):
      - Prioritizes job status in the following order:
        1. JOB_STATUS_FAILED
        2. JOB_STATUS_COMPLETED_PARTIAL
        3. JOB_STATUS_COMPLETED_SUCCESS
 
-     - Uses the view `v_test_metrics_best_per_symbol` to select the best metric for each job/symbol.
-       (Ensure this view is correctly defined to truly return the best metric per job/symbol.)
+     - Uses the view `v_test_metrics_best_per_symbol` to select the best metric for each job,
+       ordered by normalized_total_distance_to_good ASC, weighted_score DESC.
 
-     - Only selects jobs that have NOT been reoptimized yet:
-       SQL: AND NOT EXISTS (SELECT 1 FROM reoptimize_history WHERE job_id = jobs.id)
+     - Only selects jobs that have NOT been reoptimized yet (no reoptimize_history row).
 
-     - Orders candidates by:
-       ORDER BY normalized_total_distance_to_good ASC, weighted_score DESC
-       (This picks the metric closest to success.)
-
-     - LIMIT 1:
-       Only one job/metric is processed per idle period.
+     - Fills free worker capacity in one pass (at most REOPTIMIZE_MAX_PER_TICK jobs),
+       spreading picks across the least re-optimized symbols with at most
+       REOPTIMIZE_MAX_PER_SYMBOL per symbol.
     """
-    # Use imported job status constants
-    reopt_statuses = [
-        JOB_STATUS_FAILED,
-        JOB_STATUS_COMPLETED_PARTIAL,
-        JOB_STATUS_COMPLETED_SUCCESS,
-    ]
-
-    with engine.connect() as conn:
-        for status in reopt_statuses:
-            sql = """
-            SELECT 
-                jobs.id AS job_id,
-                jobs.ea_name,
-                jobs.symbol,
-                jobs.timeframe,
-                metrics.id AS metric_id,
-                metrics.set_file_name,
-                COALESCE((
-                    SELECT COUNT(*)
-                    FROM reoptimize_history repot
-                    JOIN controller_jobs cj ON repot.job_id = cj.id
-                    WHERE cj.symbol = jobs.symbol
-                ), 0) AS repot_sybmol_count
-            FROM
-                controller_jobs jobs
-            JOIN controller_tasks tasks ON tasks.job_id = jobs.id
-            JOIN v_test_metrics_best_per_symbol metrics ON metrics.controller_task_id = tasks.id
-            WHERE
-                metrics.id IS NOT NULL
-                AND jobs.status = :status
-            ORDER BY repot_sybmol_count ASC, normalized_total_distance_to_good ASC, weighted_score DESC
-            LIMIT 1
-            """
-            row = conn.execute(sqlalchemy.text(sql), {"status": status}).fetchone()
-            if not row:
-                continue
-
-            job_row = {
-                "id": row.job_id,
-                "symbol": row.symbol,
-                "timeframe": row.timeframe,
-                "ea_name": row.ea_name,
-            }
-            metric_row = {
-                "metric_id": row.metric_id,
-                "set_file_name": row.set_file_name,
-            }
-            metric_id = row.metric_id
-
-            try:
-                reoptimize_by_metric(
-                    engine=engine,
-                    metric_id=metric_id,
-                    job_row=job_row,
-                    metric_row=metric_row,
-                    user_id=user_id,
-                    meta_extras={
-                        "auto_reoptimize": True,
-                        "auto_reoptimize_status": status
-                    },
-                    prefix="A",
-                    watch_folder=watch_folder
-                )
-                logging.info(f"[auto_reoptimize_when_idle] Auto re-optimized: job_id={job_row['id']} metric_id={metric_id} status={status}")
-            except Exception as e:
-                logging.error(f"[auto_reoptimize_when_idle] Failed to auto reoptimize job_id={job_row['id']} metric_id={metric_id}: {e}")
-
-            # Only process one per idle period
-            break
+    return run_reoptimize_planner(engine, watch_folder, user_id)
 
 def main():
     r = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
-    if hasattr(config, "SQLALCHEMY_DATABASE_URL") and config.SQLALCHEMY_DATABASE_URL:
-        DB_URL = config.SQLALCHEMY_DATABASE_URL
-    else:
-        DB_URL = (
-            f"mysql+pymysql://{config.MYSQL_USER}:{config.MYSQL_PASSWORD}"
-            f"@{config.MYSQL_HOST}:{config.MYSQL_PORT}/{config.MYSQL_DATABASE}"
-        )
-    engine = sqlalchemy.create_engine(DB_URL)
+    engine = get_engine()
+    ensure_rollup_tables(engine)
+    ensure_job_summaries(engine)
+    ensure_strategy_rankings(engine)
+    rankings_version = update_strategy_rankings(engine)
+    rankings_checked = time.monotonic()
+    counts_reconciled = None
 
     while True:
         try:
@@ -262,13 +200,17 @@ def main():
                     if current_attempt < max_attempts:
                         if not ensure_file_blob_in_redis(r, task, session):
                             continue
-                        requeue_task(session, task)
+                        if not requeue_task(session, task):
+                            continue
                         logging.warning(
                             f"Task {task.id} ({task.file_path}) stuck for over {config.JOB_STUCK_THRESHOLD_MINUTES} min. Marked as retrying (attempt {current_attempt + 1}/{max_attempts})."
                         )
                         notify_task_retry(task, current_attempt)
                     else:
-                        task.status = JOB_STATUS_FAILED
+                        if not transition_task(session, task.id, STATUS_FAILED, expected_status=task.status):
+                            session.commit()
+                            logging.info(f"Stuck task {task.id} changed status concurrently; not failing it.")
+                            continue
                         session.commit()
                         logging.warning(
                             f"Task {task.id} ({task.file_path}) permanently failed after {max_attempts} attempts."
@@ -288,14 +230,35 @@ def main():
                 # --- Reconcile DB and Redis queue (unchanged) ---
                 reconcile_db_redis(session, r)
 
-            # --- AUTO REOPTIMIZE WHEN QUEUE IS EMPTY ---
-            if r.llen(config.REDIS_MAIN_QUEUE) == 0:
-                supervisor_user_id = getattr(config, "USER_ID", 1)
-                auto_reoptimize_when_idle(
-                    engine=engine,
-                    watch_folder=config.WATCH_FOLDER,
-                    user_id=supervisor_user_id
-                )
+                # --- Monitoring rollups: logged transitions folded in (status counts
+                # recounted now and then), queue sample for this minute, old minute rows pruned ---
+                aggregate_transitions(session)
+                if counts_reconciled is None or time.monotonic() - counts_reconciled >= config.STATUS_COUNT_RECONCILE_MINUTES * 60:
+                    snapshot_status_counts(session)
+                    counts_reconciled = time.monotonic()
+                sample_queue(session, r.llen(config.REDIS_QUEUE))
+                prune_rollups(session)
+                session.commit()
+                publish_queue_depth(r)
+
+            # --- Ranked strategy listing, rebuilt when test_metrics changed ---
+            if time.monotonic() - rankings_checked >= config.STRATEGY_RANKING_REFRESH_SECONDS:
+                built = rankings_version
+                rankings_version = update_strategy_rankings(engine, built)
+                rankings_checked = time.monotonic()
+                if rankings_version != built:
+                    invalidate(TAG_METRICS)
+
+            # --- Sessions left open in this process beyond the leak threshold ---
+            report_leaked_sessions()
+
+            # --- AUTO REOPTIMIZE INTO FREE WORKER CAPACITY ---
+            supervisor_user_id = getattr(config, "USER_ID", 1)
+            auto_reoptimize_when_idle(
+                engine=engine,
+                watch_folder=config.WATCH_FOLDER,
+                user_id=supervisor_user_id
+            )
 
         except Exception as e:
             import traceback
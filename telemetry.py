@@ -0,0 +1,139 @@
+"""
+Live controller telemetry over a Redis stream (TELEMETRY_STREAM).
+
+Controller, worker and supervisor append small events; the Controller
+Dashboard reads only the entries after the last id it has seen, so a refresh
+costs one XRANGE of the new deltas, not a round of MySQL queries.
+
+  kind=task   task, from, to, worker, error   a task status change
+  kind=queue  depth, processing               Redis queue lengths
+
+Task events are queued on the Session by transition_task() and the rollup
+flush hook, then published after that session commits and dropped on
+rollback, so the feed never shows a change that did not happen. The stream is
+trimmed to about TELEMETRY_STREAM_MAXLEN entries.
+
+Publishing is best effort: if Redis is unavailable the event is dropped.
+"""
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import config
+from query_cache import get_redis, mark_unavailable
+from db.status_constants import STATUS_WORKER_IN_PROGRESS, STATUS_WORKER_FAILED, STATUS_FAILED
+
+KIND_TASK = "task"
+KIND_QUEUE = "queue"
+FAILURE_STATUSES = (STATUS_WORKER_FAILED, STATUS_FAILED)
+_ERROR_CHARS = 200
+
+
+# --- publishing ---
+def publish(kind, r=None, **fields):
+    """XADD one event; fields with value None are left out."""
+    entry = {"kind": kind, "at": f"{time.time():.3f}"}
+    entry.update({k: str(v) for k, v in fields.items() if v is not None})
+    try:
+        (r or get_redis()).xadd(
+            config.TELEMETRY_STREAM, entry, maxlen=config.TELEMETRY_STREAM_MAXLEN, approximate=True
+        )
+    except redis.RedisError as e:
+        mark_unavailable(e)
+        logging.warning(f"[telemetry] Dropped {kind} event: {e}")
+
+
+def publish_queue_depth(r):
+    """Publish the main/processing queue lengths, read with the caller's client."""
+    try:
+        depth, processing = r.llen(config.REDIS_MAIN_QUEUE), r.llen(config.REDIS_PROCESSING_QUEUE)
+    except redis.RedisError as e:
+        logging.warning(f"[telemetry] Could not read queue depth: {e}")
+        return
+    publish(KIND_QUEUE, depth=depth, processing=processing)
+
+
+def task_changed(session, task_id, from_status, to_status, worker=None, error=None):
+    """Queue a task event on `session`; published once it commits."""
+    session.info.setdefault("telemetry_events", []).append({
+        "task": task_id, "from": from_status or "", "to": to_status,
+        "worker": worker, "error": error[:_ERROR_CHARS] if error else None,
+    })
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    events = session.info.pop("telemetry_events", ())
+    for fields in events:
+        publish(KIND_TASK, **fields)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    session.info.pop("telemetry_events", None)
+
+
+# --- consuming ---
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def read_events(after_id=None, count=1000, r=None):
+    """[(id, fields)] appended after `after_id` (oldest first)."""
+    start = f"({after_id}" if after_id else "-"
+    entries = (r or get_redis()).xrange(config.TELEMETRY_STREAM, min=start, max="+", count=count)
+    return [(_text(i), {_text(k): _text(v) for k, v in f.items()}) for i, f in entries]
+
+
+def latest_events(count=100, r=None):
+    """The last `count` events, oldest first (to start a view with some history)."""
+    entries = (r or get_redis()).xrevrange(config.TELEMETRY_STREAM, max="+", min="-", count=count)
+    return [(_text(i), {_text(k): _text(v) for k, v in f.items()}) for i, f in reversed(entries)]
+
+
+@dataclass
+class LiveState:
+    """What the dashboard shows, folded from the event stream."""
+    last_id: str = None
+    queue_depth: int = None
+    processing_depth: int = None
+    queue_at: float = None
+    in_progress: dict = field(default_factory=dict)          # task id -> worker
+    recent_failures: deque = field(default_factory=lambda: deque(maxlen=20))
+    transitions: int = 0
+
+    def apply(self, events):
+        for event_id, e in events:
+            self.last_id = event_id
+            kind = e.get("kind")
+            if kind == KIND_QUEUE:
+                self.queue_depth = int(e.get("depth", 0))
+                self.processing_depth = int(e.get("processing", 0))
+                self.queue_at = float(e.get("at", 0))
+            elif kind == KIND_TASK:
+                self.transitions += 1
+                task_id = int(e["task"])
+                # Events leaving worker_in_progress do not carry the worker; it is known from entering it.
+                worker = e.get("worker") or self.in_progress.get(task_id)
+                if e.get("to") == STATUS_WORKER_IN_PROGRESS:
+                    self.in_progress[task_id] = worker or "?"
+                else:
+                    self.in_progress.pop(task_id, None)
+                if e.get("to") in FAILURE_STATUSES:
+                    self.recent_failures.appendleft({
+                        "at": float(e.get("at", 0)), "task_id": task_id, "from": e.get("from"),
+                        "to": e.get("to"), "worker": worker, "error": e.get("error"),
+                    })
+        return self
+
+    def workers(self):
+        """{worker: [task ids]} of the tasks currently in progress."""
+        by_worker = {}
+        for task_id, worker in sorted(self.in_progress.items()):
+            by_worker.setdefault(worker, []).append(task_id)
+        return by_worker
@@ -0,0 +1,165 @@
+import uuid
+import asyncio
+
+import pytest
+import redis
+import redis.asyncio as aioredis
+
+import config
+import ai_cache
+import ai_queue
+import openrouter
+import ai_worker.main
+from ai_worker.main import AIWorker
+from ai_worker.mock_openrouter import serve
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    servers = []
+
+    def start(delay=0.0, fail_every=0):
+        server = serve(delay=delay, fail_every=fail_every)
+        servers.append(server)
+        monkeypatch.setattr(config, "OPENROUTER_URL", server.url)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_complete_returns_message_content(mock_api):
+    mock_api()
+    answer = openrouter.complete(openrouter.chat_payload("Explain this set file"), "key-1", session=openrouter.http_session(2))
+    assert answer.startswith("### Mock answer 1")
+    assert "Explain this set file" in answer
+
+def test_rate_limit_is_retryable_and_honours_retry_after(mock_api):
+    mock_api(fail_every=1)
+    with pytest.raises(openrouter.OpenRouterError) as info:
+        openrouter.complete(openrouter.chat_payload("hi"), "key-1")
+    assert (info.value.status, info.value.retryable, info.value.retry_after) == (429, True, 1.0)
+    assert openrouter.backoff_seconds(0, info.value) == 1.0
+
+def test_worker_retries_and_limits_requests_per_key(mock_api, monkeypatch):
+    server = mock_api(delay=0.2, fail_every=4)
+    monkeypatch.setattr(config, "AI_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(config, "AI_RETRY_MAX_SECONDS", 0.05)
+
+    async def run():
+        worker = AIWorker(r=None, worker_id="test", http=openrouter.http_session(8), concurrency=8, per_key=2)
+        calls = [worker.call(openrouter.chat_payload(f"prompt {i}"), f"key-{i % 2}") for i in range(8)]
+        return await asyncio.gather(*calls)
+
+    answers = asyncio.run(run())
+    assert len(answers) == 8 and all(a.startswith("### Mock answer") for a in answers)
+    assert server.requests > 8  # every 4th request was a 429 and got retried
+    assert server.max_in_flight == {"Bearer key-0": 2, "Bearer key-1": 2}
+
+def test_worker_runs_more_http_calls_at_once_than_the_default_executor(mock_api):
+    server = mock_api(delay=0.5)
+    worker = AIWorker(r=None, worker_id="test", http=openrouter.http_session(40), concurrency=40, per_key=40)
+
+    async def run():
+        return await asyncio.gather(*[worker.call(openrouter.chat_payload(f"p {i}"), "key-1") for i in range(40)])
+
+    try:
+        assert len(asyncio.run(run())) == 40
+    finally:
+        worker.close()
+    assert server.max_in_flight["Bearer key-1"] > 32  # the default executor never exceeds 32 threads
+
+def test_worker_survives_redis_errors_while_taking_jobs(monkeypatch):
+    monkeypatch.setattr(ai_worker.main, "_QUEUE_RETRY_SECONDS", 0.01)
+
+    class FlakyRedis:
+        calls, worker = 0, None
+
+        async def lindex(self, key, index):
+            return None
+
+        async def blmove(self, *args):
+            self.calls += 1
+            if self.calls < 3:
+                raise redis.ConnectionError("connection refused")
+            self.worker.stopping.set()
+            return None
+
+    async def run():
+        r = FlakyRedis()
+        r.worker = AIWorker(r, worker_id="test", concurrency=2, cache_r=object())
+        try:
+            await r.worker.run()
+        finally:
+            r.worker.close()
+        return r
+
+    r = asyncio.run(run())
+    assert r.calls == 3 and r.worker.slots._value == 2  # every slot released again
+
+def test_cache_key_ignores_line_endings_and_trailing_whitespace():
+    key = ai_cache.cache_key(openrouter.chat_payload("a = 1  \r\nb = 2\r\n"))
+    assert key == ai_cache.cache_key(openrouter.chat_payload("a = 1\nb = 2"))
+    assert key != ai_cache.cache_key(openrouter.chat_payload("a = 1\nb = 3"))
+    assert key != ai_cache.cache_key(openrouter.chat_payload("a = 1\nb = 2", model="openai/gpt-4o-mini"))
+
+@pytest.fixture
+def r(monkeypatch):
+    client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+    try:
+        client.ping()
+    except redis.RedisError:
+        pytest.skip("Redis server not available")
+    prefix = f"test_ai:{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(config, "AI_CACHE_PREFIX", f"{prefix}:cache")
+    monkeypatch.setattr(config, "AI_JOB_PREFIX", f"{prefix}:job:")
+    monkeypatch.setattr(config, "AI_QUEUE", f"{prefix}:queue")
+    yield client
+    for key in client.scan_iter(f"{prefix}:*"):
+        client.delete(key)
+
+def test_cache_evicts_least_recently_used(r, monkeypatch):
+    monkeypatch.setattr(config, "AI_CACHE_MAX_ENTRIES", 2)
+    ai_cache.store("a", "answer a", r)
+    ai_cache.store("b", "answer b", r)
+    assert ai_cache.lookup("a", r) == "answer a"  # "b" is now the least recently used
+    ai_cache.store("c", "answer c", r)
+    assert (ai_cache.lookup("a", r), ai_cache.lookup("b", r), ai_cache.lookup("c", r)) == ("answer a", None, "answer c")
+
+def test_cached_requests_are_answered_without_openrouter(r, mock_api):
+    server = mock_api()
+    payload = openrouter.chat_payload("Portfolio risk table")
+
+    async def ask():
+        worker = AIWorker(r=None, worker_id="test", cache_r=r)
+        return await worker.cached_call(payload, "key-1")
+
+    first = asyncio.run(ask())
+    assert asyncio.run(ask()) == first and server.requests == 1
+
+    job_id = ai_queue.submit(ai_queue.KIND_PORTFOLIO_INSIGHT, payload, "key-1", r=r)
+    job = ai_queue.get_job(job_id, r=r)
+    assert (job["status"], job["result"], job["cached"]) == (ai_queue.STATUS_DONE, first, "1")
+    assert r.llen(config.AI_QUEUE) == 0
+
+def test_restarted_worker_finishes_jobs_it_left_running(r, mock_api):
+    mock_api()
+    job_id = ai_queue.submit(ai_queue.KIND_PORTFOLIO_INSIGHT, openrouter.chat_payload("Risk table"), "key-1", r=r)
+    worker_id = f"test-{uuid.uuid4().hex[:8]}"
+    # The previous run took the job, marked it running and died.
+    r.lmove(config.AI_QUEUE, ai_queue.processing_queue(worker_id), "RIGHT", "LEFT")
+    r.hset(ai_queue.job_key(job_id), "status", ai_queue.STATUS_RUNNING)
+
+    async def restart():
+        client = aioredis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+        try:
+            worker = AIWorker(client, worker_id=worker_id, cache_r=r)
+            await worker.requeue_unfinished()
+            assert ai_queue.get_job(job_id, r=r)["status"] == ai_queue.STATUS_QUEUED
+            await worker.process(await client.blmove(config.AI_QUEUE, worker.processing, 1, "RIGHT", "LEFT"))
+        finally:
+            await client.aclose()
+
+    asyncio.run(restart())
+    assert ai_queue.get_job(job_id, r=r)["status"] == ai_queue.STATUS_DONE
+    assert r.llen(ai_queue.processing_queue(worker_id)) == 0
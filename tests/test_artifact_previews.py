@@ -0,0 +1,41 @@
+import io
+import json
+
+from PIL import Image
+
+import config
+from artifact_previews import generate_previews, make_thumbnail, thumbnail_type
+from db.db_models import ControllerArtifact
+
+def _gif(width=1200, height=600):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (20, 120, 200)).save(buf, "GIF")
+    return buf.getvalue()
+
+def test_thumbnail_keeps_aspect_and_never_upscales():
+    data, size, fmt = make_thumbnail(_gif(), 480, fmt="PNG")
+    assert size == (480, 240)
+    assert Image.open(io.BytesIO(data)).size == (480, 240)
+    _, size, _ = make_thumbnail(_gif(300, 100), 480, fmt="PNG")
+    assert size == (300, 100)
+
+def test_previews_are_stored_once_per_width(db_session, monkeypatch):
+    monkeypatch.setattr(config, "ARTIFACT_THUMBNAIL_WIDTHS", [480, 960])
+    source = ControllerArtifact(task_id=1, artifact_type="output_gif", file_name="curve.gif",
+                                file_blob=_gif(), link_type="test_metrics", link_id=7)
+    db_session.add_all([source, ControllerArtifact(task_id=1, artifact_type="output_set", file_blob=b"x=1")])
+    db_session.commit()
+    conn = db_session.connection()
+
+    added, last_id = generate_previews(conn, task_ids=[1])
+    assert (added, last_id) == (2, source.id)
+    assert generate_previews(conn, task_ids=[1])[0] == 0
+
+    thumbs = db_session.query(ControllerArtifact).filter(
+        ControllerArtifact.artifact_type == thumbnail_type("output_gif", 960)).all()
+    assert len(thumbs) == 1
+    thumb = thumbs[0]
+    assert (thumb.link_type, thumb.link_id) == ("test_metrics", 7)
+    meta = json.loads(thumb.meta_json)
+    assert (meta["source_artifact_id"], meta["width"], meta["height"]) == (source.id, 960, 480)
+    assert len(thumb.file_blob) < len(source.file_blob)
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, select, text
+
+import config
+import openrouter
+from ai_worker.batch_summaries import find_missing_summaries, load_inputs, summarize
+from ai_worker.main import AIWorker
+from ai_worker.mock_openrouter import serve
+from db.db_models import Base, ControllerArtifact
+
+@pytest.fixture
+def engine(tmp_path):
+    # A file database: summaries are written from a worker thread.
+    engine = create_engine(f"sqlite:///{tmp_path / 'batch.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE v_test_metrics_scored (
+                id INTEGER PRIMARY KEY, set_file_name TEXT, symbol TEXT, net_profit REAL,
+                max_drawdown REAL, total_trades INTEGER, recovery_factor REAL, weighted_score REAL,
+                normalized_total_distance_to_good REAL, win_rate REAL, profit_factor REAL,
+                expected_payoff REAL, criteria_passed INTEGER, criteria_reason TEXT, created_at TIMESTAMP
+            )
+        """))
+        for i in range(1, 7):
+            conn.execute(text("""
+                INSERT INTO v_test_metrics_scored (id, set_file_name, symbol, weighted_score, normalized_total_distance_to_good)
+                VALUES (:id, :name, :symbol, 1, :dist)
+            """), {"id": i, "name": f"EA_{i}.set", "symbol": "EURUSD" if i <= 3 else "GBPUSD", "dist": i / 10})
+        artifacts = []
+        for i in range(1, 7):
+            if i != 5:  # strategy 5 has no summary_metrics_csv
+                artifacts.append(("summary_metrics_csv", i, b"net_profit\n100"))
+            artifacts.append(("output_set", i, f"Lots={i}\r\n".encode()))
+        artifacts.append(("set_file_summary", 1, b"existing"))
+        conn.execute(ControllerArtifact.__table__.insert(), [
+            {"artifact_type": t, "link_type": "test_metrics", "link_id": link_id, "file_blob": blob}
+            for t, link_id, blob in artifacts
+        ])
+    yield engine
+    engine.dispose()
+
+def test_finds_top_ranked_strategies_without_summary(engine):
+    with engine.connect() as conn:
+        missing = find_missing_summaries(conn, top_n=2)
+    # Top 2 per symbol: 1, 2 (EURUSD) and 4, 5 (GBPUSD); 1 has a summary, 5 lacks its CSV.
+    assert [m[0] for m in missing] == [2, 4]
+
+def test_summaries_are_generated_concurrently_and_stored(engine, monkeypatch):
+    server = serve(delay=0.2)
+    monkeypatch.setattr(config, "OPENROUTER_URL", server.url)
+    try:
+        with engine.connect() as conn:
+            ids = [m[0] for m in find_missing_summaries(conn, top_n=3)]
+            inputs = load_inputs(conn, ids)
+
+        async def run():
+            worker = AIWorker(r=None, worker_id="batch", http=openrouter.http_session(3), per_key=3)
+            return await summarize(ids, inputs, "key-1", worker, engine, batch=2)
+
+        assert asyncio.run(run()) == (len(ids), 0, 0)
+        assert server.max_in_flight == {"Bearer key-1": 3}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with engine.connect() as conn:
+        stored = dict(conn.execute(
+            select(ControllerArtifact.link_id, ControllerArtifact.file_blob)
+            .where(ControllerArtifact.artifact_type == "set_file_summary")
+        ).all())
+        assert find_missing_summaries(conn, top_n=3) == []
+    assert set(stored) == {1, *ids} and stored[1] == b"existing"
+    assert all(stored[i].startswith(b"### Mock answer") for i in ids)
+
+def test_strategies_with_missing_inputs_are_skipped_and_counted(engine, monkeypatch):
+    server = serve()
+    monkeypatch.setattr(config, "OPENROUTER_URL", server.url)
+    try:
+        with engine.connect() as conn:
+            inputs = load_inputs(conn, [2, 4, 5])
+        del inputs[4]  # artifacts deleted between the listing and the load
+
+        async def run():
+            worker = AIWorker(r=None, worker_id="batch", http=openrouter.http_session(2), per_key=2)
+            return await summarize([2, 4, 5], inputs, "key-1", worker, engine)
+
+        assert asyncio.run(run()) == (1, 0, 2)  # 5 has no summary_metrics_csv
+        assert server.requests == 1
+    finally:
+        server.shutdown()
+        server.server_close()
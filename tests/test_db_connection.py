@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import create_engine, text
+import config
+import db.connection as connection
+from db.connection import InstrumentedQueuePool, get_read_engine
+
+@pytest.fixture
+def replica_engines(tmp_path, monkeypatch):
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setattr(config, "SQLALCHEMY_REPLICA_URL", f"sqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setitem(connection._engines, connection.PRIMARY, primary)
+    monkeypatch.setitem(connection._engines, connection.REPLICA, replica)
+    return primary, replica
+
+def test_instrumented_pool_records_checkouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=2,
+        max_overflow=0,
+    )
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert engine.pool.checkedout() == 1
+    raw = engine.raw_connection()
+    raw.close()
+    stats = engine.pool.stats.snapshot()
+    assert stats["checkouts"] == 2
+    assert stats["checkout_timeouts"] == 0
+    assert engine.pool.checkedout() == 0
+
+def test_read_engine_routes_by_replica_lag(replica_engines, monkeypatch):
+    primary, replica = replica_engines
+    monkeypatch.setattr(connection, "replica_lag_seconds", lambda refresh=False: 5.0)
+    assert get_read_engine(max_staleness=30) is replica
+    assert get_read_engine(max_staleness=1) is primary
+    assert get_read_engine(max_staleness=0) is primary
+
+def test_read_engine_falls_back_when_lag_unknown(replica_engines):
+    primary, _ = replica_engines
+    # SQLite has no replication status, so the lag is unknown and reads stay on the primary.
+    assert connection.replica_lag_seconds(refresh=True) is None
+    assert get_read_engine(max_staleness=3600) is primary
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from db.db_models import TradeRecord
+from db.equity_curves import lttb, equity_series, downsample, load_equity_curves, clear_equity_cache
+
+
+def test_lttb_keeps_endpoints_and_budget():
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 500.0)
+    keep = lttb(x, y, 200)
+    assert len(keep) == 200 and keep[0] == 0 and keep[-1] == 9_999
+    assert np.all(np.diff(keep) > 0)
+    np.testing.assert_array_equal(lttb(x[:50], y[:50], 200), np.arange(50))
+
+
+def test_equity_series_fills_balance_gaps_and_tracks_drawdown():
+    times = np.array(["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-04"], dtype="datetime64[s]")
+    curve = equity_series(times, [1010.0, np.nan, 1000.0, 1030.0], [10.0, -30.0, 20.0, 30.0])
+    np.testing.assert_allclose(curve.equity, [1000.0, 1010.0, 980.0, 1000.0, 1030.0])
+    np.testing.assert_allclose(curve.drawdown, [0.0, 0.0, -30.0, -10.0, 0.0])
+    assert curve.trades == 4
+
+
+def test_downsample_keeps_the_deepest_drawdown():
+    rng = np.random.default_rng(1)
+    profits = rng.normal(0, 10, 5_000)
+    profits[3_333] = -5_000.0
+    times = np.datetime64("2025-01-01") + np.arange(5_000).astype("timedelta64[h]")
+    full = equity_series(times, np.full(5_000, np.nan), profits)
+    small = downsample(full, 300)
+    assert len(small.equity) <= 301
+    assert small.drawdown.min() == full.drawdown.min()
+
+
+def test_load_equity_curves_caches_per_strategy(db_session):
+    clear_equity_cache()
+    start = datetime(2025, 1, 1)
+    for i, (p, b) in enumerate([(5.0, 105.0), (-2.0, 103.0)]):
+        db_session.add(TradeRecord(test_metrics_id=1, close_time=start + timedelta(days=i), profit=p, balance_after_trade=b))
+    db_session.add(TradeRecord(test_metrics_id=2, close_time=None, profit=1.0))
+    db_session.commit()
+
+    curves = load_equity_curves(db_session, [1, 2])
+    assert list(curves) == [1]
+    np.testing.assert_allclose(curves[1].equity, [100.0, 105.0, 103.0])
+    db_session.query(TradeRecord).delete()
+    db_session.commit()
+    assert load_equity_curves(db_session, [1])[1] is curves[1]
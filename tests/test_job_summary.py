@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+from db.db_models import ControllerJob, ControllerTask, JobSummary, User
+from db.job_summary import fetch_job_page, ensure_job_summaries
+from db.status_constants import STATUS_QUEUED, STATUS_RETRYING, STATUS_WORKER_IN_PROGRESS
+from db.task_state import transition_task, touch_task
+
+def _job(db_session, user, created_at, status="new", original_file="C:\\sets\\a.set"):
+    job = ControllerJob(user_id=str(user.id), symbol="EURUSD", timeframe="H1", ea_name="EA",
+                        original_file=original_file, status=status, created_at=created_at)
+    job.tasks.append(ControllerTask(status=STATUS_QUEUED, attempt_count=1, fine_tune_depth=0, max_attempts=3))
+    db_session.add(job)
+    db_session.commit()
+    return job
+
+def _user(db_session, name):
+    user = User(username=name, email=f"{name}@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+def _summary(db_session, job_id):
+    db_session.expire_all()
+    return db_session.get(JobSummary, job_id)
+
+def test_summary_follows_job_and_task_changes(db_session):
+    alice = _user(db_session, "alice")
+    job = _job(db_session, alice, datetime(2024, 1, 1))
+    task = job.tasks[0]
+    row = _summary(db_session, job.id)
+    assert (row.user_name, row.original_file, row.number_of_attempt, row.number_of_refine) == ("alice", "a.set", 1, 0)
+
+    assert transition_task(db_session, task.id, STATUS_RETRYING)
+    assert transition_task(db_session, task.id, STATUS_QUEUED, attempt_count=2)
+    assert transition_task(db_session, task.id, STATUS_WORKER_IN_PROGRESS)
+    heartbeat = datetime(2024, 1, 2, 3, 4, 5)
+    assert touch_task(db_session, task.id, last_heartbeat=heartbeat)
+    db_session.add(ControllerTask(job_id=job.id, status=STATUS_QUEUED, attempt_count=1, fine_tune_depth=2))
+    job.status = "in_progress"
+    db_session.commit()
+
+    row = _summary(db_session, job.id)
+    assert (row.status, row.number_of_attempt, row.number_of_refine, row.latest_update) == ("in_progress", 3, 2, heartbeat)
+
+def test_keyset_pages_with_filters(db_session):
+    alice, bob = _user(db_session, "alice"), _user(db_session, "bob")
+    start = datetime(2024, 1, 1)
+    jobs = [_job(db_session, alice if i % 2 else bob, start + timedelta(hours=i // 2), status="failed" if i % 3 == 0 else "new")
+            for i in range(7)]
+    conn = db_session.connection()
+
+    seen, cursor = [], None
+    while True:
+        page = fetch_job_page(conn, page_size=3, after=cursor)
+        seen += page.rows["job_id"].tolist()
+        cursor = page.cursor
+        if cursor is None:
+            break
+    expected = [j.id for j in sorted(jobs, key=lambda j: (j.created_at, j.id), reverse=True)]
+    assert seen == expected
+
+    page = fetch_job_page(conn, user_name="alice", status="failed", page_size=10)
+    assert page.rows["job_id"].tolist() == [j.id for j in jobs if j.id in {jobs[3].id}]
+    assert page.cursor is None
+
+def test_backfill_adds_missing_rows(db_session):
+    alice = _user(db_session, "alice")
+    job = _job(db_session, alice, datetime(2024, 1, 1))
+    db_session.query(JobSummary).delete()
+    db_session.commit()
+    assert ensure_job_summaries(db_session.get_bind()) == 1
+    assert _summary(db_session, job.id).user_name == "alice"
+
+def test_task_updates_reach_the_summary_only_at_commit(db_session):
+    job = _job(db_session, _user(db_session, "alice"), datetime(2024, 1, 1))
+    task_id = job.tasks[0].id
+    assert transition_task(db_session, task_id, STATUS_WORKER_IN_PROGRESS)
+    assert touch_task(db_session, task_id, last_heartbeat=datetime(2024, 1, 2))
+    assert _summary(db_session, job.id).latest_update is None  # summary row not touched in the task transaction
+    db_session.rollback()
+    assert _summary(db_session, job.id).latest_update is None
+
+    assert transition_task(db_session, task_id, STATUS_WORKER_IN_PROGRESS)
+    assert touch_task(db_session, task_id, last_heartbeat=datetime(2024, 1, 3))
+    db_session.commit()
+    assert _summary(db_session, job.id).latest_update == datetime(2024, 1, 3)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from user_management.monte_carlo import simulate, simulate_win_loss
+
+
+def reference(draws, ruin_level):
+    paths = np.cumsum(draws, axis=1)
+    peaks = np.maximum.accumulate(paths, axis=1)
+    return paths[:, -1], (peaks - paths).max(axis=1), paths.min(axis=1) < ruin_level
+
+
+def test_chunked_streaming_matches_full_matrix():
+    profits = np.array([50.0, -30.0, 20.0, -80.0, 10.0])
+    # Tiny max_cells forces chunking in both trials and trades.
+    res = simulate(profits, n_trades=37, n_trials=23, seed=7, ruin_level=-150, max_cells=10)
+
+    rng = np.random.default_rng(7)
+    # Same draw order as the engine: step chunk 10, trial chunk 1.
+    draws = np.vstack([
+        np.concatenate([profits[rng.integers(0, 5, size=(1, c))] for c in (10, 10, 10, 7)], axis=1)
+        for _ in range(23)
+    ])
+    final, dd, ruined = reference(draws, -150)
+    np.testing.assert_allclose(res["return_distribution"], final)
+    np.testing.assert_allclose(res["drawdown_distribution"], dd)
+    assert res["ruin_prob"] == pytest.approx(ruined.mean())
+    assert res["max_drawdown"] == pytest.approx(np.median(dd))
+
+
+def test_seed_is_reproducible_and_block_bootstrap_keeps_runs():
+    profits = np.arange(1.0, 101.0)
+    a = simulate(profits, n_trades=50, n_trials=100, block_size=10, seed=3)
+    b = simulate(profits, n_trades=50, n_trials=100, block_size=10, seed=3)
+    np.testing.assert_array_equal(a["return_distribution"], b["return_distribution"])
+    # All profits positive: no drawdown and no ruin.
+    assert a["max_drawdown"] == 0 and a["ruin_prob"] == 0
+
+
+def test_win_loss_matches_expectation():
+    res = simulate_win_loss(0.6, 10, 10, n_trades=100, n_trials=4000, seed=1)
+    assert res["return_distribution"].mean() == pytest.approx(100 * (0.6 * 10 - 0.4 * 10), rel=0.1)
+    with pytest.raises(ValueError):
+        simulate([1.0, -1.0], probs=[0.5, 0.5], block_size=5)
+
+
+def test_metrics_keep_the_previous_definitions():
+    # Path -10, -20: the drawdown is measured from the first trade (10), not from 0 (20),
+    # and touching the ruin level exactly is not ruin.
+    res = simulate([-10.0], n_trades=2, n_trials=3, seed=0, ruin_level=-20)
+    assert res["max_drawdown"] == 10
+    assert res["ruin_prob"] == 0
@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import text
+
+import db_utils
+from db_utils import get_portfolio_currency_correlation
+
+@pytest.fixture
+def matrix(db_session, monkeypatch):
+    db_session.execute(text(
+        "CREATE TABLE Correlation_Matrix (symbol1 TEXT, symbol2 TEXT, timeframe TEXT, correlation REAL)"
+    ))
+    db_session.execute(text("INSERT INTO Correlation_Matrix VALUES ('EURUSD', 'GBPUSD', 'H1', 0.8)"))
+    return lambda *symbols: monkeypatch.setattr(db_utils, "get_portfolio_symbols", lambda s, p: list(symbols))
+
+def _pairs(df):
+    return {(a, b): c for a, b, c in df.itertuples(index=False)}
+
+def test_every_portfolio_symbol_gets_its_diagonal(db_session, matrix):
+    matrix("EURUSD (Euro vs US Dollar)", "GBPUSD", "USDJPY")
+    assert _pairs(get_portfolio_currency_correlation(db_session, 1)) == {
+        ("EURUSD", "GBPUSD"): 0.8, ("GBPUSD", "EURUSD"): 0.8,
+        ("EURUSD", "EURUSD"): 1.0, ("GBPUSD", "GBPUSD"): 1.0, ("USDJPY", "USDJPY"): 1.0,
+    }
+
+def test_single_symbol_portfolio_returns_the_diagonal(db_session, matrix):
+    matrix("USDJPY")
+    assert _pairs(get_portfolio_currency_correlation(db_session, 1)) == {("USDJPY", "USDJPY"): 1.0}
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from user_management.portfolio_monte_carlo import (
+    daily_pnl_grid, simulate_portfolio, pack_simulation, unpack_simulation, summarize,
+)
+
+
+def test_daily_grid_buckets_by_close_day_on_shared_calendar():
+    trades = pd.DataFrame({
+        "strategy": [1, 1, 2, 2],
+        "close_time": pd.to_datetime(["2025-01-01 10:00", "2025-01-01 18:00", "2025-01-01 12:00", "2025-01-04 09:00"]),
+        "profit": [10.0, -4.0, 3.0, 7.0],
+    })
+    days, strategies, grid = daily_pnl_grid(trades)
+    assert strategies == [1, 2]
+    assert len(days) == 4
+    np.testing.assert_allclose(grid, [[6, 3], [0, 0], [0, 0], [0, 7]])
+
+
+def test_joint_resampling_keeps_same_day_losses_together():
+    # Two strategies that always lose on the same days: joint drawdowns add up.
+    days = np.array([[30.0, 30.0], [-20.0, -20.0]] * 50)
+    res = simulate_portfolio(days, n_trials=4000, block_size=1, seed=5, ruin_level=-200, max_workers=2)
+    solo = simulate_portfolio(days[:, :1], n_trials=4000, block_size=1, seed=5, ruin_level=-200, max_workers=2)
+    assert len(res["return_distribution"]) == 4000
+    np.testing.assert_allclose(res["drawdown_distribution"], 2 * solo["drawdown_distribution"])
+    assert res["ruin_prob"] > solo["ruin_prob"]
+    assert res["strategy_correlation"][0, 1] == pytest.approx(1.0)
+
+
+def test_blob_round_trip():
+    res = simulate_portfolio(np.array([[1.0, -2.0], [3.0, 0.5], [-1.0, 1.0]]), n_trials=50, seed=1)
+    blob = pack_simulation(res, [11, 12])
+    data = unpack_simulation(blob)
+    assert data["return_distribution"].dtype == np.float32
+    np.testing.assert_allclose(data["return_distribution"], res["return_distribution"], rtol=1e-6)
+    assert list(data["strategies"]) == ["11", "12"]
+    assert summarize(res, [11, 12])["trials"] == 50
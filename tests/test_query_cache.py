@@ -0,0 +1,103 @@
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pytest
+import redis
+
+import config
+import query_cache
+from db.db_models import ControllerTask
+from db.status_constants import STATUS_QUEUED, STATUS_WORKER_IN_PROGRESS
+from db.task_state import transition_task
+from query_cache import get_or_compute, invalidate, serialize, deserialize, TAG_TASKS
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    calls = []
+    monkeypatch.setattr(query_cache, "invalidate", lambda *tags, r=None: calls.append(set(tags)))
+    return calls
+
+def test_commits_invalidate_touched_tables_only(db_session, invalidated):
+    task = ControllerTask(status=STATUS_QUEUED, attempt_count=0, max_attempts=3)
+    db_session.add(task)
+    db_session.commit()
+    assert invalidated == [{TAG_TASKS}]
+
+    # Conditional bulk UPDATE (no flushed objects) is caught too.
+    transition_task(db_session, task.id, STATUS_WORKER_IN_PROGRESS)
+    db_session.commit()
+    assert invalidated[-1] == {TAG_TASKS}
+
+    transition_task(db_session, task.id, STATUS_QUEUED)
+    db_session.rollback()
+    db_session.commit()
+    assert invalidated[-1] == set()
+
+def test_dataframe_round_trip():
+    df = pd.DataFrame({"status": ["new", "failed"], "count": [3, 1]})
+    pd.testing.assert_frame_equal(deserialize(serialize(df)), df)
+    assert deserialize(serialize({"a": 1})) == {"a": 1}
+
+class FailingRedis:
+    """Redis client whose SET of locks or of results fails, as when Redis goes away mid-call."""
+
+    def __init__(self, fail):
+        self.fail = fail
+
+    def mget(self, keys):
+        return [None] * len(keys)
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, nx=False, **kwargs):
+        if self.fail == ("lock" if nx else "store"):
+            raise redis.ConnectionError("connection lost")
+        return True
+
+    def register_script(self, script):
+        return lambda keys, args: 0
+
+@pytest.mark.parametrize("fail", ["lock", "store"])
+def test_redis_errors_fall_back_to_the_query(monkeypatch, fail):
+    monkeypatch.setattr(query_cache, "_down_until", 0.0)
+    runs = []
+    assert get_or_compute("q", lambda: runs.append(1) or "value", r=FailingRedis(fail)) == "value"
+    assert runs == [1] and query_cache._down_until > time.time()
+
+@pytest.fixture
+def r(monkeypatch):
+    client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT)
+    try:
+        client.ping()
+    except redis.RedisError:
+        pytest.skip("Redis server not available")
+    prefix = f"test_query_cache:{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(config, "QUERY_CACHE_PREFIX", prefix)
+    yield client
+    for key in client.scan_iter(f"{prefix}:*"):
+        client.delete(key)
+
+def test_single_flight_and_tag_invalidation(r):
+    runs = []
+
+    def slow_query():
+        runs.append(1)
+        time.sleep(0.3)
+        return pd.DataFrame({"n": [len(runs)]})
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(get_or_compute("q", slow_query, tags=(TAG_TASKS,), r=r)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(runs) == 1 and all(df["n"].iloc[0] == 1 for df in results)
+
+    invalidate(TAG_TASKS, r=r)
+    assert get_or_compute("q", slow_query, tags=(TAG_TASKS,), r=r)["n"].iloc[0] == 2
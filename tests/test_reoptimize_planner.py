@@ -0,0 +1,19 @@
+from reoptimize_planner import plan_reoptimizations
+
+def _cand(job_id, symbol, status="failed"):
+    return {"job_id": job_id, "symbol": symbol, "job_status": status}
+
+def test_plan_fills_capacity_across_least_reoptimized_symbols():
+    candidates = [_cand(1, "EURUSD"), _cand(2, "EURUSD"), _cand(3, "GBPUSD"), _cand(4, "USDJPY")]
+    plan = plan_reoptimizations(candidates, {"EURUSD": 5, "GBPUSD": 1}, capacity=3, per_symbol_budget=1)
+    assert [c["job_id"] for c in plan] == [4, 3, 1]
+
+def test_plan_respects_status_priority_and_symbol_budget():
+    candidates = [
+        _cand(1, "EURUSD", "completed_success"),
+        _cand(2, "GBPUSD", "failed"),
+        _cand(3, "GBPUSD", "failed"),
+        _cand(4, "GBPUSD", "failed"),
+    ]
+    plan = plan_reoptimizations(candidates, {}, capacity=10, per_symbol_budget=2)
+    assert [c["job_id"] for c in plan] == [2, 3, 1]
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+from db.db_models import ControllerTask, TaskTransitionEvent, TaskTransitionRollup
+from db.rollups import (
+    MINUTE, DAY, load_status_counts, load_transitions, load_queue_samples,
+    aggregate_transitions, snapshot_status_counts, sample_queue, prune_rollups,
+)
+from db.status_constants import STATUS_NEW, STATUS_QUEUED, STATUS_WORKER_IN_PROGRESS, STATUS_FAILED
+from db.task_state import transition_task
+
+def _counts(db_session, reconcile=False):
+    # What the supervisor does each poll (and, now and then, the recount).
+    aggregate_transitions(db_session)
+    if reconcile:
+        snapshot_status_counts(db_session)
+    db_session.commit()
+    return dict(load_status_counts(db_session.connection()).itertuples(index=False))
+
+def test_transitions_keep_status_counts_and_rollups(db_session):
+    tasks = [ControllerTask(status=STATUS_NEW, attempt_count=0, max_attempts=3) for _ in range(3)]
+    db_session.add_all(tasks)
+    db_session.commit()
+    assert db_session.query(TaskTransitionEvent).count() == 3  # logged only, no counter touched
+    assert _counts(db_session) == {STATUS_NEW: 3}
+    assert db_session.query(TaskTransitionEvent).count() == 0
+
+    assert transition_task(db_session, tasks[0].id, STATUS_QUEUED)
+    assert transition_task(db_session, tasks[0].id, STATUS_WORKER_IN_PROGRESS)
+    tasks[1].status = STATUS_FAILED  # ORM status change, recorded on flush
+    db_session.commit()
+    assert _counts(db_session) == {STATUS_NEW: 1, STATUS_WORKER_IN_PROGRESS: 1, STATUS_FAILED: 1}
+
+    db_session.delete(tasks[2])
+    db_session.commit()
+    assert _counts(db_session) == {STATUS_NEW: 1, STATUS_WORKER_IN_PROGRESS: 1, STATUS_FAILED: 1}
+    assert _counts(db_session, reconcile=True) == {STATUS_WORKER_IN_PROGRESS: 1, STATUS_FAILED: 1}
+
+    since = datetime.utcnow() - timedelta(days=1)
+    for granularity in (MINUTE, DAY):
+        df = load_transitions(db_session.connection(), granularity, since)
+        by_edge = df.groupby(["from_status", "to_status"])["transitions"].sum().to_dict()
+        assert by_edge == {
+            ("", STATUS_NEW): 3,
+            (STATUS_NEW, STATUS_QUEUED): 1,
+            (STATUS_QUEUED, STATUS_WORKER_IN_PROGRESS): 1,
+            (STATUS_NEW, STATUS_FAILED): 1,
+        }
+
+def test_aggregation_in_batches_and_counts_from_writes_that_bypass_the_log(db_session):
+    tasks = [ControllerTask(status=STATUS_NEW, attempt_count=0, max_attempts=3) for _ in range(5)]
+    db_session.add_all(tasks)
+    db_session.commit()
+    assert aggregate_transitions(db_session, batch=2) == 5
+    db_session.commit()
+    df = load_transitions(db_session.connection(), DAY, datetime.utcnow() - timedelta(days=1))
+    assert df["transitions"].sum() == 5
+
+    assert _counts(db_session) == {STATUS_NEW: 5}
+
+    # A raw UPDATE logs nothing; the recount puts the task where it is.
+    db_session.execute(ControllerTask.__table__.update().where(ControllerTask.id == tasks[0].id)
+                       .values(status=STATUS_FAILED))
+    db_session.commit()
+    assert _counts(db_session) == {STATUS_NEW: 5}
+    assert _counts(db_session, reconcile=True) == {STATUS_NEW: 4, STATUS_FAILED: 1}
+
+def test_lost_race_is_not_counted(db_session):
+    task = ControllerTask(status=STATUS_FAILED, attempt_count=0, max_attempts=3)
+    db_session.add(task)
+    db_session.commit()
+    assert not transition_task(db_session, task.id, STATUS_WORKER_IN_PROGRESS)
+    db_session.commit()
+    assert _counts(db_session) == {STATUS_FAILED: 1}
+
+def test_queue_sample_and_prune(db_session):
+    now = datetime(2024, 1, 1, 12, 0, 30)
+    db_session.add_all([
+        ControllerTask(status=STATUS_NEW, created_at=now - timedelta(minutes=90)),
+        ControllerTask(status=STATUS_NEW, created_at=now - timedelta(minutes=5)),
+        ControllerTask(status=STATUS_QUEUED, created_at=now - timedelta(minutes=200)),
+    ])
+    db_session.commit()
+    sample_queue(db_session, queue_depth=7, at=now)
+    sample_queue(db_session, queue_depth=4, at=now + timedelta(seconds=10))  # same minute: overwritten
+    db_session.commit()
+    samples = load_queue_samples(db_session.connection(), now - timedelta(hours=1))
+    assert len(samples) == 1
+    row = samples.iloc[0]
+    assert (row["queue_depth"], row["waiting_tasks"], row["starved_tasks"]) == (4, 2, 1)
+    assert row["oldest_wait_seconds"] == 90 * 60 + 10
+
+    aggregate_transitions(db_session)
+    prune_rollups(db_session, now=datetime.utcnow() + timedelta(days=3))
+    db_session.commit()
+    assert load_queue_samples(db_session.connection(), now - timedelta(hours=1)).empty
+    remaining = db_session.query(TaskTransitionRollup.granularity).distinct().all()
+    assert [g for (g,) in remaining] == [DAY]
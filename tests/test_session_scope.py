@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db.db_models import Base, User
+import db.connection as connection
+from db.connection import TrackedSession, find_leaked_sessions
+
+@pytest.fixture
+def tracked_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'scope.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, class_=TrackedSession)
+    monkeypatch.setitem(connection._sessionmakers, connection.PRIMARY, factory)
+    monkeypatch.setitem(connection._sessionmakers, connection.REPLICA, factory)
+    return factory
+
+def test_session_scope_commits_and_closes(tracked_factory):
+    with connection.session_scope() as session:
+        session.add(User(username="scoped", email="scoped@email.com", password_hash="x"))
+    assert find_leaked_sessions(threshold_seconds=-1) == []
+    with connection.session_scope(read_only=True) as session:
+        user = session.query(User).filter_by(username="scoped").first()
+    assert user.email == "scoped@email.com"
+
+def test_session_scope_rolls_back_on_error(tracked_factory):
+    with pytest.raises(ValueError):
+        with connection.session_scope() as session:
+            session.add(User(username="rolled", email="rolled@email.com", password_hash="x"))
+            session.flush()
+            raise ValueError("boom")
+    with connection.session_scope(read_only=True) as session:
+        assert session.query(User).filter_by(username="rolled").first() is None
+
+def test_read_only_scope_rejects_writes(tracked_factory):
+    with pytest.raises(RuntimeError):
+        with connection.session_scope(read_only=True) as session:
+            session.add(User(username="ro", email="ro@email.com", password_hash="x"))
+            session.flush()
+
+def test_unclosed_session_is_reported(tracked_factory):
+    session = tracked_factory()
+    leaked = find_leaked_sessions(threshold_seconds=-1)
+    assert len(leaked) == 1
+    assert "test_session_scope.py" in leaked[0]["origin"]
+    session.close()
+    assert find_leaked_sessions(threshold_seconds=-1) == []
@@ -0,0 +1,99 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from db.db_models import StrategyRanking
+from db import db_models
+from db.strategy_query import (
+    fetch_strategy_page, count_strategies, load_ranked_strategies, refresh_strategy_rankings,
+    update_strategy_rankings,
+)
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.connect() as conn:
+        conn.execute(text("""
+            CREATE TABLE v_test_metrics_scored (
+                id INTEGER PRIMARY KEY, set_file_name TEXT, symbol TEXT, net_profit REAL,
+                max_drawdown REAL, total_trades INTEGER, recovery_factor REAL, weighted_score REAL,
+                normalized_total_distance_to_good REAL, win_rate REAL, profit_factor REAL,
+                expected_payoff REAL, criteria_passed INTEGER, criteria_reason TEXT, created_at TIMESTAMP
+            )
+        """))
+        rnd = random.Random(1)
+        for i in range(1, 121):
+            conn.execute(text("""
+                INSERT INTO v_test_metrics_scored VALUES
+                (:id, :name, :symbol, :profit, 10, 100, 1, :score, :dist, 50, 1.5, 2, 1, '', :created)
+            """), {
+                "id": i, "name": f"{'EA_' if i % 3 else 'Grid_'}{i}%", "symbol": f"SYM{i % 7}",
+                "profit": None if i % 11 == 0 else rnd.choice([100.0, 200.0, 300.0]),
+                "score": rnd.choice([1.0, 2.0]), "dist": rnd.choice([0.1, 0.2, 0.3]),
+                "created": datetime(2025, 1, 1) + timedelta(hours=i),
+            })
+        StrategyRanking.__table__.create(conn)
+        refresh_strategy_rankings(conn)
+        yield conn
+
+
+@pytest.mark.parametrize("sort", ["rank", "net_profit", "newest"])
+def test_keyset_pages_cover_the_full_ordering(conn, sort):
+    seen, after = [], None
+    while True:
+        page = fetch_strategy_page(conn, user_rank=5, sort=sort, page_size=7, after=after)
+        seen.extend(page.rows["metric_id"])
+        after = page.cursor
+        if after is None:
+            break
+    assert len(seen) == len(set(seen)) == count_strategies(conn, user_rank=5) == 35
+    if sort == "rank":
+        assert seen == load_ranked_strategies(conn, user_rank=5).sort_values(
+            ["normalized_total_distance_to_good", "weighted_score", "metric_id"],
+            ascending=[True, False, True], kind="stable")["metric_id"].tolist()
+
+
+def test_search_is_done_in_sql_with_literal_wildcards(conn):
+    assert count_strategies(conn, user_rank=100, search="Grid") == 40
+    assert count_strategies(conn, user_rank=100, search="rid") == 40  # contains is the default
+    assert count_strategies(conn, user_rank=100, search="rid", search_mode="prefix") == 0
+    assert count_strategies(conn, user_rank=100, search="rid", search_mode="contains") == 40
+    page = fetch_strategy_page(conn, user_rank=100, search="EA_1%", page_size=100)
+    assert set(page.rows["set_file_name"]) == {"EA_1%"}
+
+
+def test_listing_reads_the_rankings_as_of_the_last_refresh(conn):
+    profits = fetch_strategy_page(conn, user_rank=100, sort="net_profit", page_size=200).rows["net_profit"]
+    assert profits.iloc[:110].is_monotonic_decreasing and profits.iloc[110:].isna().all()
+
+    conn.execute(text("UPDATE v_test_metrics_scored SET normalized_total_distance_to_good = 0 WHERE id = 120"))
+    assert fetch_strategy_page(conn, user_rank=1, page_size=1).rows["metric_id"].tolist() != [120]
+    assert refresh_strategy_rankings(conn) == 120
+    assert fetch_strategy_page(conn, user_rank=1, page_size=1).rows["metric_id"].tolist() == [120]
+
+
+def test_rebuild_is_skipped_while_test_metrics_are_unchanged(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rank.db'}")
+    db_models.TestMetric.__table__.create(engine)
+    StrategyRanking.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE VIEW v_test_metrics_scored AS SELECT *, 1.0 AS weighted_score, "
+                          "0.5 AS normalized_total_distance_to_good FROM test_metrics"))
+        conn.execute(db_models.TestMetric.__table__.insert(), [{"symbol": "EURUSD", "set_file_name": "a.set"}])
+
+    version = update_strategy_rankings(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM strategy_rankings"))  # a rebuild would bring the row back
+    assert update_strategy_rankings(engine, version) == version
+    with engine.connect() as conn:
+        assert count_strategies(conn) == 0
+
+    with engine.begin() as conn:
+        conn.execute(db_models.TestMetric.__table__.insert(), [{"symbol": "GBPUSD", "set_file_name": "b.set"}])
+    assert update_strategy_rankings(engine, version) != version
+    with engine.connect() as conn:
+        assert count_strategies(conn) == 2
+    engine.dispose()
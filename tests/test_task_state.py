@@ -0,0 +1,51 @@
+import pytest
+from db.db_models import ControllerTask, ControllerAttempt
+from db.status_constants import (
+    STATUS_NEW, STATUS_QUEUED, STATUS_WORKER_IN_PROGRESS, STATUS_WORKER_COMPLETED,
+    STATUS_RETRYING, STATUS_FAILED, STATUS_COMPLETED_SUCCESS, TERMINAL_TASK_STATUSES,
+)
+from db.task_state import IllegalTransition, transition_task, touch_task, close_attempt
+
+def _task(db_session, status):
+    task = ControllerTask(status=status, attempt_count=0, max_attempts=3)
+    db_session.add(task)
+    db_session.commit()
+    return task
+
+def test_transition_applies_fields_in_one_update(db_session):
+    task = _task(db_session, STATUS_QUEUED)
+    assert transition_task(db_session, task.id, STATUS_WORKER_IN_PROGRESS, assigned_worker="w1")
+    db_session.commit()
+    assert task.status == STATUS_WORKER_IN_PROGRESS
+    assert task.assigned_worker == "w1"
+
+def test_transition_loses_race_without_overwriting(db_session):
+    task = _task(db_session, STATUS_QUEUED)
+    # Another process already failed the task.
+    assert transition_task(db_session, task.id, STATUS_FAILED)
+    db_session.commit()
+    assert not transition_task(db_session, task.id, STATUS_WORKER_IN_PROGRESS)
+    assert not transition_task(db_session, task.id, STATUS_RETRYING, expected_status=STATUS_QUEUED)
+    db_session.commit()
+    assert task.status == STATUS_FAILED
+
+def test_illegal_transition_is_rejected(db_session):
+    task = _task(db_session, STATUS_NEW)
+    with pytest.raises(IllegalTransition):
+        transition_task(db_session, task.id, STATUS_COMPLETED_SUCCESS, expected_status=STATUS_NEW)
+    assert STATUS_FAILED in TERMINAL_TASK_STATUSES and STATUS_COMPLETED_SUCCESS in TERMINAL_TASK_STATUSES
+
+def test_heartbeat_and_attempt_are_conditional(db_session):
+    task = _task(db_session, STATUS_WORKER_IN_PROGRESS)
+    attempt = ControllerAttempt(task_id=task.id, attempt_number=1, status=STATUS_WORKER_IN_PROGRESS)
+    db_session.add(attempt)
+    db_session.commit()
+    assert touch_task(db_session, task.id)
+    assert transition_task(db_session, task.id, STATUS_WORKER_COMPLETED)
+    assert close_attempt(db_session, attempt.id, STATUS_WORKER_COMPLETED)
+    db_session.commit()
+    assert not touch_task(db_session, task.id)
+    assert not close_attempt(db_session, attempt.id, STATUS_FAILED)
+    db_session.commit()
+    assert task.last_heartbeat is not None
+    assert attempt.status == STATUS_WORKER_COMPLETED
@@ -0,0 +1,38 @@
+import telemetry
+from db.db_models import ControllerTask
+from db.status_constants import STATUS_QUEUED, STATUS_WORKER_IN_PROGRESS, STATUS_WORKER_FAILED
+from db.task_state import transition_task
+from telemetry import LiveState, KIND_TASK, KIND_QUEUE
+
+def test_task_events_are_published_only_after_commit(db_session, monkeypatch):
+    published = []
+    monkeypatch.setattr(telemetry, "publish", lambda kind, r=None, **fields: published.append((kind, fields)))
+    task = ControllerTask(status=STATUS_QUEUED, attempt_count=0, max_attempts=3)
+    db_session.add(task)
+    db_session.commit()
+    published.clear()
+
+    assert transition_task(db_session, task.id, STATUS_WORKER_IN_PROGRESS, assigned_worker="w1")
+    db_session.rollback()
+    assert published == []
+
+    assert transition_task(db_session, task.id, STATUS_WORKER_IN_PROGRESS, assigned_worker="w1")
+    db_session.commit()
+    assert published == [(KIND_TASK, {"task": task.id, "from": STATUS_QUEUED, "to": STATUS_WORKER_IN_PROGRESS,
+                                      "worker": "w1", "error": None})]
+
+def test_live_state_folds_events():
+    events = [
+        ("1-0", {"kind": KIND_QUEUE, "depth": "5", "processing": "1", "at": "100.0"}),
+        ("2-0", {"kind": KIND_TASK, "task": "7", "from": STATUS_QUEUED, "to": STATUS_WORKER_IN_PROGRESS, "worker": "w1"}),
+        ("3-0", {"kind": KIND_TASK, "task": "8", "from": STATUS_QUEUED, "to": STATUS_WORKER_IN_PROGRESS, "worker": "w1"}),
+        ("4-0", {"kind": KIND_TASK, "task": "7", "from": STATUS_WORKER_IN_PROGRESS, "to": STATUS_WORKER_FAILED,
+                 "at": "101.0", "error": "timeout"}),
+    ]
+    live = LiveState().apply(events)
+    assert live.last_id == "4-0"
+    assert (live.queue_depth, live.processing_depth) == (5, 1)
+    assert live.workers() == {"w1": [8]}
+    assert live.transitions == 3
+    failure = live.recent_failures[0]
+    assert (failure["task_id"], failure["worker"], failure["error"]) == (7, "w1", "timeout")
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import numpy as np
+
+from db.db_models import TradeRecord, PortfolioSet
+from db import trade_records
+from db.trade_records import load_trade_arrays, load_portfolio_trades, trades_frame, clear_trade_cache
+
+
+def add_trades(session, tm_id, profits):
+    for i, p in enumerate(profits):
+        session.add(TradeRecord(test_metrics_id=tm_id, close_time=datetime(2025, 1, 1 + i), profit=p))
+    session.commit()
+
+
+def test_one_query_per_uncached_batch(db_session, monkeypatch):
+    clear_trade_cache()
+    add_trades(db_session, 1, [5.0, -2.0, None])
+    add_trades(db_session, 2, [1.0])
+    db_session.add_all([PortfolioSet(portfolio_id=9, test_metrics_id=1), PortfolioSet(portfolio_id=9, test_metrics_id=2)])
+    db_session.commit()
+
+    calls = []
+    fetch = trade_records._fetch
+    monkeypatch.setattr(trade_records, "_fetch", lambda s, ids: calls.append(list(ids)) or fetch(s, ids))
+
+    arrays = load_portfolio_trades(db_session, 9)
+    np.testing.assert_array_equal(arrays[1].profit, [5.0, -2.0])
+    assert arrays[1].close_time.dtype == np.dtype("datetime64[s]")
+    assert calls == [[1, 2]]
+
+    # Cached ids never hit the database again; a strategy without trades is retried.
+    arrays = load_trade_arrays(db_session, [2, 1, 3])
+    assert calls == [[1, 2], [3]]
+    assert len(arrays[3].profit) == 0
+
+    df = trades_frame(arrays)
+    assert sorted(df["strategy"].unique()) == [1, 2]
+    clear_trade_cache()
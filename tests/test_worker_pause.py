@@ -0,0 +1,49 @@
+import threading
+import time
+import uuid
+import pytest
+import redis
+import config
+import worker_pause
+from worker_pause import WorkerPauseClient, pause_workers
+
+@pytest.fixture
+def r(monkeypatch):
+    client = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+    try:
+        client.ping()
+    except redis.RedisError:
+        pytest.skip("Redis server not available")
+    prefix = f"test_worker_pause:{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(config, "WORKER_PAUSE_PREFIX", prefix)
+    monkeypatch.setattr(config, "PAUSE_POLL_INTERVAL", 0.05)
+    yield client
+    for key in client.scan_iter(f"{prefix}:*"):
+        client.delete(key)
+
+def test_workers_ack_and_resume(r):
+    workers = [WorkerPauseClient(r, f"w{i}") for i in range(2)]
+    for w in workers:
+        w.heartbeat()
+    results = []
+
+    def worker_loop(w):
+        while worker_pause.current_lease(r) is None:
+            time.sleep(0.01)
+        results.append(w.wait_if_paused())
+
+    threads = [threading.Thread(target=worker_loop, args=(w,)) for w in workers]
+    for t in threads:
+        t.start()
+    with pause_workers(r, timeout=5) as lease:
+        assert set(r.smembers(f"{config.WORKER_PAUSE_PREFIX}:acks:{lease}")) == {"w0", "w1"}
+    for t in threads:
+        t.join(timeout=2)
+    assert results == [True, True]
+
+def test_pause_times_out_when_a_worker_never_drains(r):
+    WorkerPauseClient(r, "busy").heartbeat()
+    with pytest.raises(TimeoutError):
+        with pause_workers(r, timeout=0.2):
+            pass
+    assert worker_pause.current_lease(r) is None
@@ -1,5 +1,5 @@
-from db_utils import get_db, get_audit_log
+from db_utils import session_scope, get_audit_log
 
 def get_audit_log_for_user(user_id=None, limit=100):
-    session = get_db()
-    return get_audit_log(session, user_id=user_id, limit=limit)
\ No newline at end of file
+    with session_scope(read_only=True) as session:
+        return get_audit_log(session, user_id=user_id, limit=limit)
\ No newline at end of file
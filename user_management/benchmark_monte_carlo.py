@@ -0,0 +1,54 @@
+"""
+Benchmark the vectorized Monte Carlo engine against the old per-trial loop.
+
+    python user_management/benchmark_monte_carlo.py [--trials 10000] [--trades 5000]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from user_management.monte_carlo import simulate
+
+
+def loop_reference(profits, n_trades, n_trials):
+    """The previous implementation: one np.random.choice + cumsum per trial, full matrix in memory."""
+    results = []
+    for _ in range(n_trials):
+        results.append(np.cumsum(np.random.choice(profits, size=n_trades, replace=True)))
+    results = np.array(results)
+    max_drawdown = np.max(np.maximum.accumulate(results, axis=1) - results, axis=1)
+    return float(np.median(max_drawdown))
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<28} {time.perf_counter() - started:8.2f}s")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trials', type=int, default=10_000)
+    parser.add_argument('--trades', type=int, default=5_000)
+    parser.add_argument('--block_size', type=int, default=20)
+    parser.add_argument('--skip_loop', action='store_true', help='Skip the (slow, memory-hungry) loop reference')
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    profits = np.where(rng.random(args.trades) < 0.55, rng.normal(12, 4, args.trades), rng.normal(-10, 3, args.trades))
+    print(f"{args.trials} trials x {args.trades} trades")
+
+    if not args.skip_loop:
+        timed("loop (reference)", lambda: loop_reference(profits, args.trades, args.trials))
+    res = timed("vectorized i.i.d.", lambda: simulate(profits, args.trades, args.trials, seed=1))
+    timed(f"vectorized block={args.block_size}", lambda: simulate(profits, args.trades, args.trials, block_size=args.block_size, seed=1))
+    print(f"median max drawdown {res['max_drawdown']:.2f}, ruin probability {res['ruin_prob']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
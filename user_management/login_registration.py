@@ -7,7 +7,7 @@ from datetime import datetime
 # --- Import backend logic ---
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from db_utils import get_db, create_user, fetch_user_by_username
+from db_utils import session_scope, create_user, fetch_user_by_username
 from db.db_models import User
 import config
 from session_manager import create_session, delete_session, get_session, is_authenticated, sync_streamlit_session
@@ -26,8 +26,8 @@ with tab_login:
     login_submit = login_form.form_submit_button("Login")
 
     if login_submit:
-        db_session = get_db()
-        user = fetch_user_by_username(db_session, username)
+        with session_scope(read_only=True) as db_session:
+            user = fetch_user_by_username(db_session, username)
         if not user:
             st.error("User not found")
         elif user.status != "Approved":
@@ -63,21 +63,22 @@ with tab_register:
     reg_submit = reg_form.form_submit_button("Register")
 
     if reg_submit:
-        db_session = get_db()
-        if fetch_user_by_username(db_session, reg_username):
-            st.error("Username already exists")
-        else:
-            password_hash = User.hash_password(reg_password)
-            user_id = create_user(db_session, reg_username, reg_email, password_hash, reg_api_key)
-            if user_id:
-                st.success("Registration submitted! Please await admin approval.")
+        with session_scope() as db_session:
+            if fetch_user_by_username(db_session, reg_username):
+                st.error("Username already exists")
             else:
-                st.error("Registration failed.")
+                password_hash = User.hash_password(reg_password)
+                user_id = create_user(db_session, reg_username, reg_email, password_hash, reg_api_key)
+                if user_id:
+                    st.success("Registration submitted! Please await admin approval.")
+                else:
+                    st.error("Registration failed.")
 
 # --- Show session info if logged in ---
 if is_authenticated(st.session_state):
     sync_streamlit_session(st.session_state, st.session_state["username"])
-    user = fetch_user_by_username(get_db(), st.session_state["username"])
+    with session_scope(read_only=True) as db_session:
+        user = fetch_user_by_username(db_session, st.session_state["username"])
     if user:
         st.info(f"Logged in as: {user.username} | Role: {user.role} | Status: {user.status}")
         logout_btn = st.button("Logout")
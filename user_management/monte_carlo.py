@@ -0,0 +1,106 @@
+"""
+Vectorized Monte Carlo simulation of trade sequences.
+
+Trials are drawn with a seeded np.random.Generator, a (trials x steps) block at
+a time, and never held in full: each chunk updates running per-trial state
+(equity, peak, max drawdown, min equity), so memory is bounded by
+max_cells regardless of n_trials x n_trades.
+
+Metrics keep the definitions of the loops this replaced: the drawdown is
+measured from the running peak of the cumulative P&L path (the path starts at
+its first trade, not at a 0 peak), and a trial is ruined when its path falls
+strictly below ruin_level.
+
+Sampling is either
+  - i.i.d. bootstrap of the observed trade profits (block_size=1),
+  - circular block bootstrap (block_size>1), which keeps streaks and
+    volatility clusters inside each block, or
+  - parametric: `outcomes` drawn with probabilities `probs`.
+
+Benchmark: python user_management/benchmark_monte_carlo.py
+"""
+import numpy as np
+
+DEFAULT_RUIN_LEVEL = -1000.0
+DEFAULT_MAX_CELLS = 2_000_000  # float64 cells per chunk (~16 MB)
+
+
+def _chunk_sizes(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def simulate(profits, n_trades=None, n_trials=5000, block_size=1, probs=None, seed=None,
+             ruin_level=DEFAULT_RUIN_LEVEL, max_cells=DEFAULT_MAX_CELLS):
+    """
+    Simulate n_trials equity paths of n_trades trades each (default: as many
+    as observed) resampled from `profits`.
+
+    Returns a dict:
+      max_drawdown          median of the per-trial max drawdown
+      ruin_prob             share of trials whose equity fell below ruin_level
+      return_distribution   final P&L per trial (ndarray)
+      drawdown_distribution max drawdown per trial (ndarray)
+      min_equity            lowest point of each trial's path (ndarray)
+    """
+    values = np.asarray(profits, dtype=np.float64)
+    if values.size == 0:
+        raise ValueError("No profits to simulate from")
+    n_trades = int(n_trades or values.size)
+    block_size = max(1, int(block_size))
+    if probs is not None:
+        if block_size > 1:
+            raise ValueError("Block bootstrap needs observed trades, not outcome probabilities")
+        probs = np.asarray(probs, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+
+    # Columns per chunk are a whole number of blocks; rows fill the rest of the budget.
+    step_chunk = max(block_size, min(n_trades, max_cells) // block_size * block_size)
+    trial_chunk = max(1, min(n_trials, max_cells // step_chunk))
+
+    final = np.empty(n_trials)
+    max_dd = np.empty(n_trials)
+    min_eq = np.empty(n_trials)
+    for t0, rows in _chunk_sizes(n_trials, trial_chunk):
+        equity = np.zeros(rows)
+        peak = np.full(rows, -np.inf)
+        dd = np.zeros(rows)
+        low = np.full(rows, np.inf)
+        for _, cols in _chunk_sizes(n_trades, step_chunk):
+            if probs is not None:
+                draws = values[rng.choice(values.size, size=(rows, cols), p=probs)]
+            elif block_size == 1:
+                draws = values[rng.integers(0, values.size, size=(rows, cols))]
+            else:
+                n_blocks = -(-cols // block_size)
+                starts = rng.integers(0, values.size, size=(rows, n_blocks, 1))
+                idx = (starts + np.arange(block_size)) % values.size
+                draws = values[idx.reshape(rows, -1)[:, :cols]]
+            path = np.cumsum(draws, axis=1)
+            path += equity[:, None]
+            running_peak = np.maximum.accumulate(path, axis=1)
+            np.maximum(running_peak, peak[:, None], out=running_peak)
+            dd = np.maximum(dd, (running_peak - path).max(axis=1))
+            low = np.minimum(low, path.min(axis=1))
+            peak = running_peak[:, -1]
+            equity = path[:, -1]
+        final[t0:t0 + rows] = equity
+        max_dd[t0:t0 + rows] = dd
+        min_eq[t0:t0 + rows] = low
+
+    return {
+        "max_drawdown": float(np.median(max_dd)),
+        "ruin_prob": float(np.mean(min_eq < ruin_level)),
+        "return_distribution": final,
+        "drawdown_distribution": max_dd,
+        "min_equity": min_eq,
+    }
+
+
+def simulate_win_loss(win_rate, avg_win, avg_loss, n_trades=1000, n_trials=5000, seed=None,
+                      ruin_level=DEFAULT_RUIN_LEVEL):
+    """Parametric two-outcome simulation (fixed average win / loss)."""
+    return simulate(
+        [avg_win, -abs(avg_loss)], n_trades=n_trades, n_trials=n_trials,
+        probs=[win_rate, 1 - win_rate], seed=seed, ruin_level=ruin_level,
+    )
@@ -0,0 +1,124 @@
+"""
+Portfolio-level Monte Carlo across strategies.
+
+Per-strategy simulations treat strategies as independent, but strategies on
+correlated pairs win and lose on the same days. Here every strategy's trades
+are bucketed into daily P&L on one shared calendar (by trade close time), and
+whole days are resampled jointly, so a simulated day carries every
+strategy's P&L from the same historical day and their co-movement survives.
+Runs of days are kept with a block bootstrap (block_size days).
+
+Trials are split across a process pool (each chunk with its own spawned seed)
+and the per-trial distributions are packed with np.savez_compressed for
+PositionSizingResult.simulation_blob.
+"""
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from user_management.monte_carlo import simulate, DEFAULT_RUIN_LEVEL
+
+METHOD = "portfolio_monte_carlo"
+# Below this many trials the pool start-up costs more than it saves.
+MIN_TRIALS_PER_PROCESS = 2000
+
+
+def daily_pnl_grid(trades):
+    """
+    Daily P&L grid from a DataFrame with columns strategy, close_time (or
+    day) and profit. Returns (days, strategies, grid[days, strategies]);
+    days without trades are zero.
+    """
+    df = trades.dropna(subset=["profit"])
+    if df.empty:
+        return pd.DatetimeIndex([]), [], np.zeros((0, 0))
+    day = pd.to_datetime(df["day"] if "day" in df.columns else df["close_time"]).dt.normalize()
+    table = df.assign(day=day).pivot_table(index="day", columns="strategy", values="profit", aggfunc="sum", fill_value=0.0)
+    days = pd.date_range(table.index.min(), table.index.max(), freq="D")
+    table = table.reindex(days, fill_value=0.0)
+    return days, list(table.columns), table.to_numpy(dtype=np.float64)
+
+
+def _simulate_chunk(portfolio_pnl, n_days, n_trials, block_size, seed, ruin_level):
+    return simulate(portfolio_pnl, n_trades=n_days, n_trials=n_trials, block_size=block_size,
+                    seed=seed, ruin_level=ruin_level)
+
+
+def simulate_portfolio(grid, weights=None, n_days=None, n_trials=5000, block_size=5, seed=None,
+                       ruin_level=DEFAULT_RUIN_LEVEL, max_workers=None):
+    """
+    Jointly resample the days of `grid` (days x strategies, scaled per strategy
+    by `weights`) into n_trials paths of n_days days.
+
+    Returns the monte_carlo.simulate dict for the portfolio P&L plus
+    `strategy_correlation`, the realized correlation of the strategies'
+    daily P&L.
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    if grid.size == 0:
+        raise ValueError("No daily P&L to simulate from")
+    weights = np.ones(grid.shape[1]) if weights is None else np.asarray(weights, dtype=np.float64)
+    # Resampling whole days jointly == resampling the weighted daily portfolio P&L.
+    portfolio_pnl = grid @ weights
+    n_days = int(n_days or len(portfolio_pnl))
+
+    max_workers = max_workers or os.cpu_count() or 1
+    n_chunks = max(1, min(max_workers, n_trials // MIN_TRIALS_PER_PROCESS))
+    sizes = [n_trials // n_chunks + (1 if i < n_trials % n_chunks else 0) for i in range(n_chunks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    args = [(portfolio_pnl, n_days, size, block_size, s, ruin_level) for size, s in zip(sizes, seeds)]
+    if n_chunks == 1:
+        parts = [_simulate_chunk(*args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=n_chunks) as pool:
+            parts = list(pool.map(_simulate_chunk, *zip(*args)))
+
+    keys = ("return_distribution", "drawdown_distribution", "min_equity")
+    result = {k: np.concatenate([p[k] for p in parts]) for k in keys}
+    result["max_drawdown"] = float(np.median(result["drawdown_distribution"]))
+    result["ruin_prob"] = float(np.mean(result["min_equity"] < ruin_level))
+    if grid.shape[1] > 1:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result["strategy_correlation"] = np.corrcoef(grid.T)
+    else:
+        result["strategy_correlation"] = np.ones((1, 1))
+    return result
+
+
+def summarize(result, strategies):
+    """JSON-friendly summary for PositionSizingResult.result_summary_json."""
+    final = result["return_distribution"]
+    dd = result["drawdown_distribution"]
+    pct = [5, 25, 50, 75, 95]
+    return {
+        "trials": int(len(final)),
+        "strategies": [str(s) for s in strategies],
+        "median_max_drawdown": result["max_drawdown"],
+        "ruin_prob": result["ruin_prob"],
+        "final_pnl_percentiles": dict(zip(map(str, pct), np.percentile(final, pct).round(2).tolist())),
+        "max_drawdown_percentiles": dict(zip(map(str, pct), np.percentile(dd, pct).round(2).tolist())),
+    }
+
+
+def pack_simulation(result, strategies):
+    """Compact binary form (compressed npz, float32 distributions) for simulation_blob."""
+    buf = io.BytesIO()
+    np.savez_compressed(
+        buf,
+        strategies=np.array([str(s) for s in strategies]),
+        return_distribution=result["return_distribution"].astype(np.float32),
+        drawdown_distribution=result["drawdown_distribution"].astype(np.float32),
+        min_equity=result["min_equity"].astype(np.float32),
+        strategy_correlation=np.asarray(result["strategy_correlation"], dtype=np.float32),
+    )
+    return buf.getvalue()
+
+
+def unpack_simulation(blob):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        return {k: data[k] for k in data.files}
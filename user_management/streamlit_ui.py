@@ -3,7 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import streamlit as st
 from db.db_models import User
-from db_utils import get_db, create_user, fetch_user_by_username
+from db_utils import session_scope, create_user, fetch_user_by_username
 from user_management.auth import login, logout, get_active_sessions
 from user_management.admin import approve_user, deny_user, change_role
 from user_management.audit import get_audit_log_for_user
@@ -17,30 +17,30 @@ def registration_page():
     open_router_api_key = st.text_input("OpenRouter API Key", type="password")
 
     if st.button("Register"):
-        session = get_db()
-        if fetch_user_by_username(session, username):
-            st.error("Username already exists.")
-        else:
-            password_hash = User.hash_password(password)
-            user_id = create_user(
-                session,
-                username,
-                email,
-                password_hash,
-                open_router_api_key=open_router_api_key
-            )
-            st.success("Registration complete! Awaiting admin approval.")
+        with session_scope() as session:
+            if fetch_user_by_username(session, username):
+                st.error("Username already exists.")
+            else:
+                password_hash = User.hash_password(password)
+                user_id = create_user(
+                    session,
+                    username,
+                    email,
+                    password_hash,
+                    open_router_api_key=open_router_api_key
+                )
+                st.success("Registration complete! Awaiting admin approval.")
 
 def login_page():
     st.title("User Login")
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     if st.button("Login"):
-        session = get_db()
-        session_token, error = login(session, username, password)
+        with session_scope(read_only=True) as session:
+            session_token, error = login(session, username, password)
+            user = fetch_user_by_username(session, username) if session_token else None
         if session_token:
             # Use unified session management
-            user = fetch_user_by_username(session, username)
             session_data = {
                 "username": user.username,
                 "user_role": user.role,
@@ -58,8 +58,8 @@ def login_page():
 
 def admin_approval_page(admin_id):
     st.title("Admin User Approval")
-    session = get_db()
-    pending_users = session.query(User).filter_by(status='Pending').all()
+    with session_scope(read_only=True) as session:
+        pending_users = session.query(User).filter_by(status='Pending').all()
     for user in pending_users:
         st.write(f"{user.username} ({user.email})")
         if st.button(f"Approve {user.username}"):
@@ -71,7 +71,6 @@ def admin_approval_page(admin_id):
 
 def audit_log_page():
     st.title("Audit Log")
-    session = get_db()
     logs = get_audit_log_for_user()
     for log in logs:
         st.write(log)
@@ -4,12 +4,8 @@ import os
 import base64
 import re
 
-from sqlalchemy.orm import sessionmaker
-from config import (
-    AGENT_DB_PATH,
-    MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE
-)
-from sqlalchemy import create_engine, text
+from config import AGENT_DB_PATH
+from db.connection import get_sessionmaker
 from contextlib import contextmanager
 
 encoded_key = os.getenv("SQLCIPHER_KEY")
@@ -21,11 +17,7 @@ sqlcipher_key = base64.b64decode(encoded_key).decode()
 # Utility: SQLAlchemy session context for controller DB (used ONLY for linking step, not main inserts)
 @contextmanager
 def controller_db_session():
-    engine = create_engine(
-        f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT or 3306}/{MYSQL_DATABASE}?charset=utf8mb4"
-    )
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    session = get_sessionmaker()()
     try:
         yield session
         session.commit()
@@ -34,7 +26,6 @@ def controller_db_session():
         raise
     finally:
         session.close()
-        engine.dispose()
 
 def sync_setfile_parameters(ctrl_conn, controller_task_id):
     """
@@ -9,42 +9,34 @@ import threading
 import tempfile
 from datetime import datetime
 import traceback
-import pymysql
 from config import (
-    MYSQL_HOST, MYSQL_PORT, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE,
     REDIS_HOST, REDIS_PORT, REDIS_MAIN_QUEUE, WORKER_ID,
     UIPATH_CLI, UIPATH_WORKFLOW, UIPATH_JOB_MAX_SECONDS, UIPATH_KILL_FILE, UIPATH_MT4_LIB, UIPATH_CONFIG,
-    OUTPUT_JSON_DIR, OUTPUT_JSON_POLL_INTERVAL, OUTPUT_JSON_WARNING_MODULUS,
-    LOCK_DIR, TICKDATA_LOCK_FILE, WORKER_PAUSED_LOCK_FILE)
+    OUTPUT_JSON_DIR, OUTPUT_JSON_POLL_INTERVAL, OUTPUT_JSON_WARNING_MODULUS)
 from db.status_constants import (
     STATUS_WORKER_IN_PROGRESS,
     STATUS_WORKER_COMPLETED,
     STATUS_WORKER_FAILED,
 )
+from db.connection import raw_connection, get_engine
+from db.rollups import ensure_rollup_tables
+from db.job_summary import ensure_job_summaries
+from db.strategy_query import ensure_strategy_rankings
 from db_utils import (
-    update_task_status, create_attempt, finish_attempt, get_db,
-    update_task_worker_job, update_task_heartbeat
+    update_task_status, create_attempt, finish_worker_task, get_db,
+    update_task_heartbeat
 )
 from .db_sync import sync_test_metrics, sync_trade_records, sync_artifacts, sync_ai_suggestions
 from notify import send_email, send_telegram
+from worker_pause import WorkerPauseClient, get_redis
+from telemetry import publish_queue_depth
+from artifact_previews import schedule_previews
+from query_cache import invalidate as invalidate_cache, TAG_METRICS, TAG_ARTIFACTS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
-def wait_if_batch_lock():
-    if os.path.exists(TICKDATA_LOCK_FILE):
-        # Acknowledge pause
-        open(WORKER_PAUSED_LOCK_FILE, 'w').close()
-        print("[Worker] Batch lock detected. Worker is paused.")
-        # Wait until batch releases the lock
-        while os.path.exists(TICKDATA_LOCK_FILE):
-            time.sleep(2)
-        # Remove paused lock and resume
-        if os.path.exists(WORKER_PAUSED_LOCK_FILE):
-            os.remove(WORKER_PAUSED_LOCK_FILE)
-        print("[Worker] Batch lock cleared. Worker resumes.")
-
 def notify_kill(task_id, reason, extra=None):
     subject = f"[Worker Kill] Task {task_id} killed due to {reason}"
     body = f"Task {task_id} killed.\nReason: {reason}\n"
@@ -57,9 +49,16 @@ def notify_kill(task_id, reason, extra=None):
 def main():
     r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=False)
     HEARTBEAT_INTERVAL = 300  # seconds (5 min)
+    engine = get_engine()
+    ensure_rollup_tables(engine)  # task status changes log into them
+    ensure_job_summaries(engine, backfill=False)  # kept current on every task commit
+    ensure_strategy_rankings(engine)  # read by the dashboards, filled by the supervisor
+    # Liveness + batch pause acknowledgements (drains after the current task)
+    pause_client = WorkerPauseClient(get_redis(), WORKER_ID)
+    pause_client.start_heartbeat()
 
     while True:
-        wait_if_batch_lock()
+        pause_client.wait_if_paused()
         try:
             logger.debug(f"Waiting for task from Redis main queue: {REDIS_MAIN_QUEUE}")
             # removed processing queue
@@ -108,10 +107,12 @@ def main():
 
             with get_db() as session:
                 logger.debug(f"Updating task {task_id} status to worker_in_progress with worker {WORKER_ID}")
-                update_task_status(session, task_id, STATUS_WORKER_IN_PROGRESS, assigned_worker=WORKER_ID)
-                update_task_heartbeat(session, task_id)
+                if not update_task_status(session, task_id, STATUS_WORKER_IN_PROGRESS, assigned_worker=WORKER_ID):
+                    logging.warning(f"Task {task_id} is no longer queued; skipping stale queue entry.")
+                    continue
                 attempt_id = create_attempt(session, task_id, status=STATUS_WORKER_IN_PROGRESS)
                 logger.debug(f"Created attempt {attempt_id} for task {task_id}")
+            publish_queue_depth(r)
 
             try:
                 start_time = time.time()
@@ -297,43 +298,36 @@ def main():
                 try:
                     logger.debug(f"Syncing DB for worker_job_id={out_worker_JobId}")
 
-                    ctrl_conn = pymysql.connect(
-                        host=MYSQL_HOST,
-                        user=MYSQL_USER,
-                        password=MYSQL_PASSWORD,
-                        database=MYSQL_DATABASE,
-                        port=MYSQL_PORT,
-                        charset='utf8mb4',
-                        autocommit=False
-                    )
-
-                    try:
-                        sync_test_metrics(out_worker_JobId, ctrl_conn)
-                        # sync_trade_records(out_worker_job_id, ctrl_conn)  # If needed
-                        sync_artifacts(out_worker_JobId, ctrl_conn)
-                        sync_ai_suggestions(out_worker_JobId, ctrl_conn)
-                        ctrl_conn.commit()
-                        logging.info(f"Synchronized all databases for worker_job_id={out_worker_JobId}")
-                    except Exception as sync_err:
-                        ctrl_conn.rollback()
-                        logging.error(f"Error during DB sync for worker_job_id={out_worker_JobId}: {sync_err}")
-                    finally:
-                        ctrl_conn.close()
+                    # Raw DBAPI connection checked out from the shared pool (returned on exit)
+                    with raw_connection() as ctrl_conn:
+                        try:
+                            sync_test_metrics(out_worker_JobId, ctrl_conn)
+                            # sync_trade_records(out_worker_job_id, ctrl_conn)  # If needed
+                            sync_artifacts(out_worker_JobId, ctrl_conn)
+                            sync_ai_suggestions(out_worker_JobId, ctrl_conn)
+                            ctrl_conn.commit()
+                            invalidate_cache(TAG_METRICS, TAG_ARTIFACTS)
+                            schedule_previews(task_id)
+                            logging.info(f"Synchronized all databases for worker_job_id={out_worker_JobId}")
+                        except Exception as sync_err:
+                            ctrl_conn.rollback()
+                            logging.error(f"Error during DB sync for worker_job_id={out_worker_JobId}: {sync_err}")
 
                 except Exception as e:
                     logging.error(f"Error setting up DB sync connection for worker_job_id={out_worker_JobId}: {e}")
 
-            #Update task and attempt status in main DB after sync
+            #Update task and attempt status in main DB after sync (one statement per row, one commit)
+            worker_job_id = None
+            if out_worker_JobId:
+                try:
+                    worker_job_id = int(out_worker_JobId)
+                except (TypeError, ValueError) as e:
+                    logging.warning(f"Invalid worker_job_id {out_worker_JobId!r} for task {task_id}: {e}")
             with get_db() as session:
-                update_task_status(session, task_id, status)
-                update_task_heartbeat(session, task_id)
-                finish_attempt(session, attempt_id, status, error_message, result_json_blob)
-                if out_worker_JobId:
-                    try:
-                        update_task_worker_job(session, task_id, int(out_worker_JobId))
-                        logging.info(f"Updated worker_job_id={out_worker_JobId} for controller task {task_id}")
-                    except Exception as e:
-                        logging.warning(f"Failed to update worker_job_id for task {task_id}: {e}")
+                if finish_worker_task(session, task_id, attempt_id, status, error_message, result_json_blob, worker_job_id):
+                    logging.info(f"Task {task_id} finalized as {status} (worker_job_id={worker_job_id})")
+                else:
+                    logging.warning(f"Task {task_id} left worker_in_progress before finalization; result recorded on attempt {attempt_id} only.")
 
             # --- worker will not remove input blob key from Redis, but use rpop to remove task from beginning ---
             # if input_blob_key:
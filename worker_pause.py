@@ -0,0 +1,159 @@
+"""
+Redis-backed pause/drain protocol between the batch jobs and the worker fleet.
+
+Keys (prefix WORKER_PAUSE_PREFIX):
+  {prefix}:alive          sorted set, worker_id -> last liveness timestamp
+  {prefix}:lease          current pause lease id, with a TTL (renewed by the holder)
+  {prefix}:acks:{lease}   set of worker_ids that have drained and paused for that lease
+
+Batch side (pause_workers): take the lease, then wait until every worker seen
+alive within WORKER_ALIVE_TTL_SECONDS has acknowledged, renewing the lease in
+the background. Leaving the block deletes the lease and workers resume on their
+next poll. If the batch dies, the lease expires and workers resume on their own.
+
+Worker side (WorkerPauseClient): publish liveness from a background thread and
+call wait_if_paused() between tasks, so a pause drains the fleet after each
+worker's current task.
+"""
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+import redis
+
+import config
+
+# Renew / release the lease only if we still hold it.
+_RENEW_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _key(*parts):
+    return ":".join((config.WORKER_PAUSE_PREFIX,) + parts)
+
+
+def get_redis():
+    return redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True)
+
+
+def active_workers(r, now=None):
+    """Workers that reported liveness within WORKER_ALIVE_TTL_SECONDS."""
+    now = now or time.time()
+    return set(r.zrangebyscore(_key("alive"), now - config.WORKER_ALIVE_TTL_SECONDS, "+inf"))
+
+
+def current_lease(r):
+    return r.get(_key("lease"))
+
+
+class WorkerPauseClient:
+    """Worker-side half of the protocol."""
+
+    def __init__(self, r, worker_id):
+        self.r = r
+        self.worker_id = worker_id
+        self._stop = threading.Event()
+        self._thread = None
+
+    def heartbeat(self):
+        self.r.zadd(_key("alive"), {self.worker_id: time.time()})
+
+    def start_heartbeat(self, interval=None):
+        """Publish liveness every `interval` seconds from a daemon thread (also during long tasks)."""
+        interval = interval or max(1.0, config.WORKER_ALIVE_TTL_SECONDS / 4)
+
+        def beat():
+            while not self._stop.is_set():
+                try:
+                    self.heartbeat()
+                except redis.RedisError as e:
+                    logging.warning(f"[worker_pause] Liveness update failed: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=beat, name="worker-pause-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the heartbeat and leave the fleet so pauses stop waiting for this worker."""
+        self._stop.set()
+        self.r.zrem(_key("alive"), self.worker_id)
+
+    def wait_if_paused(self):
+        """
+        Call between tasks. If a pause lease is active, acknowledge it and block
+        until it is released (or expires). Returns True if the worker paused.
+        """
+        lease = current_lease(self.r)
+        if not lease:
+            return False
+        logging.info(f"[worker_pause] Pause lease {lease} active; worker {self.worker_id} paused.")
+        while lease:
+            ack_key = _key("acks", lease)
+            pipe = self.r.pipeline()
+            pipe.sadd(ack_key, self.worker_id)
+            pipe.expire(ack_key, config.PAUSE_LEASE_TTL_SECONDS)
+            pipe.execute()
+            self.heartbeat()
+            time.sleep(config.PAUSE_POLL_INTERVAL)
+            lease = current_lease(self.r)
+        logging.info(f"[worker_pause] Pause released; worker {self.worker_id} resumes.")
+        return True
+
+
+@contextmanager
+def pause_workers(r=None, timeout=None, holder="batch"):
+    """
+    Pause the fleet for the duration of the block: take the lease, wait until
+    all active workers have acknowledged (drained), yield, then release.
+    Raises TimeoutError if workers do not drain within `timeout` seconds.
+    """
+    r = r or get_redis()
+    timeout = config.LOCK_WAIT_TIMEOUT_SECONDS if timeout is None else timeout
+    ttl = config.PAUSE_LEASE_TTL_SECONDS
+    lease = f"{holder}:{uuid.uuid4().hex[:12]}"
+    deadline = time.time() + timeout
+
+    while not r.set(_key("lease"), lease, nx=True, ex=ttl):
+        if time.time() > deadline:
+            raise TimeoutError(f"Pause lease held by {current_lease(r)}")
+        time.sleep(config.PAUSE_POLL_INTERVAL)
+
+    renew = r.register_script(_RENEW_LUA)
+    stop = threading.Event()
+
+    def keep_alive():
+        while not stop.wait(ttl / 3):
+            try:
+                renew(keys=[_key("lease")], args=[lease, ttl])
+            except redis.RedisError as e:
+                logging.warning(f"[worker_pause] Lease renewal failed: {e}")
+
+    renewer = threading.Thread(target=keep_alive, name="worker-pause-lease", daemon=True)
+    renewer.start()
+    try:
+        while True:
+            pending = active_workers(r) - set(r.smembers(_key("acks", lease)))
+            if not pending:
+                break
+            if time.time() > deadline:
+                raise TimeoutError(f"Workers did not pause in time: {sorted(pending)}")
+            time.sleep(config.PAUSE_POLL_INTERVAL)
+        logging.info(f"[worker_pause] All active workers paused under lease {lease}.")
+        yield lease
+    finally:
+        stop.set()
+        r.register_script(_RELEASE_LUA)(keys=[_key("lease")], args=[lease])
+        r.delete(_key("acks", lease))
+        logging.info(f"[worker_pause] Lease {lease} released.")